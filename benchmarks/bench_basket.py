@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Basket latency before (full-history pandas sort + groupby tail) and after
+(latest_price lookup) on a synthetic database.
+
+    python benchmarks/bench_basket.py --rows 10000000
+"""
+from __future__ import annotations
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parents[1] / "src"
+sys.path.insert(0, str(SRC))
+
+import pandas as pd  # noqa: E402
+import db  # noqa: E402
+from latest_price import basket_by_city  # noqa: E402
+
+ITEMS = ["Milk", "Bread", "Eggs", "Rice", "Apples", "Sugar", "Coffee", "Butter"]
+BASKET = ["Milk", "Bread", "Eggs"]
+
+def build(path: Path, rows: int, stores: int, cities: int) -> None:
+    con = db.open_connection(path)
+    db.migrate(con)
+    con.executemany("INSERT INTO item(name, name_key, unit) VALUES(?, ?, 'unit')", [(x, db.item_key(x)) for x in ITEMS])
+    con.executemany("INSERT INTO store(name, city) VALUES(?, ?)",
+                    [(f"Store {i}", f"City {i % cities}") for i in range(stores)])
+    con.execute("""
+        WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < ?)
+        INSERT INTO price(item_id, store_id, price, currency, quantity, date)
+        SELECT 1 + abs(random()) % ?, 1 + abs(random()) % ?, 0.5 + (abs(random()) % 500) / 100.0, 'EUR', 1,
+               date('2020-01-01', '+' || (abs(random()) % 2000) || ' days')
+        FROM seq
+    """, (rows, len(ITEMS), stores))
+    con.commit()
+    con.close()
+
+def basket_before(con) -> pd.Series:
+    """The pre-latest_price implementation from the Streamlit Basket tab."""
+    qmarks = ",".join("?" * len(BASKET))
+    df = pd.read_sql_query(f"""
+        SELECT i.name AS item, s.city AS city, p.price AS price, p.quantity AS quantity, p.date AS date
+        FROM price p LEFT JOIN item i ON i.id = p.item_id LEFT JOIN store s ON s.id = p.store_id
+        WHERE lower(i.name) IN ({qmarks})
+    """, con, params=tuple(x.lower() for x in BASKET))
+    latest = (df.assign(date=pd.to_datetime(df["date"], errors="coerce"))
+                .sort_values("date")
+                .assign(unit_price=lambda d: d["price"] / d["quantity"].replace(0, pd.NA))
+                .groupby(["city", "item"]).tail(1))
+    return latest.groupby("city")["unit_price"].sum().sort_values(ascending=False)
+
+def basket_after(con) -> pd.Series:
+    return pd.Series({r["city"]: r["total"] for r in basket_by_city(con, BASKET)})
+
+def timed(fn, con, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(con)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Benchmark basket comparison before/after latest_price.")
+    ap.add_argument("--rows", type=int, default=10_000_000)
+    ap.add_argument("--stores", type=int, default=500)
+    ap.add_argument("--cities", type=int, default=25)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--db", help="Reuse / keep the fixture database at this path")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(args.db) if args.db else Path(tmp) / "basket.db"
+        if not path.exists():
+            t0 = time.perf_counter()
+            build(path, args.rows, args.stores, args.cities)
+            print(f"fixture: {args.rows:,} prices in {time.perf_counter() - t0:.1f}s")
+        con = db.open_connection(path)
+        before, after = timed(basket_before, con, args.repeat), timed(basket_after, con, args.repeat)
+        print(f"before: {before * 1000:,.1f} ms   after: {after * 1000:,.2f} ms   ({before / after:,.0f}x)")
+
+if __name__ == "__main__":
+    main()
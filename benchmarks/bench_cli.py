@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Cold start of the price_tracker.py subcommands: each is run as a fresh process, and the
+median time above a bare `python -c pass` (interpreter and site start-up, which no script
+can avoid) is checked against a budget for the light commands. Then compares a collector
+that starts add-price once per observation with one `add-price --stdin` batch.
+
+    python benchmarks/bench_cli.py --rows 1000000 --budget-ms 75
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parents[1] / "src"
+sys.path.insert(0, str(SRC))
+
+CLI = [sys.executable, str(SRC / "price_tracker.py")]
+LIGHT = {  # held to --budget-ms
+    "--help": ["--help"],
+    "add-item": ["add-item", "--name", "Bench Item"],
+    "add-store": ["add-store", "--name", "Bench Store", "--city", "Lisbon"],
+    "list prices (csv)": ["list", "prices", "--format", "csv"],
+    "list prices (table)": ["list", "prices"],
+}
+OTHER = {
+    "add-price": ["add-price", "--item", "Milk", "--price", "1.29", "--store-id", "1"],
+}
+
+def run(cmd: list[str], env: dict, stdin: str | None = None) -> float:
+    t0 = time.perf_counter()
+    subprocess.run(cmd, input=stdin, text=True, env=env, check=True, stdout=subprocess.DEVNULL,
+                   stderr=subprocess.DEVNULL)
+    return (time.perf_counter() - t0) * 1000
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Benchmark CLI cold start and batch add-price.")
+    ap.add_argument("--rows", type=int, default=200_000, help="Prices in the fixture database")
+    ap.add_argument("--repeat", type=int, default=9, help="Runs per command (the median is reported)")
+    ap.add_argument("--budget-ms", type=float, default=75.0,
+                    help="Allowed start-up above a bare interpreter for the light commands")
+    ap.add_argument("--observations", type=int, default=100, help="Observations the collector submits")
+    args = ap.parse_args()
+
+    from generate_data import Model, write_sqlite
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "cli.db"
+        write_sqlite(Model(n_items=20, n_cities=10, stores_per_city=5, start=date(2024, 1, 1), days=730, seed=1),
+                     args.rows, path)
+        env = {**os.environ, "PRICE_TRACKER_DB": str(path)}
+        run(CLI + ["init"], env)  # migrate and bring the rollups up to date once
+
+        bare = statistics.median(run([sys.executable, "-c", "pass"], env) for _ in range(args.repeat))
+        print(f"bare interpreter: {bare:.0f} ms (subtracted below)\n")
+        print(f"{'command':<22} {'ms':>6}  budget")
+        over = []
+        for name, cmd in {**LIGHT, **OTHER}.items():
+            ms = statistics.median(run(CLI + cmd, env) for _ in range(args.repeat)) - bare
+            ok = "" if name not in LIGHT else "ok" if ms <= args.budget_ms else "OVER"
+            if ok == "OVER":
+                over.append(name)
+            print(f"{name:<22} {ms:>6.0f}  {ok}")
+
+        obs = [{"item": "Milk", "price": round(1.0 + i / 1000, 3), "store_id": 1 + i % 5, "date": "2025-06-01"}
+               for i in range(args.observations)]
+        per_process = sum(run(CLI + ["add-price", "--item", o["item"], "--price", str(o["price"]),
+                                     "--store-id", str(o["store_id"]), "--date", o["date"]], env) for o in obs)
+        batch = run(CLI + ["add-price", "--stdin"], env, "".join(json.dumps(o) + "\n" for o in obs))
+        print(f"\n{args.observations} observations: one process each {per_process:,.0f} ms, "
+              f"one --stdin batch {batch:,.0f} ms ({per_process / batch:.0f}x)")
+    if over:
+        raise SystemExit(f"❌ Over the {args.budget_ms:g} ms start-up budget: {', '.join(over)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Forecast fitting: one least-squares solve per series in a Python loop (before) vs
+every series in one batched NumPy call (after), plus the cost of a refresh when
+the stored models are still valid.
+
+    python benchmarks/bench_forecast.py --series 5000 --periods 156
+"""
+from __future__ import annotations
+import argparse
+import sys
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parents[1] / "src"
+sys.path.insert(0, str(SRC))
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+import forecast  # noqa: E402
+
+def synthetic(series: int, periods: int, seed: int = 3) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Weekly log prices with trend, yearly season and noise; ~20% of cells empty."""
+    rng = np.random.default_rng(seed)
+    t = forecast._years(pd.date_range("2023-01-02", periods=periods, freq="W-MON"))
+    level, drift = rng.normal(0.5, 0.8, (series, 1)), rng.normal(0.04, 0.02, (series, 1))
+    amp, phase = rng.uniform(0, 0.08, (series, 1)), rng.uniform(0, 2 * np.pi, (series, 1))
+    y = level + drift * (t - t[0]) + amp * np.sin(2 * np.pi * t + phase) + rng.normal(0, 0.03, (series, periods))
+    w = rng.poisson(8, (series, periods)) * (rng.random((series, periods)) > 0.2)
+    return t, y, w.astype(np.float64)
+
+def fit_loop_lstsq(t: np.ndarray, y: np.ndarray, w: np.ndarray) -> np.ndarray:
+    """What a per-series model would do: build its design matrix and call lstsq."""
+    out = np.empty((len(y), forecast.N_COEF))
+    pen = np.sqrt(forecast._penalty())
+    for s in range(len(y)):
+        ok = w[s] > 0
+        ws = w[s, ok] / w[s, ok].mean()
+        center = np.sum(ws * t[ok]) / ws.sum()
+        X = forecast._design(t[ok], np.array([center]))[0]
+        sw = np.sqrt(ws)[:, None]
+        A = np.vstack([X * sw, pen])
+        b = np.r_[y[s, ok] * sw[:, 0], np.zeros(forecast.N_COEF)]
+        out[s] = np.linalg.lstsq(A, b, rcond=None)[0]
+    return out
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Benchmark batched forecast fitting.")
+    ap.add_argument("--series", type=int, default=5000)
+    ap.add_argument("--periods", type=int, default=156, help="Weeks of history per series")
+    ap.add_argument("--rows", type=int, default=300_000, help="Prices in the database for the refresh timing")
+    args = ap.parse_args()
+
+    t, y, w = synthetic(args.series, args.periods)
+    t0 = time.perf_counter()
+    loop = fit_loop_lstsq(t, y, w)
+    t_loop = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    batch = forecast.fit_batch(t, y, w)
+    t_batch = time.perf_counter() - t0
+    assert np.allclose(loop, batch["coef"], atol=1e-6), np.abs(loop - batch["coef"]).max()
+    print(f"{args.series:,} series x {args.periods} weeks: per-series lstsq {t_loop * 1000:8.0f} ms   "
+          f"batched {t_batch * 1000:6.0f} ms   ({t_loop / t_batch:,.0f}x)")
+
+    from db import open_connection, transaction
+    from generate_data import Model, write_sqlite
+    from rollup import refresh as refresh_rollups
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "forecast.db"
+        model = Model(n_items=50, n_cities=20, stores_per_city=10, start=date(2023, 1, 1), days=1095, seed=1)
+        write_sqlite(model, args.rows, path)
+        con = open_connection(path)
+        for label in ("first fit", "nothing changed"):
+            t0 = time.perf_counter()
+            with transaction(con):
+                stats = forecast.fit(con)
+            print(f"  {label:<16} {(time.perf_counter() - t0) * 1000:7.0f} ms   {stats}")
+        with transaction(con):  # one new price for one item: only its city's series is refitted
+            con.execute("""INSERT INTO price(item_id, store_id, price, currency, quantity, date, price_base)
+                           SELECT item_id, store_id, price, currency, quantity, date, price_base
+                           FROM price ORDER BY id DESC LIMIT 1""")
+            refresh_rollups(con)
+        t0 = time.perf_counter()
+        with transaction(con):
+            stats = forecast.fit(con)
+        print(f"  {'one new price':<16} {(time.perf_counter() - t0) * 1000:7.0f} ms   {stats}")
+        con.close()
+
+if __name__ == "__main__":
+    main()
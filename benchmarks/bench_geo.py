@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Radius / nearest-store latency before (scan every store, haversine in Python) and
+after (R*Tree bounding box + exact distance) on a synthetic database.
+
+    python benchmarks/bench_geo.py --stores 100000
+"""
+from __future__ import annotations
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parents[1] / "src"
+sys.path.insert(0, str(SRC))
+
+import numpy as np  # noqa: E402
+import db  # noqa: E402
+import geo  # noqa: E402
+
+def build(path: Path, stores: int, seed: int = 7) -> None:
+    """Stores clustered around 200 random towns, plus a few near the poles and the date line."""
+    rng = np.random.default_rng(seed)
+    towns = np.column_stack([np.degrees(np.arcsin(rng.uniform(-1, 1, 200))), rng.uniform(-180, 180, 200)])
+    pts = towns[rng.integers(0, len(towns), stores)] + rng.normal(0, 0.2, (stores, 2))
+    pts[:, 0] = pts[:, 0].clip(-89.9, 89.9)
+    pts[:, 1] = (pts[:, 1] + 180) % 360 - 180
+    con = db.open_connection(path)
+    db.migrate(con)
+    con.executemany("INSERT INTO store(name, city, latitude, longitude) VALUES(?, ?, ?, ?)",
+                    ((f"Store {i}", f"Town {i % 200}", lat, lon) for i, (lat, lon) in enumerate(pts.tolist())))
+    con.commit()
+    con.close()
+
+def scan_within(con, lat: float, lon: float, km: float) -> list[tuple[int, float]]:
+    """The old way: read every store and filter in Python."""
+    hits = []
+    for id_, la, lo in con.execute("SELECT id, latitude, longitude FROM store WHERE latitude IS NOT NULL"):
+        d = geo.haversine_km(lat, lon, la, lo)
+        if d <= km:
+            hits.append((id_, d))
+    return sorted(hits, key=lambda h: h[1])
+
+def timed(fn, repeat: int) -> tuple[float, object]:
+    best, out = float("inf"), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Benchmark store radius queries.")
+    ap.add_argument("--stores", type=int, default=100_000)
+    ap.add_argument("--radius", type=float, nargs="+", default=[2, 10, 50])
+    ap.add_argument("--queries", type=int, default=20, help="Random query points per radius")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "geo.db"
+        t0 = time.perf_counter()
+        build(path, args.stores)
+        print(f"Built {args.stores:,} stores in {time.perf_counter() - t0:.1f}s")
+        con = db.open_connection(path)
+        rng = np.random.default_rng(1)
+        # Query near real stores (a random store's position) so results are not empty.
+        points = [tuple(r) for r in con.execute("SELECT latitude, longitude FROM store ORDER BY random() LIMIT ?",
+                                                (args.queries,))]
+        points += [(89.95, 10.0), (-89.95, -170.0), (0.1, 179.99), (0.1, -179.99)]  # poles and the date line
+        for km in args.radius:
+            t_scan = t_tree = 0.0
+            found = 0
+            for lat, lon in points:
+                lat, lon = lat + rng.normal(0, 0.05), lon
+                ts, expected = timed(lambda: scan_within(con, lat, lon, km), 1)
+                tt, got = timed(lambda: geo.within(con, lat, lon, km), args.repeat)
+                assert [r["id"] for r in got] == [i for i, _ in expected], (lat, lon, km)
+                t_scan, t_tree, found = t_scan + ts, t_tree + tt, found + len(got)
+            n = len(points)
+            print(f"  radius {km:>5g} km: full scan {t_scan / n * 1000:8.1f} ms   R*Tree {t_tree / n * 1000:7.2f} ms   "
+                  f"({t_scan / t_tree:,.0f}x, {found / n:,.0f} stores per query)")
+        t_knn, _ = timed(lambda: [geo.nearest(con, lat, lon, 10) for lat, lon in points], args.repeat)
+        print(f"  10 nearest: {t_knn / len(points) * 1000:.2f} ms per query")
+        con.close()
+
+if __name__ == "__main__":
+    main()
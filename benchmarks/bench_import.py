@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Compare the per-row CSV import with the chunked bulk import.
+
+    python benchmarks/bench_import.py --rows 1000000
+"""
+from __future__ import annotations
+import argparse
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parents[1] / "src"
+sys.path.insert(0, str(SRC))
+
+import pandas as pd  # noqa: E402
+from import_csv import check_columns, import_bulk, import_rows, normalize  # noqa: E402
+
+def fresh_db(path: Path) -> sqlite3.Connection:
+    con = sqlite3.connect(path)
+    con.executescript((SRC / "schema.sql").read_text(encoding="utf-8"))
+    return con
+
+def run_rows(db: Path, csv_path: Path) -> int:
+    with fresh_db(db) as con:
+        df = pd.read_csv(csv_path)
+        check_columns(df)
+        return import_rows(con, normalize(df))
+
+def run_bulk(db: Path, csv_path: Path, chunksize: int) -> int:
+    with fresh_db(db) as con:
+        return import_bulk(con, csv_path, chunksize, verbose=False)
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Benchmark per-row vs bulk CSV import.")
+    ap.add_argument("--rows", type=int, default=1_000_000)
+    ap.add_argument("--chunksize", type=int, default=100_000)
+    ap.add_argument("--skip-rows-path", action="store_true", help="Only time the bulk path")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        csv_path = tmp / "prices.csv"
+        subprocess.run([sys.executable, str(SRC / "generate_data.py"), "--rows", str(args.rows),
+                        "--out", str(csv_path)], check=True)
+
+        modes = [("bulk", lambda: run_bulk(tmp / "bulk.db", csv_path, args.chunksize))]
+        if not args.skip_rows_path:
+            modes.insert(0, ("per-row", lambda: run_rows(tmp / "rows.db", csv_path)))
+
+        results = {}
+        for name, fn in modes:
+            t0 = time.perf_counter()
+            n = fn()
+            results[name] = time.perf_counter() - t0
+            print(f"{name:>8}: {n:,} rows in {results[name]:.2f}s ({n / results[name]:,.0f} rows/s)")
+        if len(results) == 2:
+            print(f"speedup: {results['per-row'] / results['bulk']:.1f}x")
+
+if __name__ == "__main__":
+    main()
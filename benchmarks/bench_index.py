@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Chained price index latency as the history grows: a full computation, an update with
+nothing new, and an update after one late observation, on databases of increasing
+size with the same items, cities and months. Also times the monthly item means read
+straight from the price rows, which is what the index would cost without the rollups.
+
+    python benchmarks/bench_index.py --rows 250000 1000000 4000000
+"""
+from __future__ import annotations
+import argparse
+import sys
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parents[1] / "src"
+sys.path.insert(0, str(SRC))
+
+import price_index  # noqa: E402
+from db import open_connection, transaction  # noqa: E402
+from generate_data import Model, write_sqlite  # noqa: E402
+from rollup import refresh as refresh_rollups  # noqa: E402
+
+BASKET = {"Milk": 2.0, "Bread": 1.0, "Eggs": 1.0, "Rice": 1.0, "Coffee": 0.5, "Item 10": 1.0}
+
+def timed(fn) -> tuple[float, object]:
+    t0 = time.perf_counter()
+    out = fn()
+    return (time.perf_counter() - t0) * 1000, out
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Benchmark the chained price index against history size.")
+    ap.add_argument("--rows", type=int, nargs="+", default=[250_000, 1_000_000])
+    args = ap.parse_args()
+
+    print(f"{'rows':>10} {'raw means':>10} {'full':>8} {'no change':>10} {'late obs':>9}  (ms)")
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "index.db"
+            write_sqlite(Model(n_items=20, n_cities=20, stores_per_city=5, start=date(2023, 1, 1), days=1095, seed=1),
+                         rows, path)
+            con = open_connection(path)
+            ids = ",".join(str(con.execute("SELECT id FROM item WHERE name = ?", (n,)).fetchone()[0]) for n in BASKET)
+            t_raw, _ = timed(lambda: con.execute(f"""
+                SELECT s.city, strftime('%Y-%m-01', p.date) AS period, p.item_id, AVG(p.price_base / p.quantity)
+                FROM price p JOIN store s ON s.id = p.store_id
+                WHERE p.item_id IN ({ids}) GROUP BY 1, 2, 3""").fetchall())
+
+            def update():
+                with transaction(con):
+                    return price_index.update(con, "bench")
+
+            with transaction(con):
+                price_index.define(con, "bench", BASKET)
+            t_full, _ = timed(update)
+            t_same, _ = timed(update)
+            with transaction(con):  # a late observation of a basket item, dated a year back
+                con.execute(f"""INSERT INTO price(item_id, store_id, price, currency, quantity, date, price_base)
+                                SELECT item_id, store_id, price * 1.1, currency, quantity, date(date, '-1 year'),
+                                       price_base * 1.1
+                                FROM price WHERE item_id IN ({ids}) ORDER BY id DESC LIMIT 1""")
+                refresh_rollups(con)
+            t_late, n = timed(update)
+            print(f"{rows:>10,} {t_raw:>10.0f} {t_full:>8.0f} {t_same:>10.0f} {t_late:>9.0f}  ({n} rows recomputed)")
+            con.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Load test for the ingestion service: many concurrent submitters, one price each per request.
+
+    python benchmarks/bench_ingest.py                         # 32 clients x 200 submissions
+    python benchmarks/bench_ingest.py --clients 64 --flush-ms 5
+    python benchmarks/bench_ingest.py --direct                # also time per-submitter transactions
+
+The service runs as a child process on a copy of a small generated database. Each client
+thread keeps one HTTP connection open and submits observations back to back; the
+acknowledgement latency is measured from sending the request to reading the
+response (which only arrives after the fsynced commit). --direct runs the same load
+as add_price.py would: every submitter opens its own transaction on the database.
+"""
+from __future__ import annotations
+import argparse
+import http.client
+import json
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date
+from pathlib import Path
+import numpy as np
+
+HERE = Path(__file__).resolve().parent
+SRC = HERE.parent / "src"
+sys.path.insert(0, str(SRC))
+
+FIXTURE = dict(n_items=50, n_cities=20, stores_per_city=10, start=date(2024, 1, 1), days=365, seed=1)
+FIXTURE_ROWS = 100_000
+
+def observation(rng: np.random.Generator, items: list[str], n_stores: int) -> dict:
+    return {"item": items[rng.integers(len(items))], "store_id": int(rng.integers(1, n_stores + 1)),
+            "price": round(float(rng.uniform(0.5, 20)), 2), "currency": "EUR",
+            "date": date.today().isoformat()}
+
+def run_clients(clients: int, per_client: int, make, send) -> tuple[float, list[float], int]:
+    """
+    Start `clients` threads, each sending per_client payloads (built up front by make(rng))
+    with send(payload, state); returns (seconds, latencies, failures).
+    """
+    latencies: list[list[float]] = [[] for _ in range(clients)]
+    failures = [0] * clients
+    start = threading.Barrier(clients + 1)
+
+    def worker(k: int) -> None:
+        rng = np.random.default_rng(k)
+        payloads = [make(rng) for _ in range(per_client)]
+        state: dict = {}
+        start.wait()
+        for payload in payloads:
+            t0 = time.perf_counter()
+            if not send(payload, state):
+                failures[k] += 1
+            latencies[k].append(time.perf_counter() - t0)
+
+    threads = [threading.Thread(target=worker, args=(k,)) for k in range(clients)]
+    for t in threads:
+        t.start()
+    start.wait()
+    t0 = time.perf_counter()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - t0, [x for lat in latencies for x in lat], sum(failures)
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def via_service(db_path: Path, items: list[str], n_stores: int, args) -> tuple[float, list[float], int, dict]:
+    # The service gets its own process (as in production), so client threads don't share its GIL.
+    port = free_port()
+    proc = subprocess.Popen([sys.executable, str(SRC / "ingest_service.py"), "--db", str(db_path), "--port", str(port),
+                             "--queue-size", str(args.queue_size), "--flush-rows", str(args.flush_rows),
+                             "--flush-ms", str(args.flush_ms)], stdout=subprocess.DEVNULL)
+
+    def health() -> dict:
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+        conn.request("GET", "/health")
+        return json.loads(conn.getresponse().read())
+
+    try:
+        for _ in range(100):
+            try:
+                before = health()
+                break
+            except OSError:
+                time.sleep(0.1)
+        else:
+            raise SystemExit("ingest service did not start")
+
+        def send(body, state) -> bool:
+            if "http" not in state:
+                state["http"] = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+            state["http"].request("POST", "/prices", body, {"Content-Type": "application/json"})
+            resp = state["http"].getresponse()
+            resp.read()
+            return resp.status == 200
+
+        seconds, latencies, failures = run_clients(
+            args.clients, args.requests, lambda rng: json.dumps(observation(rng, items, n_stores)).encode(), send)
+        return seconds, latencies, failures, {"commits": health()["commits"] - before["commits"]}
+    finally:
+        proc.send_signal(signal.SIGINT)
+        proc.wait()
+
+def direct(db_path: Path, items: list[str], n_stores: int, args) -> tuple[float, list[float], int, dict]:
+    from db import item_key, open_connection, transaction
+    from fx import to_base
+    from rollup import refresh as refresh_rollups
+
+    def send(obs, state) -> bool:
+        if "con" not in state:
+            state["con"] = open_connection(db_path)
+            state["con"].execute("PRAGMA synchronous = FULL")  # same durability as the service
+        con = state["con"]
+        try:
+            with transaction(con):
+                item_id = con.execute("SELECT id FROM item WHERE name_key=?", (item_key(obs["item"]),)).fetchone()[0]
+                con.execute("""INSERT INTO price(item_id, store_id, price, currency, quantity, date, price_base)
+                               VALUES (?, ?, ?, ?, 1, ?, ?)""",
+                            (item_id, obs["store_id"], obs["price"], obs["currency"], obs["date"],
+                             to_base(con, obs["price"], obs["currency"], obs["date"])))
+                refresh_rollups(con)
+            return True
+        except sqlite3.OperationalError:  # "database is locked" past the busy timeout
+            return False
+
+    seconds, latencies, failures = run_clients(
+        args.clients, args.requests, lambda rng: observation(rng, items, n_stores), send)
+    return seconds, latencies, failures, {"commits": args.clients * args.requests - failures}
+
+def report(name: str, seconds: float, latencies: list[float], failures: int, stats: dict) -> dict:
+    ms = np.array(latencies) * 1000
+    res = {"submissions_per_s": len(ms) / seconds, "p50_ms": float(np.percentile(ms, 50)),
+           "p99_ms": float(np.percentile(ms, 99)), "max_ms": float(ms.max()), "failures": failures,
+           "commits": stats.get("commits")}
+    print(f"  {name:<8} {res['submissions_per_s']:>9,.0f} submissions/s   p50 {res['p50_ms']:>7.1f} ms   "
+          f"p99 {res['p99_ms']:>7.1f} ms   max {res['max_ms']:>7.1f} ms   "
+          f"{res['commits']:,} commits   {failures} failed")
+    return res
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Load-test the group-commit ingestion service.")
+    ap.add_argument("--clients", type=int, default=32, help="Concurrent submitters")
+    ap.add_argument("--requests", type=int, default=200, help="Submissions per client")
+    ap.add_argument("--queue-size", type=int, default=10_000)
+    ap.add_argument("--flush-rows", type=int, default=500)
+    ap.add_argument("--flush-ms", type=float, default=2.0)
+    ap.add_argument("--direct", action="store_true", help="Also run the one-transaction-per-submission baseline")
+    ap.add_argument("--out", help="Write the results as JSON")
+    args = ap.parse_args()
+
+    from generate_data import Model, write_sqlite
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        model = Model(**FIXTURE)
+        fixture = Path(tmp) / "fixture.db"
+        write_sqlite(model, FIXTURE_ROWS, fixture)
+        print(f"{args.clients} clients x {args.requests} submissions on {FIXTURE_ROWS:,} existing prices")
+        for name, fn in (("service", via_service), ("direct", direct))[:2 if args.direct else 1]:
+            db_path = Path(tmp) / f"{name}.db"
+            with sqlite3.connect(fixture) as src, sqlite3.connect(db_path) as dst:
+                src.backup(dst)
+            results[name] = report(name, *fn(db_path, [item for item, _, _ in model.items], model.n_stores, args))
+    if args.out:
+        Path(args.out).write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+
+if __name__ == "__main__":
+    main()
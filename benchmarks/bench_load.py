@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Peak RSS and wall time of `analytics.py --item Milk` style loading on raw observations:
+the old dict-per-row load_prices_df versus the columnar one. Each side runs in its own
+process so ru_maxrss is not shared.
+
+    python benchmarks/bench_load.py --rows 10000000
+"""
+from __future__ import annotations
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+SRC = HERE.parent / "src"
+sys.path.insert(0, str(SRC))
+sys.path.insert(0, str(HERE))
+
+def before(db_path: Path) -> int:
+    """The original analytics.load_prices_df + plot_trend filtering."""
+    import pandas as pd
+    import db
+    con = db.open_connection(db_path)
+    rows = con.execute("""
+        SELECT p.id, i.name AS item, i.unit, s.city, p.price, p.quantity, p.currency, p.date
+        FROM price p LEFT JOIN item i ON i.id = p.item_id LEFT JOIN store s ON s.id = p.store_id
+    """).fetchall()
+    df = pd.DataFrame([dict(r) for r in rows])
+    df["date"] = pd.to_datetime(df["date"], errors="coerce")
+    df["unit_price"] = df["price"] / df["quantity"].replace(0, pd.NA)
+    dfi = df[df["item"].str.lower() == "milk"].sort_values("date")
+    return sum(len(g) for _, g in dfi.groupby(dfi["city"].fillna("Unknown")))
+
+def after(db_path: Path) -> int:
+    import db
+    db.DB_PATH = db_path
+    import analytics
+    pivot = analytics.observed_trend(analytics.load_prices_df(["Milk"]), "Milk")
+    return int(pivot.notna().sum().sum())
+
+def child(mode: str, db_path: Path) -> None:
+    t0 = time.perf_counter()
+    n = {"before": before, "after": after}[mode](db_path)
+    print(json.dumps({"mode": mode, "seconds": time.perf_counter() - t0, "n": n,
+                      "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Benchmark raw-observation loading before/after.")
+    ap.add_argument("--rows", type=int, default=10_000_000)
+    ap.add_argument("--db", help="Reuse / keep the fixture database at this path")
+    ap.add_argument("--child", choices=["before", "after"], help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.child:
+        child(args.child, Path(args.db))
+        return
+
+    from bench_basket import build
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(args.db) if args.db else Path(tmp) / "load.db"
+        if not path.exists():
+            build(path, args.rows, stores=500, cities=25)
+        res = {}
+        for mode in ("before", "after"):
+            out = subprocess.run([sys.executable, __file__, "--child", mode, "--db", str(path)],
+                                 check=True, capture_output=True, text=True).stdout
+            res[mode] = json.loads(out.strip().splitlines()[-1])
+            print(f"{mode:>6}: {res[mode]['seconds']:.2f}s, peak RSS {res[mode]['peak_rss_mb']:,.0f} MiB")
+        print(f"time {res['before']['seconds'] / res['after']['seconds']:.1f}x, "
+              f"RSS {res['before']['peak_rss_mb'] / res['after']['peak_rss_mb']:.1f}x")
+
+if __name__ == "__main__":
+    main()
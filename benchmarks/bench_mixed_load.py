@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Volunteers writing while dashboards read: compare the old per-call connection
+(rollback journal, commit per statement) with the pooled WAL connection layer.
+
+    python benchmarks/bench_mixed_load.py --seconds 10 --writers 4 --readers 4
+"""
+from __future__ import annotations
+import argparse
+import random
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import sys
+SRC = Path(__file__).resolve().parents[1] / "src"
+sys.path.insert(0, str(SRC))
+
+import db  # noqa: E402
+
+READ_SQL = """
+    SELECT s.city, i.name, p.price, p.quantity, p.date
+    FROM price p JOIN item i ON i.id = p.item_id LEFT JOIN store s ON s.id = p.store_id
+    WHERE p.item_id = ? ORDER BY p.date DESC LIMIT 200
+"""
+WRITE_SQL = "INSERT INTO price(item_id, store_id, price, currency, quantity, date) VALUES(?,?,?,?,?,?)"
+
+def legacy_connect(path: Path) -> sqlite3.Connection:
+    """What db.connect() used to do on every call."""
+    con = sqlite3.connect(path)
+    con.row_factory = sqlite3.Row
+    con.execute("PRAGMA foreign_keys = ON;")
+    return con
+
+def seed(path: Path, rows: int) -> None:
+    con = sqlite3.connect(path)
+    db.migrate(con)
+    con.executemany("INSERT INTO item(name) VALUES(?)", [(f"Item {i}",) for i in range(50)])
+    con.executemany("INSERT INTO store(name, city) VALUES(?,?)", [(f"Store {i}", f"City {i % 10}") for i in range(100)])
+    con.executemany(WRITE_SQL, ((random.randint(1, 50), random.randint(1, 100), random.uniform(1, 5), "EUR", 1,
+                                 f"2025-{random.randint(1, 12):02d}-{random.randint(1, 28):02d}") for _ in range(rows)))
+    con.commit()
+    con.close()
+
+def run(path: Path, pooled: bool, seconds: float, writers: int, readers: int) -> dict:
+    stop = time.perf_counter() + seconds
+    latencies: list[float] = []
+    errors = {"locked": 0}
+    writes = [0]
+    lock = threading.Lock()
+
+    def writer() -> None:
+        while time.perf_counter() < stop:
+            row = (random.randint(1, 50), random.randint(1, 100), random.uniform(1, 5), "EUR", 1, "2025-12-01")
+            try:
+                if pooled:
+                    with db.transaction(db.connect(path)) as con:
+                        db.q(con, "SELECT id FROM item WHERE id=?", (row[0],))
+                        db.qi(con, WRITE_SQL, row)
+                else:
+                    with legacy_connect(path) as con:
+                        db.q(con, "SELECT id FROM item WHERE id=?", (row[0],))
+                        db.qi(con, WRITE_SQL, row)
+                with lock:
+                    writes[0] += 1
+            except sqlite3.OperationalError as e:
+                if "locked" not in str(e):
+                    raise
+                with lock:
+                    errors["locked"] += 1
+
+    def reader() -> None:
+        while time.perf_counter() < stop:
+            t0 = time.perf_counter()
+            try:
+                con = db.connect(path) if pooled else legacy_connect(path)
+                db.q(con, READ_SQL, (random.randint(1, 50),))
+            except sqlite3.OperationalError as e:
+                if "locked" not in str(e):
+                    raise
+                with lock:
+                    errors["locked"] += 1
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - t0)
+
+    threads = [threading.Thread(target=writer) for _ in range(writers)] + \
+              [threading.Thread(target=reader) for _ in range(readers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    latencies.sort()
+    return {
+        "writes": writes[0],
+        "reads": len(latencies),
+        "locked_errors": errors["locked"],
+        "read_p50_ms": 1000 * statistics.median(latencies) if latencies else float("nan"),
+        "read_p95_ms": 1000 * latencies[int(0.95 * (len(latencies) - 1))] if latencies else float("nan"),
+    }
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Mixed read/write load against the SQLite layer.")
+    ap.add_argument("--rows", type=int, default=200_000)
+    ap.add_argument("--seconds", type=float, default=10)
+    ap.add_argument("--writers", type=int, default=4)
+    ap.add_argument("--readers", type=int, default=4)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        base = Path(tmp) / "seed.db"
+        seed(base, args.rows)
+        for name, pooled in (("legacy", False), ("pooled", True)):
+            path = Path(tmp) / f"{name}.db"
+            shutil.copy(base, path)
+            r = run(path, pooled, args.seconds, args.writers, args.readers)
+            print(f"{name:>7}: {r['writes']:,} writes, {r['reads']:,} reads, {r['locked_errors']} locked errors, "
+                  f"read p50 {r['read_p50_ms']:.2f} ms, p95 {r['read_p95_ms']:.2f} ms")
+
+if __name__ == "__main__":
+    main()
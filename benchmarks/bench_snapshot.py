@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Raw-observation loading from SQLite (join + row fetch) versus the Parquet snapshot
+(memory-mapped, column and predicate pushdown): all items, and one item over one
+quarter. Also times a full and an incremental export. Each load runs in its own
+process so caches and ru_maxrss are not shared.
+
+    python benchmarks/bench_snapshot.py --rows 10000000
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+SRC = HERE.parent / "src"
+sys.path.insert(0, str(SRC))
+sys.path.insert(0, str(HERE))
+
+CASES = {
+    "all items": {},
+    "one item, one quarter": {"items": ["Milk"], "start": "2024-04-01", "end": "2024-06-30"},
+}
+
+def child(case: str, snapshot: bool, db_path: Path) -> None:
+    import db
+    db.DB_PATH = db_path
+    import analytics
+    t0 = time.perf_counter()
+    df = analytics.load_prices_df(**CASES[case], snapshot=snapshot)
+    print(json.dumps({"seconds": time.perf_counter() - t0, "rows": len(df),
+                      "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Benchmark SQLite vs Parquet snapshot loading.")
+    ap.add_argument("--rows", type=int, default=5_000_000)
+    ap.add_argument("--db", help="Reuse / keep the fixture database at this path")
+    ap.add_argument("--child", choices=sorted(CASES), help=argparse.SUPPRESS)
+    ap.add_argument("--snapshot", action="store_true", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.child:
+        child(args.child, args.snapshot, Path(args.db))
+        return
+
+    from bench_basket import build
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(args.db) if args.db else Path(tmp) / "snapshot.db"
+        if not path.exists():
+            build(path, args.rows, stores=500, cities=25)
+
+        def export(*flags: str) -> None:  # in its own process, like the loads
+            print(subprocess.run([sys.executable, str(SRC / "snapshot.py"), *flags], check=True, capture_output=True,
+                                 text=True, env={**os.environ, "PRICE_TRACKER_DB": str(path)}).stdout.strip())
+
+        export("--rebuild")
+        with sqlite3.connect(path) as con:
+            con.execute("""INSERT INTO price(item_id, store_id, price, currency, quantity, date)
+                           SELECT item_id, store_id, price, currency, quantity, date FROM price LIMIT 1000""")
+        export()
+        for case in CASES:
+            res = {}
+            for label, flag in (("sqlite", []), ("snapshot", ["--snapshot"])):
+                out = subprocess.run([sys.executable, __file__, "--child", case, *flag, "--db", str(path)],
+                                     check=True, capture_output=True, text=True).stdout
+                res[label] = json.loads(out.strip().splitlines()[-1])
+            assert res["sqlite"]["rows"] == res["snapshot"]["rows"], res
+            print(f"{case}: {res['sqlite']['rows']:,} rows")
+            for label, r in res.items():
+                print(f"  {label:>8}: {r['seconds']:.3f}s, peak RSS {r['peak_rss_mb']:,.0f} MiB")
+            print(f"  time {res['sqlite']['seconds'] / res['snapshot']['seconds']:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmarks of the hot paths at several scales, with a regression gate.
+
+    python benchmarks/suite.py                          # 10k fixture, all cases
+    python benchmarks/suite.py --scale 10k 1m 10m       # the full matrix
+    python benchmarks/suite.py --save-baseline          # store results as the new baseline
+    python benchmarks/suite.py --scale 1m               # fails (exit 1) on regressions vs the baseline
+    python benchmarks/suite.py --gate                   # CI: also fails when a case has no baseline
+
+Fixtures (a generated database and CSV per scale) are built once with
+src/generate_data.py and kept in benchmarks/fixtures/. Every case runs in its own
+process so peak RSS is per case; wall time is the median of --repeat runs, and the
+gate compares medians. Results (wall time, peak RSS, rows/s) are written to a JSON
+file together with the machine they ran on; the gate refuses to compare against a
+baseline recorded on a different machine, since absolute times do not carry over.
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import platform
+import resource
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timezone
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+SRC = HERE.parent / "src"
+sys.path.insert(0, str(SRC))
+
+SCALES = {"10k": 10_000, "1m": 1_000_000, "10m": 10_000_000}
+FIXTURE_VERSION = 3  # bump when the fixture parameters below (or the database schema) change
+FIXTURE = dict(n_items=50, n_cities=20, stores_per_city=10, start=date(2023, 1, 1), days=1095, seed=1)
+ITEM = "Milk"
+BASKET = ["Milk", "Bread", "Eggs", "Coffee"]
+DEEP_PAGE = 200  # "Recent Prices" page far from the top
+
+# -------- fixtures --------
+def fixture_paths(fixtures: Path, scale: str) -> tuple[Path, Path]:
+    stem = fixtures / f"prices_{scale}_v{FIXTURE_VERSION}"
+    return stem.with_suffix(".db"), stem.with_suffix(".csv")
+
+def ensure_fixtures(fixtures: Path, scale: str) -> tuple[Path, Path]:
+    from generate_data import Model, write_csv, write_sqlite
+
+    db_path, csv_path = fixture_paths(fixtures, scale)
+    fixtures.mkdir(parents=True, exist_ok=True)
+    model = Model(**FIXTURE)
+    for path, writer in ((csv_path, write_csv), (db_path, write_sqlite)):
+        if not path.exists():
+            t0 = time.perf_counter()
+            tmp = path.with_suffix(".partial")
+            writer(model, SCALES[scale], tmp)
+            tmp.replace(path)
+            print(f"  fixture {path.name}: {time.perf_counter() - t0:.1f}s")
+    return db_path, csv_path
+
+# -------- cases (run inside the child process; PRICE_TRACKER_DB points at the fixture) --------
+# Each returns a zero-argument callable to time; the callable returns the rows it produced.
+def case_import_csv(csv_path: Path, tmp: Path):
+    from db import migrate, open_connection
+    from import_csv import import_bulk
+
+    def run() -> int:
+        target = tmp / "import.db"
+        for p in tmp.glob("import.db*"):
+            p.unlink()
+        with open_connection(target) as con:
+            migrate(con)
+            return import_bulk(con, csv_path, verbose=False)
+    return run
+
+def case_load_prices_df(csv_path: Path, tmp: Path):
+    from analytics import load_prices_df
+    return lambda: len(load_prices_df())
+
+def case_plot_trend(csv_path: Path, tmp: Path):
+    from analytics import plot_trend
+    from db import connect
+    from rollup import trend_frame
+
+    def run() -> int:
+        pivot = trend_frame(connect(), ITEM)
+        plot_trend(pivot, ITEM, tmp)
+        return int(pivot.notna().sum().sum())
+    return run
+
+def case_plot_basket(csv_path: Path, tmp: Path):
+    from analytics import plot_basket
+    return lambda: int(plot_basket(BASKET, tmp) is not None)
+
+def case_app_trends(csv_path: Path, tmp: Path):
+    import app_data
+    trend = app_data.trend.__wrapped__  # the query behind st.cache_data
+    return lambda: int(trend(None, ITEM, None, None, None, "mean").notna().sum().sum())
+
+def case_app_basket(csv_path: Path, tmp: Path):
+    import app_data
+    basket = app_data.basket.__wrapped__
+    return lambda: len(basket(None, tuple(BASKET), "EUR"))
+
+def case_app_recent_prices(csv_path: Path, tmp: Path):
+    import app_data
+    page = app_data.recent_prices_page.__wrapped__
+    return lambda: len(page(None, 0)) + len(page(None, DEEP_PAGE))
+
+CASES = {
+    "import_csv": case_import_csv,
+    "load_prices_df": case_load_prices_df,
+    "plot_trend": case_plot_trend,
+    "plot_basket": case_plot_basket,
+    "app_trends": case_app_trends,
+    "app_basket": case_app_basket,
+    "app_recent_prices": case_app_recent_prices,
+}
+
+def child(case: str, csv_path: Path, repeat: int) -> None:
+    import matplotlib
+    matplotlib.use("Agg")
+    with tempfile.TemporaryDirectory() as tmp:
+        fn = CASES[case](csv_path, Path(tmp))
+        times, rows = [], 0
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            rows = fn()
+            times.append(time.perf_counter() - t0)
+    print(json.dumps({"seconds": statistics.median(times), "best": min(times), "rows": rows,
+                      "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+
+def run_case(case: str, db_path: Path, csv_path: Path, repeat: int) -> dict:
+    env = dict(os.environ, PRICE_TRACKER_DB=str(db_path))
+    proc = subprocess.run([sys.executable, __file__, "--child", case, "--csv", str(csv_path), "--repeat", str(repeat)],
+                          env=env, capture_output=True, text=True)
+    if proc.returncode:
+        raise SystemExit(f"{case} failed:\n{proc.stderr}")
+    res = json.loads(proc.stdout.strip().splitlines()[-1])
+    res["rows_per_s"] = res["rows"] / res["seconds"] if res["seconds"] else None
+    return res
+
+# -------- baseline comparison --------
+def machine() -> dict:
+    """What the timings depend on; a baseline only applies to the machine it was recorded on."""
+    cpu = platform.processor()
+    try:
+        cpu = next((line.split(":", 1)[1].strip() for line in open("/proc/cpuinfo", encoding="utf-8")
+                    if line.startswith("model name")), cpu)
+    except OSError:
+        pass
+    return {"machine": platform.machine(), "cpu": cpu, "cpus": os.cpu_count(),
+            "python": platform.python_version(), "sqlite": sqlite3.sqlite_version}
+
+def regressions(results: dict, baseline: dict, threshold: float, min_delta_ms: float) -> list[str]:
+    """Cases slower (or using more memory) than the baseline by more than `threshold`; times are medians."""
+    found = []
+    for key, res in results.items():
+        old = baseline.get(key)
+        if not old:
+            continue
+        dt = res["seconds"] - old["seconds"]
+        if dt > old["seconds"] * threshold and dt * 1000 > min_delta_ms:
+            found.append(f"{key}: {old['seconds'] * 1000:,.1f} ms -> {res['seconds'] * 1000:,.1f} ms")
+        if res["peak_rss_mb"] > old["peak_rss_mb"] * (1 + threshold):
+            found.append(f"{key}: peak RSS {old['peak_rss_mb']:,.0f} -> {res['peak_rss_mb']:,.0f} MiB")
+    return found
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Benchmark import, analytics and app queries.")
+    ap.add_argument("--scale", nargs="+", choices=list(SCALES), default=["10k"])
+    ap.add_argument("--case", nargs="+", choices=list(CASES), help="Only these cases (default: all)")
+    ap.add_argument("--repeat", type=int, default=5, help="Runs per case; the median counts")
+    ap.add_argument("--fixtures", default=str(HERE / "fixtures"), help="Directory for cached fixture files")
+    ap.add_argument("--out", default=str(HERE / "results.json"), help="Where to write this run's results")
+    ap.add_argument("--baseline", default=str(HERE / "baseline.json"))
+    ap.add_argument("--save-baseline", action="store_true", help="Merge this run's results into the baseline")
+    ap.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown / RSS growth (0.25 = 25%%)")
+    ap.add_argument("--min-delta-ms", type=float, default=5.0, help="Ignore slowdowns smaller than this")
+    ap.add_argument("--gate", action="store_true",
+                    help="Regression gate for CI: a missing baseline, or a case missing from it, fails too")
+    ap.add_argument("--child", choices=list(CASES), help=argparse.SUPPRESS)
+    ap.add_argument("--csv", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.child:
+        child(args.child, Path(args.csv), args.repeat)
+        return
+
+    results = {}
+    for scale in args.scale:
+        print(f"[{scale}]")
+        db_path, csv_path = ensure_fixtures(Path(args.fixtures), scale)
+        for case in args.case or CASES:
+            res = results[f"{scale}/{case}"] = run_case(case, db_path, csv_path, args.repeat)
+            rate = f"{res['rows_per_s']:>14,.0f} rows/s" if res["rows_per_s"] else ""
+            print(f"  {case:<18} {res['seconds'] * 1000:>10,.1f} ms  {res['peak_rss_mb']:>7,.0f} MiB {rate}")
+
+    meta = {"when": datetime.now(timezone.utc).isoformat(timespec="seconds"), "repeat": args.repeat, **machine()}
+    Path(args.out).write_text(json.dumps({"meta": meta, "results": results}, indent=2) + "\n", encoding="utf-8")
+    print(f"Results -> {args.out}")
+
+    baseline_path = Path(args.baseline)
+    stored = json.loads(baseline_path.read_text(encoding="utf-8")) if baseline_path.exists() else {}
+    recorded_on = {key: stored.get("meta", {}).get(key) for key in machine()}
+    same_machine = recorded_on == machine()
+    baseline = stored.get("results", {}) if same_machine else {}
+    if args.save_baseline:
+        if stored and not same_machine:
+            print("Baseline was recorded on another machine; replacing it instead of merging")
+        baseline.update(results)
+        baseline_path.write_text(json.dumps({"meta": meta, "results": baseline}, indent=2) + "\n", encoding="utf-8")
+        print(f"Baseline updated ✅ ({baseline_path})")
+        return
+    if stored and not same_machine:
+        diff = ", ".join(f"{key} {recorded_on[key]} vs {value}" for key, value in machine().items()
+                         if recorded_on[key] != value)
+        raise SystemExit(f"❌ {baseline_path} was recorded on another machine ({diff}); absolute times do not "
+                         "compare across machines, so re-record it here with --save-baseline")
+    missing = [key for key in results if key not in baseline]
+    if missing and args.gate:
+        raise SystemExit(f"❌ No baseline for {', '.join(missing)} in {baseline_path}; store one with --save-baseline")
+    if not baseline:
+        print("No baseline yet; store one with --save-baseline")
+        return
+    if missing:
+        print(f"Not in the baseline (not checked): {', '.join(missing)}")
+    found = regressions(results, baseline, args.threshold, args.min_delta_ms)
+    if found:
+        print("❌ Regressions past the threshold:\n  " + "\n  ".join(found))
+        raise SystemExit(1)
+    print("No regressions ✅")
+
+if __name__ == "__main__":
+    main()
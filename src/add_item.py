@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 import argparse
-from db import connect, qi
+from db import connect, item_key, qi
 
 def main() -> None:
     ap = argparse.ArgumentParser(description="Add a new item (e.g., Bread, Milk).")
@@ -11,8 +11,8 @@ def main() -> None:
     args = ap.parse_args()
 
     with connect() as con:
-        rowid = qi(con, "INSERT OR IGNORE INTO item(name, category, unit) VALUES(?,?,?)",
-                   (args.name.strip(), args.category.strip(), args.unit.strip())).lastrowid
+        rowid = qi(con, "INSERT OR IGNORE INTO item(name, name_key, category, unit) VALUES(?,?,?,?)",
+                   (args.name.strip(), item_key(args.name), args.category.strip(), args.unit.strip())).lastrowid
     print(f"Item added (or already existed). id={rowid if rowid else 'existing'} ✅")
 
 if __name__ == "__main__":
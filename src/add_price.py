@@ -1,30 +1,149 @@
 #!/usr/bin/env python3
+"""
+Add price observations: one from the flags, or a batch (NDJSON or CSV on stdin) written
+in a single transaction, so a collector pays for one process start and one commit.
+
+    python src/add_price.py --item Milk --price 1.29 --store-id 1
+    python src/add_price.py --stdin < prices.ndjson      # {"item": "Milk", "price": 1.29, "store_id": 1}
+    python src/add_price.py --stdin < prices.csv         # header: item,price,store_id,...
+"""
 from __future__ import annotations
 import argparse
+import csv
+import itertools
+import json
+import os
+import sys
 from datetime import date
-from db import connect, q, qi
+from typing import IO, Iterator
+from db import connect, executemany, item_key, q, qi, transaction
+from fx import rate
+from rollup import refresh as refresh_rollups
+
+FIELDS = ("item", "unit", "store_id", "store", "city", "price", "currency", "quantity", "date")
+
+def parse_observation(obs: dict) -> tuple:
+    """Validate one observation (JSON object or CSV row); returns the row add_prices() writes. Raises ValueError."""
+    if not isinstance(obs, dict):
+        raise ValueError("each observation must be a JSON object")
+    item = str(obs.get("item") or "").strip()
+    if not item:
+        raise ValueError("'item' is required")
+    try:
+        price = float(obs["price"])
+        quantity = float(obs.get("quantity") or 1)
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("'price' (and 'quantity', if given) must be numbers")
+    if price < 0 or quantity <= 0:
+        raise ValueError("'price' must be >= 0 and 'quantity' > 0")
+    day = str(obs.get("date") or date.today().isoformat())
+    date.fromisoformat(day[:10])  # ValueError on bad dates
+    store_id = obs.get("store_id")
+    return (item, str(obs.get("unit") or "unit").strip() or "unit",
+            None if store_id in (None, "") else int(store_id),
+            str(obs.get("store") or "").strip(), str(obs.get("city") or "").strip(),
+            price, str(obs.get("currency") or "USD").strip(), quantity, day)
+
+def read_observations(stream: IO[str]) -> Iterator[tuple[int, dict]]:
+    """(line number, record) from NDJSON, or from CSV with a header row; the first character tells which."""
+    first = stream.readline()
+    if first.lstrip().startswith("{"):
+        for n, line in enumerate(itertools.chain([first], stream), 1):
+            if line.strip():
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"line {n}: {e.msg}")
+                yield n, record
+        return
+    reader = csv.DictReader(stream, fieldnames=next(csv.reader([first])) if first.strip() else None)
+    for n, row in enumerate(reader, 2):
+        yield n, {k.strip(): v for k, v in row.items() if k and v not in (None, "")}
+
+def ensure_item(con, name: str, unit: str = "unit"):
+    row = q(con, "SELECT id FROM item WHERE name_key=?", (item_key(name),))
+    if row:
+        return row[0]["id"]
+    return qi(con, "INSERT INTO item(name, name_key, category, unit) VALUES(?, ?, 'general', ?)",
+              (name.strip(), item_key(name), unit)).lastrowid
 
-def ensure_item(con, name: str):
-    row = q(con, "SELECT id FROM item WHERE name=?", (name.strip(),))
+def ensure_store(con, name: str, city: str):
+    row = q(con, "SELECT id FROM store WHERE name=? AND COALESCE(city, '')=? ORDER BY id LIMIT 1", (name, city))
     if row:
         return row[0]["id"]
-    return qi(con, "INSERT INTO item(name, category, unit) VALUES(?, 'general', 'unit')", (name.strip(),)).lastrowid
+    return qi(con, "INSERT INTO store(name, city) VALUES(?, ?)", (name, city or None)).lastrowid
+
+def add_prices(con, rows: list[tuple]) -> list[int]:
+    """
+    Insert parse_observation() rows, creating unknown items and named stores, and fold
+    them into the rollups; returns their price ids. Run it inside db.transaction().
+    """
+    items, stores, per_base = {}, {}, {}
+    values = []
+    for item, unit, store_id, store, city, price, currency, quantity, day in rows:
+        key = item_key(item)
+        if key not in items:
+            items[key] = ensure_item(con, item, unit)
+        if store_id is None and store:
+            if (store, city) not in stores:
+                stores[store, city] = ensure_store(con, store, city)
+            store_id = stores[store, city]
+        if (currency, day) not in per_base:
+            per_base[currency, day] = rate(con, currency, day)
+        r = per_base[currency, day]
+        values.append((items[key], store_id, price, currency, quantity, day, None if r is None else price / r))
+    executemany(con, """INSERT INTO price(item_id, store_id, price, currency, quantity, date, price_base)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)""", values)
+    # Single writer inside BEGIN IMMEDIATE: the new AUTOINCREMENT ids are consecutive.
+    last = con.execute("SELECT seq FROM sqlite_sequence WHERE name = 'price'").fetchone()[0]
+    refresh_rollups(con)
+    return list(range(last - len(values) + 1, last + 1))
 
 def main() -> None:
-    ap = argparse.ArgumentParser(description="Add a price observation.")
-    ap.add_argument("--item", required=True, help="Item name (e.g., Milk)")
+    ap = argparse.ArgumentParser(description="Add a price observation, or a batch of them from stdin.")
+    ap.add_argument("--item", help="Item name (e.g., Milk)")
     ap.add_argument("--store-id", type=int, default=None, help="Existing store id (optional)")
-    ap.add_argument("--price", type=float, required=True)
+    ap.add_argument("--price", type=float)
     ap.add_argument("--currency", default="USD")
     ap.add_argument("--quantity", type=float, default=1.0, help="How many units covered by price")
     ap.add_argument("--date", default=date.today().isoformat())
+    ap.add_argument("--stdin", action="store_true",
+                    help=f"Read observations from stdin, as NDJSON or CSV with a header ({', '.join(FIELDS)}), "
+                         "and write them in one transaction")
     args = ap.parse_args()
 
-    with connect() as con:
-        item_id = ensure_item(con, args.item)
-        qi(con, "INSERT INTO price(item_id, store_id, price, currency, quantity, date) VALUES(?,?,?,?,?,?)",
-           (item_id, args.store_id, args.price, args.currency, args.quantity, args.date))
-    print("Price logged ✅")
+    if args.stdin:
+        try:
+            obs = []
+            for n, record in read_observations(sys.stdin):
+                try:
+                    obs.append(parse_observation(record))
+                except ValueError as e:
+                    raise ValueError(f"line {n}: {e}")
+        except ValueError as e:
+            raise SystemExit(f"❌ Nothing written: {e}")
+        if not obs:
+            raise SystemExit("❌ No observations on stdin")
+    elif args.item is None or args.price is None:
+        ap.error("--item and --price are required (or use --stdin)")
+    else:
+        obs = [parse_observation({"item": args.item, "store_id": args.store_id, "price": args.price,
+                                  "currency": args.currency, "quantity": args.quantity, "date": args.date})]
+
+    ingest_url = os.environ.get("PRICE_TRACKER_INGEST_URL")
+    if ingest_url:  # hand the write to the ingestion service (see ingest_service.py)
+        from ingest_service import IngestError, submit
+        try:
+            ids = submit(ingest_url, [dict(zip(FIELDS, row)) for row in obs])
+        except IngestError as e:
+            raise SystemExit(f"❌ {e}")
+        print(f"Price logged via ingest service (id={ids[0]}) ✅" if len(ids) == 1 else
+              f"{len(ids)} prices logged via ingest service (ids {ids[0]}..{ids[-1]}) ✅")
+        return
+
+    with transaction(connect()) as con:
+        ids = add_prices(con, obs)
+    print("Price logged ✅" if len(ids) == 1 else f"{len(ids)} prices logged (ids {ids[0]}..{ids[-1]}) ✅")
 
 if __name__ == "__main__":
     main()
@@ -1,120 +1,394 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 import argparse
+import hashlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-import sys
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from db import connect, q
+from matplotlib.figure import Figure
+from db import connect, item_key, q
+from downsample import PIXELS, downsample
+from fx import BASE_CURRENCY, base_price_sql, from_base
+from latest_price import basket_by_city, latest_by_city
+from partitions import price_source
+from rollup import UNKNOWN_CITY, trend_frame
 
 def ensure_outdir(p: Path) -> Path:
     p.mkdir(parents=True, exist_ok=True)
     return p
 
-def _rows_to_df(rows) -> pd.DataFrame:
+LOAD_CHUNK_ROWS = 250_000
+UNIX_EPOCH_JULIAN_DAY = 2440587.5
+
+def _category_lookup(con, sql: str) -> tuple[np.ndarray, list[str]]:
+    """For a small (id, label) table: array mapping id -> category code (-1 for NULL), and the categories."""
+    rows = con.execute(sql).fetchall()
+    labels = sorted({r[1] for r in rows if r[1] is not None})
+    pos = {label: i for i, label in enumerate(labels)}
+    codes = np.full(max((r[0] for r in rows), default=0) + 1, -1, dtype=np.int32)
+    for id_, label in rows:
+        if label is not None:
+            codes[id_] = pos[label]
+    return codes, labels
+
+def load_prices_df(items: list[str] | None = None, start: str | None = None, end: str | None = None,
+                   with_currency: bool = False, chunksize: int = LOAD_CHUNK_ROWS,
+                   exclude_anomalies: bool = False, snapshot: bool = False, after_id: int = 0) -> pd.DataFrame:
     """
-    Convert sqlite rows to a DataFrame with proper column names.
-    Handles cases where rows are sqlite3.Row or plain tuples.
+    Load price observations as typed columns:
+      item, city (, currency)  categoricals
+      date                     int64 days since 1970-01-01
+      unit_price               float64, in fx.BASE_CURRENCY (currency is the observed one)
+    Item and date filters run in SQL and only the needed columns are selected. Rows are
+    fetched in chunks and turned straight into NumPy arrays, so no per-row dicts are built.
+    exclude_anomalies drops the observations anomaly.py flagged. snapshot reads the rows
+    snapshot.py exported from its Parquet files and only newer ones (id > after_id) from SQLite.
     """
-    if not rows:
+    if snapshot:
+        from snapshot import load_prices
+
+        df, upto = load_prices(items, start, end, with_currency, exclude_anomalies)
+        tail = load_prices_df(items, start, end, with_currency, chunksize, exclude_anomalies, after_id=upto)
+        if tail.empty or df.empty:
+            return tail if df.empty else df
+        cats = ["item", "city"] + (["currency"] if with_currency else [])
+        out = pd.concat([df, tail], ignore_index=True)
+        for c in cats:
+            out[c] = pd.api.types.union_categoricals([df[c], tail[c]], sort_categories=True)
+        return out
+    con = connect()
+    where, params = [], []
+    if items:
+        where.append(f"p.item_id IN (SELECT id FROM item WHERE name_key IN ({','.join('?' * len(items))}))")
+        params += [item_key(x) for x in items]
+    if start:
+        where.append("p.date >= ?")
+        params.append(start)
+    if end:
+        where.append("p.date <= ?")
+        params.append(end)
+    if exclude_anomalies:
+        where.append("p.id NOT IN (SELECT price_id FROM anomaly)")
+    if after_id:
+        where.append("p.id > ?")
+        params.append(after_id)
+    sql = f"""
+        SELECT p.item_id, COALESCE(p.store_id, 0), CAST(julianday(p.date) - {UNIX_EPOCH_JULIAN_DAY} AS INTEGER),
+               {base_price_sql()} / NULLIF(p.quantity, 0){", p.currency" if with_currency else ""}
+        FROM {price_source(con, start, end)} p
+        {"WHERE " + " AND ".join(where) if where else ""}
+    """
+    cur = con.cursor()
+    cur.row_factory = None  # plain tuples
+    cur.execute(sql, params)
+    parts: list[list[np.ndarray]] = []
+    while rows := cur.fetchmany(chunksize):
+        cols = list(zip(*rows))
+        part = [np.array(cols[0], dtype=np.int64), np.array(cols[1], dtype=np.int64),
+                np.array(cols[2], dtype=np.float64),  # NULL (bad date) -> NaN, dropped below
+                np.array(cols[3], dtype=np.float64)]
+        if with_currency:
+            part.append(pd.Categorical(cols[4]))
+        parts.append(part)
+    if not parts:
         return pd.DataFrame()
-    try:
-        # sqlite3.Row is mapping-like: dict(row) works
-        return pd.DataFrame([dict(r) for r in rows])
-    except Exception:
-        # Fallback: use cursor description — but we don't have cursor here.
-        # So just coerce, and we’ll validate later.
-        return pd.DataFrame(rows)
-
-def load_prices_df() -> pd.DataFrame:
-    with connect() as con:
-        rows = q(con, """
-            SELECT
-              p.id,
-              i.name AS item,
-              i.unit,
-              s.city,
-              p.price,
-              p.quantity,
-              p.currency,
-              p.date
-            FROM price p
-            LEFT JOIN item i ON i.id = p.item_id
-            LEFT JOIN store s ON s.id = p.store_id
-        """)
-    df = _rows_to_df(rows)
-    if df.empty:
-        return df
-
-    # Validate columns
-    required = {"item", "unit", "city", "price", "quantity", "currency", "date"}
-    missing = required - set(df.columns.astype(str))
-    if missing:
-        print("❌ Expected columns missing in query result:", sorted(missing))
-        print("Columns I actually see:", list(df.columns))
-        print("Tip: delete data/prices.db, re-run init_db.py, then add prices again.")
-        sys.exit(1)
-
-    # Safe conversions
-    df["date"] = pd.to_datetime(df["date"], errors="coerce")
-    df["unit_price"] = df["price"] / df["quantity"].replace(0, pd.NA)
+
+    item_codes, item_names = _category_lookup(con, "SELECT id, name FROM item")
+    city_codes, cities = _category_lookup(con, "SELECT id, city FROM store")
+    item_id, store_id, day, unit = (np.concatenate([p[i] for p in parts]) for i in range(4))
+    ok = ~np.isnan(day) & ~np.isnan(unit)  # bad dates; no FX rate for the currency
+    df = pd.DataFrame({
+        "item": pd.Categorical.from_codes(item_codes[item_id[ok]], item_names),
+        "city": pd.Categorical.from_codes(city_codes[store_id[ok]], cities),
+        "date": day[ok].astype(np.int64),
+        "unit_price": unit[ok],
+    })
+    if with_currency:
+        df["currency"] = pd.api.types.union_categoricals([p[4] for p in parts])[ok]
     return df
 
-def plot_trend(df: pd.DataFrame, item: str, outdir: Path) -> Path | None:
-    dfi = df[df["item"].str.lower() == item.lower()].copy()
+def observed_trend(df: pd.DataFrame, item: str) -> pd.DataFrame:
+    """Daily mean unit price per city for one item, from a load_prices_df() frame."""
+    keys = [item_key(c) for c in df["item"].cat.categories]
+    dfi = df[df["item"].cat.codes.isin([i for i, k in enumerate(keys) if k == item_key(item)])]
     if dfi.empty:
-        return None
-    dfi = dfi.sort_values("date")
-    plt.figure()
-    for city, grp in dfi.groupby(dfi["city"].fillna("Unknown")):
-        plt.plot(grp["date"], grp["unit_price"], marker="o", label=city)
-    plt.title(f"Price Trend: {item} (per unit)")
-    plt.xlabel("Date")
-    plt.ylabel("Unit Price")
-    plt.legend()
-    plt.grid(True, alpha=0.3)
-    p = outdir / f"trend_{item.replace(' ','_').lower()}.png"
-    plt.tight_layout()
-    plt.savefig(p, dpi=150)
-    plt.close()
+        return pd.DataFrame()
+    city = dfi["city"].cat.add_categories([UNKNOWN_CITY]).fillna(UNKNOWN_CITY) \
+        if dfi["city"].isna().any() else dfi["city"]
+    pivot = dfi["unit_price"].groupby([dfi["date"], city], observed=True).mean().unstack()
+    pivot.index = pd.to_datetime(pivot.index, unit="D")
+    pivot.index.name = "day"
+    return pivot
+
+# Charts use the object-oriented Matplotlib API (Figure + Agg canvas), never pyplot's
+# global state, so they can be rendered concurrently in worker processes.
+def _save(fig: Figure, p: Path) -> Path:
+    fig.tight_layout()
+    fig.savefig(p, dpi=150)
     return p
 
-def plot_basket(df: pd.DataFrame, items: list[str], outdir: Path) -> Path | None:
-    dff = df[df["item"].str.lower().isin([x.lower() for x in items])].copy()
-    if dff.empty:
+MARKER_MAX_POINTS = 60  # series with more points are drawn as plain lines
+
+def plot_trend(pivot: pd.DataFrame, item: str, outdir: Path, currency: str = BASE_CURRENCY,
+               points: int = PIXELS, method: str = "lttb") -> Path | None:
+    """
+    Plot a (period x city) frame of unit prices, as returned by rollup.trend_frame,
+    downsampled to about `points` per city (0 draws every point).
+    """
+    if pivot.empty:
+        return None
+    pivot = downsample(pivot, points, method) if points else pivot
+    fig = Figure()
+    ax = fig.subplots()
+    for city in pivot.columns:
+        series = pivot[city].dropna()
+        marker = "o" if len(series) <= MARKER_MAX_POINTS else None
+        ax.plot(series.index, series.values, marker=marker, markersize=3, label=city)
+    ax.set_title(f"Price Trend: {item} (per unit, by {pivot.index.name})")
+    ax.set_xlabel("Date")
+    ax.set_ylabel(f"Unit Price ({currency})")
+    ax.legend()
+    ax.grid(True, alpha=0.3)
+    return _save(fig, outdir / f"trend_{slug(item)}.png")
+
+def plot_forecast(history: pd.DataFrame, fc: pd.DataFrame, item: str, outdir: Path,
+                  currency: str = BASE_CURRENCY) -> Path | None:
+    """History (period x city, from trend_frame) and forecast.forecast() rows with their 95% bands."""
+    if fc.empty:
         return None
-    latest = dff.sort_values("date").groupby(["city", "item"]).tail(1)
-    basket = latest.groupby("city")["unit_price"].sum().sort_values(ascending=False)
-    plt.figure()
-    basket.plot(kind="bar")
-    plt.title("Basket Cost by City (sum of latest unit prices)")
-    plt.xlabel("City")
-    plt.ylabel("Total Cost")
-    p = outdir / "basket_by_city.png"
-    plt.tight_layout()
-    plt.savefig(p, dpi=150)
-    plt.close()
+    history = downsample(history)
+    fig = Figure()
+    ax = fig.subplots()
+    for city, f in fc.groupby("city", sort=True):
+        line = None
+        if city in history.columns:
+            series = history[city].dropna()
+            line, = ax.plot(series.index, series.values, linewidth=1, label=city)
+        color = line.get_color() if line else None
+        ax.plot(f["period"], f["yhat"], linestyle="--", color=color, label=None if line else city)
+        ax.fill_between(f["period"], f["lo"], f["hi"], color=ax.get_lines()[-1].get_color(), alpha=0.2)
+    ax.set_title(f"Price Forecast: {item} (per unit, by {history.index.name or 'week'}, 95% band)")
+    ax.set_xlabel("Date")
+    ax.set_ylabel(f"Unit Price ({currency})")
+    ax.legend(fontsize="small")
+    ax.grid(True, alpha=0.3)
+    return _save(fig, outdir / f"forecast_{slug(item)}.png")
+
+def plot_index(pivot: pd.DataFrame, basket: str, outdir: Path) -> Path | None:
+    """Plot a (period x city) frame of chained index levels, as returned by price_index.index_frame."""
+    if pivot.empty:
+        return None
+    fig = Figure()
+    ax = fig.subplots()
+    for city in pivot.columns:
+        series = pivot[city].dropna()
+        ax.plot(series.index, series.values, linewidth=1, label=city)
+    ax.axhline(100, color="grey", linewidth=0.8, linestyle=":")
+    ax.set_title(f"Price Index: {basket} (chained, by {pivot.index.name}, first period = 100)")
+    ax.set_xlabel("Date")
+    ax.set_ylabel("Index")
+    ax.legend(fontsize="small", ncol=2 if len(pivot.columns) > 8 else 1)
+    ax.grid(True, alpha=0.3)
+    return _save(fig, outdir / f"index_{slug(basket)}.png")
+
+def plot_basket(items: list[str], outdir: Path, currency: str = BASE_CURRENCY) -> Path | None:
+    # Reads the materialized latest_price table: cost does not grow with history length.
+    rows = basket_by_city(connect(), items, currency)
+    if not rows:
+        return None
+    basket = pd.Series({r["city"]: r["total"] for r in rows})
+    fig = Figure()
+    ax = fig.subplots()
+    basket.plot(kind="bar", ax=ax)
+    ax.set_title("Basket Cost by City (sum of latest unit prices)")
+    ax.set_xlabel("City")
+    ax.set_ylabel(f"Total Cost ({currency})")
+    return _save(fig, outdir / "basket_by_city.png")
+
+def plot_nearby_basket(rows: list, outdir: Path, km: float, currency: str = BASE_CURRENCY) -> Path | None:
+    """Basket total at each store from geo.basket_nearby(), cheapest first."""
+    if not rows:
+        return None
+    totals = pd.Series({f"{r['store']} ({r['city']}, {r['km']:.1f} km)": r["total"] for r in rows})
+    fig = Figure()
+    ax = fig.subplots()
+    totals.iloc[::-1].plot(kind="barh", ax=ax)
+    ax.set_title(f"Cheapest Baskets within {km:g} km")
+    ax.set_xlabel(f"Total Cost ({currency})")
+    ax.set_ylabel("")
+    return _save(fig, outdir / "basket_nearby.png")
+
+def plot_city_basket(latest: pd.Series, city: str, outdir: Path) -> Path | None:
+    """Latest unit price of each basket item in one city (a Series indexed by item)."""
+    if latest.empty:
+        return None
+    fig = Figure()
+    ax = fig.subplots()
+    latest.sort_values(ascending=False).plot(kind="bar", ax=ax)
+    ax.set_title(f"Basket in {city} (total {latest.sum():.2f})")
+    ax.set_xlabel("Item")
+    ax.set_ylabel(f"Latest Unit Price ({BASE_CURRENCY})")
+    return _save(fig, outdir / f"basket_{slug(city)}.png")
+
+# -------- batch report --------
+CHART_VERSION = "3"  # bump when chart styling changes to force a re-render
+
+def slug(name: str) -> str:
+    return name.replace(" ", "_").lower()
+
+def fingerprint(data: pd.DataFrame | pd.Series, *extra: str) -> str:
+    """Content hash of the data behind a chart (values, index and labels)."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(pd.util.hash_pandas_object(data, index=True).values.tobytes())
+    h.update(repr(list(data.columns) if isinstance(data, pd.DataFrame) else data.name).encode())
+    h.update("|".join((CHART_VERSION, *extra)).encode())
+    return h.hexdigest()
+
+def _render(job: tuple) -> Path | None:
+    """Worker entry point: draw one chart, then record its fingerprint next to the PNG."""
+    fn, args, fp_path, fp = job
+    p = fn(*args)
+    if p is not None:
+        fp_path.write_text(fp, encoding="utf-8")
     return p
 
+def report(outdir: Path, items: list[str] | None = None, raw: bool = False,
+           workers: int | None = None, force: bool = False, exclude_anomalies: bool = False,
+           snapshot: bool = False, points: int = PIXELS, method: str = "lttb") -> tuple[int, int]:
+    """
+    Render a trend chart per item and a basket chart per city in a process pool.
+    Data is loaded once here (raw observations from the Parquet snapshot with `snapshot`);
+    workers only receive the small frames they draw.
+    Charts whose data fingerprint matches the `.fp` file beside the PNG are skipped.
+    Returns (rendered, skipped).
+    """
+    con = connect()
+    names = items or [r["name"] for r in q(con, "SELECT name FROM item ORDER BY name")]
+    obs = load_prices_df(names, exclude_anomalies=exclude_anomalies, snapshot=snapshot) if raw else None
+    jobs = []
+    for name in names:
+        pivot = observed_trend(obs, name) if raw and not obs.empty else \
+            pd.DataFrame() if raw else trend_frame(con, name, exclude_anomalies=exclude_anomalies)
+        if not pivot.empty:
+            fp = fingerprint(pivot, name, pivot.index.name, method, str(points))
+            pivot = downsample(pivot, points, method) if points else pivot  # workers get the reduced frame
+            jobs.append((plot_trend, (pivot, name, outdir, BASE_CURRENCY, 0), outdir / f"trend_{slug(name)}.png", fp))
+    latest = pd.DataFrame([dict(r) for r in latest_by_city(con, names)])
+    if not latest.empty:
+        for city, grp in latest.groupby("city"):
+            series = grp.set_index("item")["unit_price"].rename(city)
+            jobs.append((plot_city_basket, (series, city, outdir), outdir / f"basket_{slug(city)}.png",
+                         fingerprint(series, city)))
+
+    todo = []
+    for fn, args, png, fp in jobs:
+        fp_path = png.with_suffix(".png.fp")
+        if not force and png.exists() and fp_path.exists() and fp_path.read_text(encoding="utf-8") == fp:
+            continue
+        todo.append((fn, args, fp_path, fp))
+    if todo:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            list(pool.map(_render, todo, chunksize=max(1, len(todo) // (4 * (workers or os.cpu_count() or 1)))))
+    return len(todo), len(jobs) - len(todo)
+
 def main() -> None:
     ap = argparse.ArgumentParser(description="Generate charts from stored prices.")
     ap.add_argument("--item", action="append", help="Item name to plot trend (can repeat)")
     ap.add_argument("--basket", nargs="+", help="List of items to compare basket cost by city")
+    ap.add_argument("--start", help="First date of trend charts (YYYY-MM-DD)")
+    ap.add_argument("--end", help="Last date of trend charts (YYYY-MM-DD)")
+    ap.add_argument("--grain", choices=["day", "week", "month"], help="Trend period (default: from the date span)")
+    ap.add_argument("--median", action="store_true", help="Plot median instead of mean unit price")
+    ap.add_argument("--raw", action="store_true", help="Plot daily means from raw observations instead of rollups")
+    ap.add_argument("--forecast", type=int, nargs="?", const=0, metavar="PERIODS",
+                    help="With --item, chart a forecast with 95%% bands instead (default: 12 weeks, "
+                         "or 6 months with --grain month)")
+    ap.add_argument("--snapshot", action="store_true",
+                    help="Like --raw, but read observations from the Parquet snapshot (python src/snapshot.py)")
+    ap.add_argument("--points", type=int, default=PIXELS,
+                    help=f"Downsample trend lines to about this many points per city (default {PIXELS}, 0 = all)")
+    ap.add_argument("--downsample", choices=["lttb", "minmax"], default="lttb",
+                    help="lttb keeps the shape, minmax every bucket's low and high (default lttb)")
+    ap.add_argument("--exclude-anomalies", action="store_true",
+                    help="Leave observations flagged by anomaly.py out of trend charts")
+    ap.add_argument("--currency", default=BASE_CURRENCY, help="Currency of trend and basket charts (needs FX rates)")
+    ap.add_argument("--all-items", action="store_true",
+                    help="Report mode: trend chart for every item (or the --item list) plus a basket chart per city")
+    ap.add_argument("--workers", type=int, default=None, help="Processes for --all-items (default: all cores)")
+    ap.add_argument("--force", action="store_true", help="With --all-items, re-render charts whose data is unchanged")
+    ap.add_argument("--index", metavar="BASKET",
+                    help="Chart the chained price index of a basket defined with price_index.py (--grain week or month)")
+    ap.add_argument("--near", nargs=2, type=float, metavar=("LAT", "LON"),
+                    help="List stores near this point; with --basket, rank the cheapest stores for it instead")
+    ap.add_argument("--radius", type=float, default=5.0, help="Search radius for --near, in km")
+    ap.add_argument("--k", type=int, help="With --near, list the k nearest stores instead of all within --radius")
     ap.add_argument("--outdir", default=str(Path(__file__).resolve().parents[1] / "outputs"))
     args = ap.parse_args()
 
     out = ensure_outdir(Path(args.outdir))
-    df = load_prices_df()
-    if df.empty:
-        print("No data available. Add prices first.")
+    args.raw = args.raw or args.snapshot
+    if args.all_items:
+        t0 = time.perf_counter()
+        rendered, skipped = report(out, args.item, args.raw, args.workers, args.force, args.exclude_anomalies,
+                                   args.snapshot, args.points, args.downsample)
+        print(f"Report: {rendered} charts rendered, {skipped} unchanged, "
+              f"in {time.perf_counter() - t0:.1f}s -> {out}")
         return
-
     if args.item:
+        con = connect()
+        raw = load_prices_df(args.item, args.start, args.end, exclude_anomalies=args.exclude_anomalies,
+                             snapshot=args.snapshot) if args.raw else None
         for it in args.item:
-            p = plot_trend(df, it, out)
+            if args.forecast is not None:
+                from forecast import forecast
+                grain = "month" if args.grain == "month" else "week"
+                history = trend_frame(con, it, args.start, args.end, grain, "mean", args.currency,
+                                      args.exclude_anomalies)
+                p = plot_forecast(history, forecast(con, it, grain, args.forecast or None, args.currency),
+                                  it, out, args.currency)
+                print(f"Forecast saved: {p}" if p else f"Not enough data to forecast '{it}'")
+                continue
+            if raw is not None:
+                pivot = observed_trend(raw, it) if not raw.empty else pd.DataFrame()
+                pivot = from_base(con, pivot, args.currency) if not pivot.empty else pivot
+            else:
+                pivot = trend_frame(con, it, args.start, args.end, args.grain, "median" if args.median else "mean",
+                                    args.currency, args.exclude_anomalies)
+            p = plot_trend(pivot, it, out, args.currency, args.points, args.downsample)
             print(f"Trend saved: {p}" if p else f"No data for item '{it}'")
-    if args.basket:
-        p = plot_basket(df, args.basket, out)
+    if args.index:
+        from price_index import index_frame
+
+        try:
+            pivot = index_frame(connect(), args.index, "week" if args.grain == "week" else "month")
+        except ValueError as e:
+            raise SystemExit(f"❌ {e}")
+        p = plot_index(pivot, args.index, out)
+        if p:
+            latest = pivot.ffill().iloc[-1].sort_values(ascending=False)
+            print(f"Index saved: {p} (latest: " + ", ".join(f"{c} {v:.1f}" for c, v in latest.items()) + ")")
+        else:
+            print(f"No data for basket '{args.index}'")
+    if args.near:
+        from tabulate import tabulate
+        import geo
+
+        con, (lat, lon) = connect(), args.near
+        if args.basket:
+            rows = geo.basket_nearby(con, lat, lon, args.radius, args.basket, args.currency)
+            p = plot_nearby_basket(rows, out, args.radius, args.currency)
+            print(f"Nearby basket saved: {p}" if p else f"No store within {args.radius:g} km has the whole basket.")
+        else:
+            rows = geo.nearest(con, lat, lon, args.k) if args.k else geo.within(con, lat, lon, args.radius)
+        if rows:
+            print(tabulate([dict(r) for r in rows], headers="keys", tablefmt="github", floatfmt=".2f"))
+        elif not args.basket:
+            print(f"No stores with coordinates within {args.radius:g} km.")
+    elif args.basket:
+        p = plot_basket(args.basket, out, args.currency)
         print(f"Basket saved: {p}" if p else "No data for selected basket.")
 
 if __name__ == "__main__":
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Streaming price-anomaly detection per (item, city).
+
+Each series keeps an exponentially weighted mean and variance of ln(unit price) in
+`anomaly_state`. update() reads the price rows above its watermark, scores every
+observation against its series' state as it was just before it arrived, writes the
+ones more than Z_MAX standard deviations away to `anomaly`, and folds them in: cost
+O(1) per new observation, history is never rescanned. Log space makes a misplaced
+decimal point (x10) or a wrong unit (x1000) the same size at any price level.
+
+update() runs inside rollup.refresh(), so imports, add_price.py, the app and the
+ingestion service all keep it current. A backfill resets the state and replays the
+full history, archives included, in id order: many series are advanced one
+observation per step with NumPy, and the result is identical to the streaming one.
+
+    python src/anomaly.py --backfill
+    python src/anomaly.py --list 20
+"""
+from __future__ import annotations
+import argparse
+import math
+import sqlite3
+import numpy as np
+from db import connect, execute, executemany, item_key, q, transaction
+from fx import base_price_sql
+from rollup import UNKNOWN_CITY, set_watermark, watermark
+
+ALPHA = 0.05        # EWMA weight of a new observation (~40 observations of memory)
+WARMUP = 8          # observations per series before anything is flagged
+Z_MAX = 4.0         # flag beyond this many standard deviations
+MIN_SD = 0.05       # floor on the std dev of ln(price), so steady series don't flag small changes
+CHUNK_IDS = 1_000_000  # price ids read per pass
+
+def _scan(n: np.ndarray, mean: np.ndarray, var: np.ndarray, slot: np.ndarray,
+          x: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Advance the series states (n, mean, var; indexed by slot, updated in place) over the
+    observations x of series `slot`, given in arrival order. Returns (z, expected mean)
+    per observation, z = NaN while its series warms up.
+
+    Observation k of every series is processed in the same vectorized step, so the number
+    of steps is the longest run of one series, not the number of rows. Values are clipped
+    to mean ± Z_MAX·sd before being folded in: a bad entry barely moves the baseline,
+    while a real price change is followed within a few observations.
+    """
+    z, expected = np.full(len(x), np.nan), np.empty(len(x))
+    if not len(x):
+        return z, expected
+    order = np.lexsort((np.arange(len(x)), slot))  # by series, then arrival
+    first = np.r_[True, slot[order][1:] != slot[order][:-1]]
+    starts = np.flatnonzero(first)
+    rank = np.empty(len(x), dtype=np.int64)
+    rank[order] = np.arange(len(x)) - np.repeat(starts, np.diff(np.r_[starts, len(x)]))
+    by_rank = np.argsort(rank, kind="stable")
+    bounds = np.r_[0, np.cumsum(np.bincount(rank))]
+    for a, b in zip(bounds[:-1], bounds[1:]):
+        idx = by_rank[a:b]
+        s, xi = slot[idx], x[idx]
+        ni, mi, vi = n[s], mean[s], var[s]
+        sd = np.maximum(np.sqrt(vi), MIN_SD)
+        warm = ni >= WARMUP
+        z[idx] = np.where(warm, (xi - mi) / sd, np.nan)
+        expected[idx] = mi
+        d = np.where(warm, np.clip(xi, mi - Z_MAX * sd, mi + Z_MAX * sd), xi) - mi
+        w = np.maximum(ALPHA, 1.0 / (ni + 1))  # plain running mean/variance during warm-up
+        mean[s] = mi + w * d
+        var[s] = (1 - w) * (vi + w * d * d)
+        n[s] = ni + 1
+    return z, expected
+
+# unit price exactly as rollup.refresh() computes it, so excluded rows subtract cleanly
+_ROWS_SQL = f"""
+    SELECT id, item_id, city, day, u FROM (
+      SELECT p.id, p.item_id, COALESCE(s.city, '{UNKNOWN_CITY}') AS city, date(p.date) AS day,
+             {base_price_sql()} / NULLIF(p.quantity, 0) AS u
+      FROM {{price}} p
+      LEFT JOIN store s ON s.id = p.store_id
+      WHERE p.id > ? AND p.id <= ?
+    )
+    WHERE u > 0 AND day IS NOT NULL
+    ORDER BY id
+"""
+
+def _rows(con: sqlite3.Connection, lo: int, hi: int, archives: bool = False) -> list[tuple]:
+    """(id, item_id, city, day, unit price) of price rows lo < id <= hi, in id order."""
+    from partitions import archived_rows
+
+    cur = con.cursor()
+    cur.row_factory = None
+    rows = cur.execute(_ROWS_SQL.format(price="main.price"), (lo, hi)).fetchall()
+    if archives:
+        rows = sorted(rows + archived_rows(con, _ROWS_SQL, (lo, hi)))
+    return rows
+
+def update(con: sqlite3.Connection, archives: bool = False) -> int:
+    """
+    Score and fold in price rows added since the last update; returns the number flagged.
+    Run it inside the write transaction that inserted them (rollup.refresh() does).
+    archives=True also replays the archived partitions, merged in id order (backfill()).
+    """
+    from partitions import max_id
+
+    lo = watermark(con, "anomaly")
+    hi = max_id(con, archives)
+    if hi <= lo:
+        return 0
+    flagged = 0
+    for a in range(lo, hi, CHUNK_IDS):
+        rows = _rows(con, a, min(a + CHUNK_IDS, hi), archives)
+        if not rows:
+            continue
+        # Plain dicts and arrays: a single new row must cost well under a millisecond.
+        slots: dict[tuple[int, str], int] = {}
+        slot = np.fromiter((slots.setdefault((r[1], r[2]), len(slots)) for r in rows), np.int64, len(rows))
+        state = {(r[0], r[1]): tuple(r)[2:] for r in execute(con, f"""
+            SELECT item_id, city, n, mean, var FROM anomaly_state
+            WHERE item_id IN ({",".join(str(i) for i in {k[0] for k in slots})})""")}
+        known = [state.get(k, (0, 0.0, 0.0)) for k in slots]
+        n = np.array([s[0] for s in known], dtype=np.int64)
+        mean = np.array([s[1] for s in known], dtype=np.float64)
+        var = np.array([s[2] for s in known], dtype=np.float64)
+        z, expected = _scan(n, mean, var, slot, np.log(np.fromiter((r[4] for r in rows), np.float64, len(rows))))
+        executemany(con, """
+            INSERT INTO anomaly_state(item_id, city, n, mean, var) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(item_id, city) DO UPDATE SET n = excluded.n, mean = excluded.mean, var = excluded.var
+        """, ((*k, *s) for k, s in zip(slots, zip(n.tolist(), mean.tolist(), var.tolist()))))
+        hit = np.flatnonzero(np.abs(np.nan_to_num(z)) > Z_MAX)
+        executemany(con, """
+            INSERT OR REPLACE INTO anomaly(price_id, item_id, city, day, unit_price, expected, z)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, ((*rows[i], math.exp(expected[i]), float(z[i])) for i in hit.tolist()))
+        flagged += len(hit)
+    set_watermark(con, "anomaly", hi)
+    return flagged
+
+def reset(con: sqlite3.Connection) -> None:
+    """Forget all series state and flags; the next update() replays the history."""
+    con.execute("DELETE FROM anomaly")
+    con.execute("DELETE FROM anomaly_state")
+    set_watermark(con, "anomaly", 0)
+
+def backfill(con: sqlite3.Connection) -> int:
+    """Recompute state and flags from the full history, archived partitions included."""
+    reset(con)
+    return update(con, archives=True)
+
+def recent(con: sqlite3.Connection, limit: int = 20, item: str | None = None) -> list[sqlite3.Row]:
+    """Latest flagged observations, newest first."""
+    return q(con, f"""
+        SELECT a.day AS date, i.name AS item, a.city, a.unit_price, a.expected,
+               a.unit_price / a.expected AS ratio, a.z, a.price_id
+        FROM anomaly a JOIN item i ON i.id = a.item_id
+        {"WHERE i.name_key = ?" if item else ""}
+        ORDER BY a.day DESC, a.price_id DESC
+        LIMIT ?
+    """, ((item_key(item),) if item else ()) + (limit,))
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Flag price observations far from their (item, city) history.")
+    ap.add_argument("--backfill", action="store_true", help="Recompute every flag from the full history")
+    ap.add_argument("--list", type=int, nargs="?", const=20, metavar="N", help="Show the N latest flags")
+    ap.add_argument("--item", help="With --list, only this item")
+    args = ap.parse_args()
+
+    con = connect()
+    with transaction(con):
+        n = backfill(con) if args.backfill else update(con)
+    total = con.execute("SELECT COUNT(*) FROM anomaly").fetchone()[0]
+    print(f"Anomalies {'recomputed' if args.backfill else 'updated'}: {n} new flags, {total} in total ✅")
+    if args.list:
+        from tabulate import tabulate
+        rows = recent(con, args.list, args.item)
+        if rows:
+            print(tabulate([dict(r) for r in rows], headers="keys", tablefmt="github", floatfmt=".3g"))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Cached data access for the Streamlit app.
+
+Streamlit reruns the whole script on every widget interaction. Every loader here is
+wrapped in st.cache_data and takes the current `version` as its first argument, so a
+rerun that changes nothing costs one cheap version query instead of re-reading tables.
+The version is built from the max ids of price/item/store (index lookups), their
+update/delete counters in table_stats and the FX rate table's fingerprint, so it
+moves with every write from any process: CLI imports, edits, archiving and rate loads.
+"""
+from __future__ import annotations
+import pandas as pd
+import streamlit as st
+from db import connect, migrate, q
+from downsample import PIXELS, downsample
+from forecast import forecast as forecast_item
+from fx import currencies, rates_version
+from geo import basket_nearby, within
+from latest_price import basket_by_city
+from partitions import newest
+from price_index import baskets, index_frame
+from rollup import trend_frame
+
+PAGE_SIZE = 50
+
+@st.cache_resource(show_spinner=False)
+def ensure_schema() -> bool:
+    """Bring the database up to date once per server process."""
+    migrate(connect(check_schema=False))
+    return True
+
+def data_version() -> tuple:
+    con = connect()
+    row = con.execute("""
+        SELECT (SELECT COALESCE(MAX(id), 0) FROM price),
+               (SELECT COALESCE(MAX(id), 0) FROM item),
+               (SELECT COALESCE(MAX(id), 0) FROM store),
+               (SELECT SUM(changes) FROM table_stats)
+    """).fetchone()
+    return tuple(row) + rates_version(con)
+
+def _df(rows) -> pd.DataFrame:
+    return pd.DataFrame([dict(r) for r in rows]) if rows else pd.DataFrame()
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def item_choices(version) -> list[tuple[int, str, str]]:
+    return [tuple(r) for r in q(connect(), "SELECT id, name, unit FROM item ORDER BY name")]
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def store_choices(version) -> list[tuple[int, str, str | None]]:
+    return [tuple(r) for r in q(connect(), "SELECT id, name, city FROM store ORDER BY name")]
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def currency_choices(version) -> list[str]:
+    return currencies(connect())
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def table_count(version, table: str) -> int:
+    """
+    Rows in a table, for the pagers. The version moves on every save, so `price` is not
+    counted (a full scan at millions of rows): its rows come from the trigger-kept
+    table_stats, plus the archived partitions' row counts.
+    """
+    con = connect()
+    if table == "price":
+        return con.execute("""SELECT (SELECT n FROM table_stats WHERE name = 'price')
+                                     + (SELECT COALESCE(SUM(rows), 0) FROM price_partition)""").fetchone()[0]
+    return con.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def items_page(version, page: int, page_size: int = PAGE_SIZE) -> pd.DataFrame:
+    return _df(q(connect(), "SELECT * FROM item ORDER BY name LIMIT ? OFFSET ?", (page_size, page * page_size)))
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def stores_page(version, page: int, page_size: int = PAGE_SIZE) -> pd.DataFrame:
+    return _df(q(connect(), "SELECT * FROM store ORDER BY name LIMIT ? OFFSET ?", (page_size, page * page_size)))
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def recent_prices_page(version, page: int, page_size: int = PAGE_SIZE) -> pd.DataFrame:
+    # Walks idx_price_date backwards in each file (archives only when the page reaches them):
+    # cost depends on page depth, not on table size.
+    return _df(newest(connect(), """
+        SELECT
+          p.id,
+          i.name  AS item,
+          i.unit  AS unit,
+          s.name  AS store,
+          s.city  AS city,
+          p.price AS price,
+          p.currency AS currency,
+          p.quantity AS quantity,
+          p.date AS date
+        FROM {price} p
+        LEFT JOIN item  i ON i.id = p.item_id
+        LEFT JOIN store s ON s.id = p.store_id
+        ORDER BY p.date DESC, p.id DESC
+    """, limit=page_size, offset=page * page_size))
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def trend(version, item: str, start: str | None, end: str | None, grain: str | None, stat: str,
+          currency: str | None = None, exclude_anomalies: bool = False, points: int = PIXELS) -> pd.DataFrame:
+    # Downsampled here so the cache, and the chart payload, hold at most about `points` per city.
+    return downsample(trend_frame(connect(), item, start, end, grain, stat, currency, exclude_anomalies), points)
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def forecast(version, item: str, grain: str, currency: str | None = None) -> pd.DataFrame:
+    # Refits (and stores) only this item's series whose rollup cells changed since the last fit.
+    return forecast_item(connect(), item, grain, currency=currency)
+
+def index_baskets() -> dict[str, str]:
+    """Defined index baskets (name -> "item=weight, ..."); not cached, as defining one moves no id."""
+    return {r["name"]: r["items"] for r in baskets(connect())}
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def price_index(version, basket: str, definition: str, grain: str, min_coverage: float) -> pd.DataFrame:
+    # `definition` is part of the cache key so a redefined basket is recomputed.
+    return index_frame(connect(), basket, grain, min_coverage)
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def basket(version, items: tuple[str, ...], currency: str) -> pd.Series:
+    rows = basket_by_city(connect(), list(items), currency)
+    return pd.Series({r["city"]: r["total"] for r in rows}, name="unit_price", dtype=float)
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def store_center(version) -> tuple[float, float] | None:
+    """Mean position of the stores with coordinates (the Nearby view's default), or None."""
+    lat, lon = connect().execute("""SELECT AVG(latitude), AVG(longitude) FROM store
+                                    WHERE latitude IS NOT NULL AND longitude IS NOT NULL""").fetchone()
+    return None if lat is None else (lat, lon)
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def stores_near(version, lat: float, lon: float, km: float) -> pd.DataFrame:
+    return _df(within(connect(), lat, lon, km))
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def basket_near(version, lat: float, lon: float, km: float, items: tuple[str, ...], currency: str) -> pd.DataFrame:
+    return _df(basket_nearby(connect(), lat, lon, km, list(items), currency))
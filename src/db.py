@@ -1,25 +1,289 @@
 #!/usr/bin/env python3
 from __future__ import annotations
+import atexit
+import json
+import logging
+import os
+import re
 import sqlite3
+import threading
+import time
+import unicodedata
+from collections import deque
+from contextlib import contextmanager
+from functools import lru_cache
 from pathlib import Path
+from typing import Iterable, Iterator
 
-DB_PATH = Path(__file__).resolve().parents[1] / "data" / "prices.db"
+DB_PATH = Path(os.environ.get("PRICE_TRACKER_DB") or Path(__file__).resolve().parents[1] / "data" / "prices.db")
+SCHEMA_PATH = Path(__file__).resolve().parent / "schema.sql"
+SCHEMA_VERSION = 2  # stored in PRAGMA user_version by migrate(); bump when schema.sql or migrate() changes
 
-def connect(db_path: Path | None = None) -> sqlite3.Connection:
-    p = db_path or DB_PATH
+BUSY_TIMEOUT_S = 30.0
+CACHED_STATEMENTS = 256
+PRAGMAS = (
+    "PRAGMA foreign_keys = ON",
+    "PRAGMA journal_mode = WAL",       # readers no longer block the writer (and vice versa)
+    "PRAGMA synchronous = NORMAL",     # durable at checkpoints; safe with WAL
+    "PRAGMA cache_size = -65536",      # 64 MiB page cache
+    "PRAGMA mmap_size = 268435456",    # 256 MiB memory-mapped reads
+    "PRAGMA temp_store = MEMORY",
+)
+
+class Connection(sqlite3.Connection):
+    """sqlite3 connection that knows when it is inside db.transaction()."""
+    batch_depth = 0
+
+    def __exit__(self, exc_type, exc, tb):
+        # `with connect() as con:` inside a transaction() block must not commit early.
+        if self.batch_depth:
+            return False
+        return super().__exit__(exc_type, exc, tb)
+
+_local = threading.local()
+
+def open_connection(db_path: Path | None = None) -> Connection:
+    """Open a new, unshared, tuned connection (use connect() for the per-thread one)."""
+    p = Path(db_path or DB_PATH)
     p.parent.mkdir(parents=True, exist_ok=True)
-    con = sqlite3.connect(p)
+    con = sqlite3.connect(p, timeout=BUSY_TIMEOUT_S, cached_statements=CACHED_STATEMENTS, factory=Connection)
     con.row_factory = sqlite3.Row
-    con.execute("PRAGMA foreign_keys = ON;")
+    for pragma in PRAGMAS:
+        con.execute(pragma)
     return con
 
+def connect(db_path: Path | None = None, check_schema: bool = True) -> Connection:
+    """
+    Return this thread's connection to `db_path`, opening it on first use.
+    Connections are never shared across threads, and a forked child opens its own.
+    A newly opened connection is checked against SCHEMA_VERSION (see require_schema());
+    callers that are about to migrate() pass check_schema=False.
+    """
+    if getattr(_local, "pid", None) != os.getpid():
+        _local.pool, _local.pid = {}, os.getpid()
+    key = str(Path(db_path or DB_PATH).resolve())
+    con = _local.pool.get(key)
+    if con is None:
+        con = open_connection(db_path)
+        if check_schema:
+            require_schema(con)
+        _local.pool[key] = con
+    return con
+
+def close_all() -> None:
+    """Close the calling thread's pooled connections."""
+    for con in getattr(_local, "pool", {}).values():
+        con.close()
+    _local.pool = {}
+
+@contextmanager
+def transaction(con: Connection | None = None) -> Iterator[Connection]:
+    """
+    Group several writes into one transaction (qi() stops committing inside it).
+    Takes the write lock up front (BEGIN IMMEDIATE) so concurrent writers queue on
+    busy_timeout instead of failing with "database is locked". Nested blocks join the outer one.
+    """
+    con = con or connect()
+    outer = con.batch_depth == 0
+    if outer:
+        if con.in_transaction:
+            con.commit()
+        con.execute("BEGIN IMMEDIATE")
+    con.batch_depth += 1
+    try:
+        yield con
+    except BaseException:
+        con.batch_depth -= 1
+        if outer:
+            con.rollback()
+        raise
+    con.batch_depth -= 1
+    if outer:
+        con.commit()
+
 def exec_script(con: sqlite3.Connection, sql_path: Path) -> None:
     con.executescript(sql_path.read_text(encoding="utf-8"))
 
+def require_schema(con: sqlite3.Connection) -> None:
+    """Exit with a hint, rather than fail later on a missing table or column, if the database predates the code."""
+    if con.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+        path = con.execute("PRAGMA database_list").fetchone()[2]
+        raise SystemExit(f"❌ The database {path} needs to be created or updated: run python src/init_db.py")
+
+def ensure_column(con: sqlite3.Connection, table: str, column: str, decl: str) -> bool:
+    """Add the column if missing; returns True if it was added."""
+    cols = {r[1] for r in con.execute(f"PRAGMA table_info({table})")}
+    if column not in cols:
+        con.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+        return True
+    return False
+
+def item_key(name: str) -> str:
+    """Lookup key for item names: Unicode NFKC, case-folded, whitespace collapsed ("  MILK " -> "milk")."""
+    return " ".join(unicodedata.normalize("NFKC", name).casefold().split())
+
+def normalize_item_keys(con: sqlite3.Connection) -> int:
+    """
+    Fill item.name_key where missing. Items whose key is already taken ("Milk" vs "milk ")
+    are merged into the existing one: their prices are moved over and the duplicate deleted.
+    Returns the number of merged items.
+    """
+    rows = con.execute("SELECT id, name FROM item WHERE name_key IS NULL ORDER BY id").fetchall()
+    if not rows:
+        return 0
+    owner = {k: i for i, k in con.execute("SELECT id, name_key FROM item WHERE name_key IS NOT NULL")}
+    merged = 0
+    for item_id, name in rows:
+        key = item_key(name)
+        canon = owner.get(key)
+        if canon is None:
+            con.execute("UPDATE item SET name_key=? WHERE id=?", (key, item_id))
+            owner[key] = item_id
+            continue
+        # obs_hash includes item_id: clear it so the next incremental import re-hashes these rows
+        con.execute("UPDATE price SET item_id=?, obs_hash=NULL WHERE item_id=?", (canon, item_id))
+        con.execute("DELETE FROM item WHERE id=?", (item_id,))
+        merged += 1
+    if merged:
+        from rollup import rebuild as rebuild_rollups
+        rebuild_rollups(con)
+    return merged
+
+def migrate(con: sqlite3.Connection) -> None:
+    """Create missing tables and bring older databases up to the current schema. Idempotent."""
+    recount = con.execute("SELECT 1 FROM sqlite_master WHERE name = 'trg_price_count_insert'").fetchone() is None
+    exec_script(con, SCHEMA_PATH)
+    ensure_column(con, "price", "obs_hash", "TEXT")
+    ensure_column(con, "item", "name_key", "TEXT")
+    if ensure_column(con, "price", "price_base", "REAL"):
+        from fx import fill_price_base
+        fill_price_base(con)
+    normalize_item_keys(con)
+    # Indexes on columns added after the first release live here, not in schema.sql,
+    # because schema.sql runs before the columns exist on old databases.
+    con.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_price_obs_hash ON price(obs_hash)")
+    con.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_item_name_key ON item(name_key)")
+    from geo import ensure_index as ensure_geo_index
+    ensure_geo_index(con)  # R*Tree over store coordinates (skipped on builds without R*Tree)
+    # Derived tables start empty on databases created before them: fill once from history.
+    from latest_price import rebuild as rebuild_latest
+    from rollup import refresh as refresh_rollups
+    if con.execute("SELECT 1 FROM latest_price LIMIT 1").fetchone() is None:
+        rebuild_latest(con)
+    refresh_rollups(con)  # catches up from the stored watermark (all history on first run)
+    if recount:  # a database from before table_stats, or a bulk load that dropped the trigger
+        con.execute("UPDATE table_stats SET n = (SELECT COUNT(*) FROM price) WHERE name = 'price'")
+    con.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    con.commit()
+
+# -------- query instrumentation (opt-in) --------
+log = logging.getLogger("price_tracker.sql")
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_CREATE_AS = re.compile(r"^\s*CREATE\s+(?:TEMP(?:ORARY)?\s+)?TABLE\s+\S+\s+AS\s+", re.IGNORECASE)
+
+@lru_cache(maxsize=1024)
+def normalize_sql(sql: str) -> str:
+    """Statement shape used to aggregate stats: literals -> ?, IN (?, ?, ...) -> (?...), whitespace collapsed."""
+    return _IN_LISTS.sub("(?...)", _LITERALS.sub("?", " ".join(sql.split())))
+
+class QueryStats:
+    """Per-statement call counts, timings and row counts, plus recent slow queries with their plans."""
+
+    def __init__(self, slow_ms: float = 100.0):
+        self.enabled = False
+        self.slow_ms = slow_ms
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.by_sql: dict[str, dict] = {}
+            self.slow: deque[dict] = deque(maxlen=50)
+
+    def record(self, con: sqlite3.Connection, sql: str, params, seconds: float, rows: int | None,
+               many: bool = False) -> None:
+        key = normalize_sql(sql)
+        with self._lock:
+            s = self.by_sql.get(key)
+            if s is None:
+                s = self.by_sql[key] = {"calls": 0, "total_ms": 0.0, "max_ms": 0.0, "rows": 0}
+            ms = seconds * 1000
+            s["calls"] += 1
+            s["total_ms"] += ms
+            s["max_ms"] = max(s["max_ms"], ms)
+            s["rows"] += max(rows or 0, 0)
+        if ms >= self.slow_ms:
+            plan = explain(con, sql, None if many else params)
+            self.slow.append({"sql": key, "ms": round(ms, 3), "plan": plan,
+                              "at": time.strftime("%Y-%m-%dT%H:%M:%S")})
+            log.warning("slow query (%.1f ms): %s\n%s", ms, key, "\n".join(plan) or "(no table access to plan)")
+
+    def snapshot(self) -> dict:
+        """Stats sorted by total time, as plain JSON-serializable data."""
+        with self._lock:
+            rows = [{"sql": k, **v, "mean_ms": v["total_ms"] / v["calls"]} for k, v in self.by_sql.items()]
+            slow = list(self.slow)
+        return {"slow_ms": self.slow_ms, "statements": sorted(rows, key=lambda r: -r["total_ms"]), "slow": slow}
+
+    def dump(self, path: Path) -> None:
+        Path(path).write_text(json.dumps(self.snapshot(), indent=2) + "\n", encoding="utf-8")
+
+STATS = QueryStats()
+
+def explain(con: sqlite3.Connection, sql: str, params=None) -> list[str]:
+    """EXPLAIN QUERY PLAN lines for a statement (NULL parameters when the real ones are not at hand)."""
+    sql = _CREATE_AS.sub("", sql)  # the table exists by now: explain its SELECT
+    if params is None:
+        params = (None,) * sql.count("?")
+    try:
+        return [r[-1] for r in con.execute("EXPLAIN QUERY PLAN " + sql, params)]
+    except sqlite3.Error as e:
+        return [f"(no plan: {e})"]
+
+def enable_stats(slow_ms: float | None = None, dump_path: Path | None = None) -> QueryStats:
+    """Start collecting stats for q()/qi()/execute()/executemany(); optionally write them as JSON at exit."""
+    if slow_ms is not None:
+        STATS.slow_ms = slow_ms
+    STATS.enabled = True
+    if dump_path:
+        atexit.register(STATS.dump, Path(dump_path))
+    return STATS
+
+# PRICE_TRACKER_SQL_STATS=1 turns stats on; a *.json value also dumps them there at exit.
+if os.environ.get("PRICE_TRACKER_SQL_STATS"):
+    _target = os.environ["PRICE_TRACKER_SQL_STATS"]
+    enable_stats(float(os.environ.get("PRICE_TRACKER_SLOW_MS", STATS.slow_ms)),
+                 _target if _target.endswith(".json") else None)
+
+def execute(con: sqlite3.Connection, sql: str, params=()) -> sqlite3.Cursor:
+    """con.execute() that is timed when stats are enabled (no commit; see qi())."""
+    if not STATS.enabled:
+        return con.execute(sql, params)
+    t0 = time.perf_counter()
+    cur = con.execute(sql, params)
+    STATS.record(con, sql, params, time.perf_counter() - t0, cur.rowcount)
+    return cur
+
+def executemany(con: sqlite3.Connection, sql: str, seq: Iterable) -> sqlite3.Cursor:
+    if not STATS.enabled:
+        return con.executemany(sql, seq)
+    t0 = time.perf_counter()
+    cur = con.executemany(sql, seq)
+    STATS.record(con, sql, None, time.perf_counter() - t0, cur.rowcount, many=True)
+    return cur
+
 def q(con: sqlite3.Connection, sql: str, params: tuple = ()) -> list[sqlite3.Row]:
-    return con.execute(sql, params).fetchall()
+    if not STATS.enabled:
+        return con.execute(sql, params).fetchall()
+    t0 = time.perf_counter()
+    rows = con.execute(sql, params).fetchall()  # time includes the fetch: that is where SELECTs run
+    STATS.record(con, sql, params, time.perf_counter() - t0, len(rows))
+    return rows
 
 def qi(con: sqlite3.Connection, sql: str, params: tuple = ()) -> sqlite3.Cursor:
-    cur = con.execute(sql, params)
-    con.commit()
+    cur = execute(con, sql, params)
+    if not getattr(con, "batch_depth", 0):
+        con.commit()
     return cur
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Price forecasts for every (item, city) series, fitted all at once.
+
+The weekly (or monthly) rollups, minus the observations anomaly.py flagged, form a
+dense series x period matrix of log mean unit price. Every series gets the same
+model, a linear trend plus yearly Fourier terms, fitted by weighted least squares
+(weights: observations per period). All series are solved in one batched NumPy
+call. The seasonal terms are shrunk toward zero, so a series with under a year
+of data falls back to its trend.
+
+Coefficients are stored in `forecast_model` with a fingerprint of the cells they
+were fitted on; fit() refits only the series whose cells changed since. forecast()
+fits without the write lock and stores the new fits only if any series changed.
+
+    python src/forecast.py                        # fit or refresh every series
+    python src/forecast.py --item Milk --horizon 8
+    python src/analytics.py --item Milk --forecast
+"""
+from __future__ import annotations
+import argparse
+import hashlib
+import time
+from datetime import date
+import numpy as np
+import pandas as pd
+from db import connect, execute, executemany, item_key, q, transaction
+from rollup import cell_frame
+
+MODEL_VERSION = 1     # part of every fingerprint: bump when the model below changes
+HARMONICS = 2         # yearly sine/cosine pairs
+SEASON_RIDGE = 1.0    # penalty on seasonal terms, in units of one well-observed period
+MIN_PERIODS = 4       # series observed in fewer periods get no model
+BAND_Z = 1.96         # 95% prediction band
+HORIZON = {"week": 12, "month": 6}
+FREQ = {"week": "W-MON", "month": "MS"}
+N_COEF = 2 + 2 * HARMONICS
+EPOCH = date(2000, 1, 1)
+
+def _years(periods) -> np.ndarray:
+    """Period starts (ISO strings or datetimes) as years since EPOCH."""
+    days = (pd.to_datetime(pd.Index(periods)) - pd.Timestamp(EPOCH)).days
+    return np.asarray(days, dtype=np.float64) / 365.25
+
+def _design(t: np.ndarray, center: np.ndarray) -> np.ndarray:
+    """(series x periods x N_COEF): intercept, trend (years from the series' center), then Fourier terms."""
+    t = np.broadcast_to(t, (len(center), t.shape[-1]))
+    cols = [np.ones_like(t), t - center[:, None]]
+    for k in range(1, HARMONICS + 1):
+        cols += [np.sin(2 * np.pi * k * t), np.cos(2 * np.pi * k * t)]
+    return np.stack(cols, axis=-1)
+
+def _penalty() -> np.ndarray:
+    return np.diag([0.0, 1e-9] + [SEASON_RIDGE] * (2 * HARMONICS))
+
+def fit_batch(t: np.ndarray, y: np.ndarray, w: np.ndarray) -> dict[str, np.ndarray]:
+    """
+    Fit all series at once. t: (periods,) in years; y: (series x periods) log price
+    (anything where w == 0); w: observation counts. Returns center, coef, inv (the
+    inverse normal matrix, for bands) and sigma (residual sd), one entry per series.
+    """
+    m = (w > 0).sum(axis=1)
+    w = w / np.where(m > 0, w.sum(axis=1) / np.maximum(m, 1), 1.0)[:, None]  # mean weight 1 over observed periods
+    y = np.where(w > 0, y, 0.0)
+    center = (w * t).sum(axis=1) / np.maximum(w.sum(axis=1), 1e-12)
+    X = _design(t, center)
+    XtW = (X * w[..., None]).transpose(0, 2, 1)  # batched matmuls run in BLAS, unlike einsum
+    inv = np.linalg.inv(XtW @ X + _penalty())
+    coef = (inv @ (XtW @ y[..., None]))[..., 0]
+    resid = y - (X @ coef[..., None])[..., 0]
+    sigma = np.sqrt((w * resid ** 2).sum(axis=1) / np.maximum(m - N_COEF, 1))
+    return {"center": center, "coef": coef, "inv": inv, "sigma": sigma}
+
+def predict(t: np.ndarray, center: np.ndarray, coef: np.ndarray, inv: np.ndarray,
+            sigma: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(yhat, lo, hi) unit prices (series x periods) at times t, with BAND_Z prediction bands."""
+    X = _design(t, center)
+    mu = (X @ coef[..., None])[..., 0]
+    se = sigma[:, None] * np.sqrt(1 + ((X @ inv) * X).sum(axis=-1))
+    return np.exp(mu), np.exp(mu - BAND_Z * se), np.exp(mu + BAND_Z * se)
+
+def _fingerprints(con, grain: str, item_ids: list[int] | None) -> dict[tuple[int, str], str | None]:
+    """
+    Per-series digest of its rollup cells and flags at `grain`, from a few aggregates
+    computed in SQL (count, sums, period-weighted sums), so unchanged series cost one
+    grouped scan instead of reading every cell. None for series under MIN_PERIODS periods.
+    """
+    ids = f"AND item_id IN ({','.join(map(str, item_ids))})" if item_ids else ""
+    flags = {(r[0], r[1]): tuple(r)[2:] for r in execute(con, f"""
+        SELECT item_id, city, COUNT(*), SUM(unit_price), SUM(unit_price * julianday(day))
+        FROM anomaly WHERE 1 {ids} GROUP BY item_id, city""")}
+    out = {}
+    for r in execute(con, f"""
+            SELECT item_id, city, COUNT(*), SUM(n), SUM(sum_unit), MIN(period), MAX(period),
+                   SUM(n * julianday(period)), SUM(sum_unit * julianday(period))
+            FROM price_rollup WHERE grain = ? {ids} GROUP BY item_id, city""", (grain,)):
+        key = (r[0], r[1])
+        digest = repr((MODEL_VERSION, grain, tuple(r)[2:], flags.get(key))).encode()
+        out[key] = hashlib.blake2b(digest, digest_size=16).hexdigest() if r[2] >= MIN_PERIODS else None
+    return out
+
+def _refit(con, grain: str, item_ids: list[int] | None) -> tuple[dict[str, int], list[tuple], set]:
+    """
+    Read-only half of fit(): refit the series whose fingerprint differs from the stored one.
+    Returns (counts, forecast_model rows to upsert, (item_id, city) models to delete).
+    """
+    fps = _fingerprints(con, grain, item_ids)
+    stored = {(r[0], r[1]): r[2] for r in execute(con, f"""
+        SELECT item_id, city, fingerprint FROM forecast_model WHERE grain = ?
+        {f"AND item_id IN ({','.join(map(str, item_ids))})" if item_ids else ""}""", (grain,))}
+    stale = {k for k, fp in fps.items() if fp is not None and stored.get(k) != fp}
+    models = []
+    if stale:
+        df = cell_frame(con, grain, sorted({i for i, _ in stale}))
+        keys = list(zip(df["item_id"].tolist(), df["city"].tolist()))
+        bounds = np.flatnonzero(np.r_[True, [a != b for a, b in zip(keys[1:], keys[:-1])], True])
+        # flags can leave a series with too few periods
+        spans = [(a, b) for a, b in zip(bounds[:-1], bounds[1:]) if keys[a] in stale and b - a >= MIN_PERIODS]
+        if spans:
+            take = np.concatenate([np.arange(a, b) for a, b in spans])
+            row = np.repeat(np.arange(len(spans)), [b - a for a, b in spans])
+            periods = df["period"].to_numpy()
+            cols, col = np.unique(periods[take], return_inverse=True)
+            y, w = np.zeros((len(spans), len(cols))), np.zeros((len(spans), len(cols)))
+            y[row, col] = np.log(df["mean"].to_numpy()[take])
+            w[row, col] = df["n"].to_numpy()[take]
+            m = fit_batch(_years(cols), y, w)
+            models = [(*keys[a], grain, fps[keys[a]], float(m["center"][k]), m["coef"][k].tobytes(),
+                       m["inv"][k].tobytes(), float(m["sigma"][k]), periods[b - 1])
+                      for k, (a, b) in enumerate(spans)]
+    fitted = {(r[0], r[1]) for r in models}
+    unfit = {k for k, fp in fps.items() if fp is None} | (stale - fitted)
+    gone = (set(stored) - set(fps)) | (unfit & set(stored))
+    stats = {"fitted": len(models), "unchanged": len(fps) - len(stale) - len(unfit - stale), "too_short": len(unfit)}
+    return stats, models, gone
+
+def _store(con, grain: str, models: list[tuple], gone: set) -> None:
+    if gone:
+        executemany(con, "DELETE FROM forecast_model WHERE item_id = ? AND city = ? AND grain = ?",
+                    [(i, c, grain) for i, c in gone])
+    executemany(con, """
+        INSERT INTO forecast_model(item_id, city, grain, fingerprint, center, coef, inv, sigma, last_period)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(item_id, city, grain) DO UPDATE SET
+          fingerprint = excluded.fingerprint, center = excluded.center, coef = excluded.coef,
+          inv = excluded.inv, sigma = excluded.sigma, last_period = excluded.last_period,
+          fitted_at = datetime('now')
+    """, models)
+
+def fit(con, grain: str = "week", item_ids: list[int] | None = None) -> dict[str, int]:
+    """
+    Bring `forecast_model` up to date for every series (or those of item_ids) at `grain`:
+    only series whose cells changed are read and refitted. Run inside a write transaction.
+    Returns counts of fitted, unchanged and too-short series.
+    """
+    stats, models, gone = _refit(con, grain, item_ids)
+    _store(con, grain, models, gone)
+    return stats
+
+def forecast(con, item: str, grain: str = "week", horizon: int | None = None,
+             currency: str | None = None) -> pd.DataFrame:
+    """
+    Forecast one item in every city with a model: columns period, city, yhat, lo, hi (unit
+    prices in fx.BASE_CURRENCY, or `currency`), for `horizon` periods after the item's
+    latest period with data. Stale models of the item are refitted first, outside any
+    transaction; only new fits take the write lock, briefly, to be stored.
+    """
+    row = con.execute("SELECT id FROM item WHERE name_key = ?", (item_key(item),)).fetchone()
+    if row is None:
+        return pd.DataFrame()
+    _, models, gone = _refit(con, grain, [row[0]])
+    if models or gone:
+        with transaction(con):
+            _store(con, grain, models, gone)
+    models = q(con, """SELECT city, center, coef, inv, sigma, last_period FROM forecast_model
+                       WHERE item_id = ? AND grain = ? ORDER BY city""", (row[0], grain))
+    if not models:
+        return pd.DataFrame()
+    last = max(m["last_period"] for m in models)
+    future = pd.date_range(pd.Timestamp(last), periods=(horizon or HORIZON[grain]) + 1, freq=FREQ[grain])[1:]
+    yhat, lo, hi = predict(
+        _years(future), np.array([m["center"] for m in models]),
+        np.stack([np.frombuffer(m["coef"]) for m in models]),
+        np.stack([np.frombuffer(m["inv"]).reshape(N_COEF, N_COEF) for m in models]),
+        np.array([m["sigma"] for m in models]))
+    df = pd.DataFrame({"period": np.tile(future, len(models)),
+                       "city": np.repeat([m["city"] for m in models], len(future)),
+                       "yhat": yhat.ravel(), "lo": lo.ravel(), "hi": hi.ravel()})
+    if currency:
+        from fx import from_base
+        df[["yhat", "lo", "hi"]] = from_base(con, df[["yhat", "lo", "hi"]], currency, df["period"])
+    return df
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Fit trend + seasonality forecasts for every (item, city) series.")
+    ap.add_argument("--grain", choices=sorted(HORIZON), default="week")
+    ap.add_argument("--item", help="Also print this item's forecast")
+    ap.add_argument("--horizon", type=int, help="Periods ahead (default: 12 weeks or 6 months)")
+    ap.add_argument("--currency", help="Currency of the printed forecast (needs FX rates)")
+    args = ap.parse_args()
+
+    con = connect()
+    t0 = time.perf_counter()
+    with transaction(con):
+        stats = fit(con, args.grain)
+    print(f"Forecast models: {stats['fitted']} fitted, {stats['unchanged']} unchanged, "
+          f"{stats['too_short']} series too short, in {time.perf_counter() - t0:.2f}s ✅")
+    if args.item:
+        from tabulate import tabulate
+        df = forecast(con, args.item, args.grain, args.horizon, args.currency)
+        if df.empty:
+            print(f"No forecast for '{args.item}' (unknown item or under {MIN_PERIODS} {args.grain}s of data)")
+        else:
+            df["period"] = df["period"].dt.date
+            print(tabulate(df, headers="keys", tablefmt="github", floatfmt=".2f", showindex=False))
+
+if __name__ == "__main__":
+    main()
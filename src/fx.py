@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Currency conversion from a local table of daily FX rates.
+
+Rates live in `fx_rate` as units of a currency per 1 BASE_CURRENCY (the ECB
+reference-rate convention), loaded from CSV with `python src/fx.py --load rates.csv`.
+A price is converted with the latest rate on or before its date (the earliest rate
+for dates before the table starts). Prices in a currency without any rate keep a NULL
+price_base and are left out of every aggregate (base_price_sql()) until rates for it
+are loaded, rather than being summed with amounts in another currency.
+
+Every import path fills `price.price_base` (price in BASE_CURRENCY) as rows are
+written, and rollups / latest-price baskets aggregate that column, so charts need
+one vectorized conversion from the base to the requested currency at most.
+"""
+from __future__ import annotations
+import argparse
+import sqlite3
+import weakref
+from bisect import bisect_right
+from functools import lru_cache
+from pathlib import Path
+from db import connect, transaction
+
+BASE_CURRENCY = "EUR"  # currency of price.price_base; generated data is in EUR
+
+def norm(currency: str | None) -> str:
+    return (currency or "").strip().upper()
+
+_versions: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()  # connection -> (data_version, version)
+
+def rates_version(con: sqlite3.Connection) -> tuple:
+    """
+    Fingerprint of fx_rate; part of every cache key so reloaded rates are picked up.
+    Scanning fx_rate costs more than a rate lookup, so the fingerprint is kept per connection
+    and recomputed only after another connection commits (PRAGMA data_version) or
+    load_rates() runs on this one.
+    """
+    data_version = con.execute("PRAGMA data_version").fetchone()[0]
+    try:
+        cached = _versions.get(con)
+    except TypeError:  # a plain sqlite3.Connection can't be weakly referenced: no caching
+        cached = None
+    if cached is not None and cached[0] == data_version:
+        return cached[1]
+    version = tuple(con.execute("SELECT COUNT(*), TOTAL(per_base), MAX(date) FROM fx_rate").fetchone())
+    try:
+        _versions[con] = (data_version, version)
+    except TypeError:
+        pass
+    return version
+
+@lru_cache(maxsize=64)
+def _history(con: sqlite3.Connection, version: tuple, currency: str) -> tuple[list[str], list[float]]:
+    rows = con.execute("SELECT date, per_base FROM fx_rate WHERE currency = ? ORDER BY date",
+                       (currency,)).fetchall()
+    return [r[0] for r in rows], [r[1] for r in rows]
+
+@lru_cache(maxsize=65536)
+def _rate(con: sqlite3.Connection, version: tuple, currency: str, day: str) -> float | None:
+    if currency == BASE_CURRENCY:
+        return 1.0
+    dates, rates = _history(con, version, currency)
+    if not dates:
+        return None
+    return rates[max(bisect_right(dates, day[:10]) - 1, 0)]
+
+def rate(con: sqlite3.Connection, currency: str, day: str) -> float | None:
+    """Units of `currency` per 1 BASE_CURRENCY on `day` (ISO date), or None if unknown."""
+    return _rate(con, rates_version(con), norm(currency), day)
+
+def to_base(con: sqlite3.Connection, price: float, currency: str, day: str) -> float | None:
+    """One price in BASE_CURRENCY (None when the currency has no rates)."""
+    r = rate(con, currency, day)
+    return None if r is None else price / r
+
+def to_base_array(con: sqlite3.Connection, prices, currencies, days) -> "np.ndarray":
+    """
+    Vectorized to_base(): one rate lookup per distinct (currency, day) pair, then a
+    single array division. Unknown currencies give NaN (stored by sqlite3 as NULL).
+    """
+    import numpy as np
+    import pandas as pd
+
+    version = rates_version(con)
+    keys = pd.Series(currencies, dtype=object).map(norm) + "|" + pd.Series(days, dtype=object).astype(str)
+    codes, pairs = pd.factorize(keys)
+    per_base = np.array([_rate(con, version, *p.split("|", 1)) for p in pairs], dtype=np.float64)
+    return np.asarray(prices, dtype=np.float64) / per_base[codes]
+
+def from_base(con: sqlite3.Connection, data, currency: str, days=None):
+    """
+    Convert BASE_CURRENCY amounts (scalar, array, Series or DataFrame) into `currency`.
+    `days` gives the date of each row; by default the frame index, else the latest rate.
+    """
+    currency = norm(currency)
+    if currency == BASE_CURRENCY:
+        return data
+    version = rates_version(con)
+    dates, rates = _history(con, version, currency)
+    if not dates:
+        raise SystemExit(f"No FX rates for {currency}. Load them with: python src/fx.py --load rates.csv")
+    if days is None:
+        days = getattr(data, "index", None)
+    if days is None or not len(days) or not hasattr(data, "__len__"):
+        return data * rates[-1]
+    import numpy as np  # array callers only: scalar conversions and the CLI start without it
+
+    iso = np.asarray([str(d)[:10] for d in days])
+    per = np.asarray(rates)[np.maximum(np.searchsorted(np.asarray(dates), iso, side="right") - 1, 0)]
+    if hasattr(data, "mul"):
+        return data.mul(per, axis=0)
+    return np.asarray(data) * per
+
+def base_price_sql(alias: str = "p") -> str:
+    """
+    SQL for a price row's amount in BASE_CURRENCY: price_base, or price for base-currency
+    rows written without it. NULL for currencies without rates, so those rows drop out of
+    sums, means and baskets instead of being mixed in unconverted.
+    """
+    p = f"{alias}." if alias else ""
+    return f"COALESCE({p}price_base, CASE WHEN upper(trim({p}currency)) = '{BASE_CURRENCY}' THEN {p}price END)"
+
+def unconverted(con: sqlite3.Connection) -> list[sqlite3.Row]:
+    """(currency, prices) for prices in the main file that have no rate to convert them."""
+    return con.execute("""SELECT currency, COUNT(*) AS prices FROM price
+                          WHERE price_base IS NULL AND upper(trim(currency)) != ?
+                          GROUP BY currency ORDER BY prices DESC""", (BASE_CURRENCY,)).fetchall()
+
+def currencies(con: sqlite3.Connection) -> list[str]:
+    """Currencies results can be shown in: the base plus every currency with rates."""
+    return [BASE_CURRENCY] + [r[0] for r in con.execute(
+        "SELECT DISTINCT currency FROM fx_rate WHERE currency != ? ORDER BY currency", (BASE_CURRENCY,))]
+
+# SQL twin of rate(): the backfill converts every row inside SQLite.
+_PRICE_BASE_SQL = f"""
+    CASE WHEN upper(trim(currency)) = '{BASE_CURRENCY}' THEN price
+    ELSE price / COALESCE(
+      (SELECT per_base FROM fx_rate r WHERE r.currency = upper(trim(price.currency)) AND r.date <= substr(price.date, 1, 10)
+       ORDER BY r.date DESC LIMIT 1),
+      (SELECT per_base FROM fx_rate r WHERE r.currency = upper(trim(price.currency))
+       ORDER BY r.date LIMIT 1))
+    END
+"""
+
+def fill_price_base(con: sqlite3.Connection, only_missing: bool = False) -> int:
+    """Recompute price.price_base for all rows (or only NULL ones) of the main file from fx_rate."""
+    return con.execute(f"UPDATE price SET price_base = {_PRICE_BASE_SQL}"
+                       + (" WHERE price_base IS NULL" if only_missing else "")).rowcount
+
+def backfill(con: sqlite3.Connection) -> int:
+    """
+    Recompute price_base for every row, archived partitions included (each is rewritten
+    and re-compacted), then rebuild the rollups that aggregate it. Call it outside a
+    transaction: the main file and each archive are updated in their own.
+    """
+    from partitions import update_archives
+    from rollup import rebuild as rebuild_rollups
+
+    with transaction(con):
+        n = fill_price_base(con)
+    n += update_archives(con, f"UPDATE {{price}} SET price_base = {_PRICE_BASE_SQL}")
+    with transaction(con):
+        rebuild_rollups(con)
+    return n
+
+def load_rates(con: sqlite3.Connection, csv_path: Path) -> int:
+    """Upsert rates from a CSV with columns date,currency,rate (units of currency per 1 BASE_CURRENCY)."""
+    import pandas as pd
+
+    df = pd.read_csv(csv_path)
+    missing = {"date", "currency", "rate"} - set(map(str, df.columns))
+    if missing:
+        raise SystemExit(f"FX CSV missing required columns: {sorted(missing)}\nGot: {list(df.columns)}")
+    df["date"] = pd.to_datetime(df["date"], errors="coerce").dt.date.astype(str)
+    df["currency"] = df["currency"].map(norm)
+    df["rate"] = pd.to_numeric(df["rate"], errors="coerce")
+    df = df[(df["date"] != "NaT") & (df["rate"] > 0) & (df["currency"] != BASE_CURRENCY)]
+    con.executemany("""INSERT INTO fx_rate(currency, date, per_base) VALUES (?, ?, ?)
+                       ON CONFLICT(currency, date) DO UPDATE SET per_base = excluded.per_base""",
+                    df[["currency", "date", "rate"]].itertuples(index=False, name=None))
+    try:
+        _versions.pop(con, None)  # this connection's own writes don't move data_version
+    except TypeError:
+        pass
+    return len(df)
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=f"Manage FX rates (base currency: {BASE_CURRENCY}).")
+    ap.add_argument("--load", help="CSV with columns date,currency,rate (units of currency per 1 "
+                                   f"{BASE_CURRENCY}); converted prices are recomputed afterwards")
+    ap.add_argument("--backfill", action="store_true", help="Recompute price_base for every row")
+    args = ap.parse_args()
+
+    con = connect()
+    if args.load:
+        with transaction(con):
+            n = load_rates(con, Path(args.load))
+        print(f"Loaded {n} FX rates ✅")
+    if args.load or args.backfill:
+        n = backfill(con)
+        print(f"Converted {n} prices to {BASE_CURRENCY} ✅")
+    for r in unconverted(con):
+        print(f"  {r['prices']:,} prices in {r['currency']} have no rate and are left out of charts and baskets")
+    for cur in currencies(con)[1:]:
+        day = con.execute("SELECT MAX(date) FROM fx_rate WHERE currency=?", (cur,)).fetchone()[0]
+        print(f"  1 {BASE_CURRENCY} = {rate(con, cur, day):g} {cur} (as of {day})")
+
+if __name__ == "__main__":
+    main()
@@ -1,43 +1,222 @@
 #!/usr/bin/env python3
-import csv, random
+"""
+Synthetic price observations with real time-series structure, built with NumPy.
+
+Each price is base[item] x city level x store offset x inflation drift x seasonality
+x noise, so trends, seasonal swings and cheap/expensive stores show up in the
+analytics. Rows are generated in fixed-size chunks from a seeded RNG: the same
+arguments always give the same data, and memory stays flat however many rows
+are written.
+
+    python src/generate_data.py --rows 10000000 --out data/big.csv
+    python src/generate_data.py --rows 10000000 --format sqlite --out /tmp/fixture.db
+"""
+from __future__ import annotations
+import argparse
+import time
 from datetime import date, timedelta
 from pathlib import Path
+from typing import Iterator
+import numpy as np
 
-items = [
-    ("Milk", "liter"),
-    ("Bread", "loaf"),
-    ("Eggs", "dozen"),
-    ("Rice", "kg"),
-    ("Apples", "kg"),
-    ("Sugar", "kg"),
-    ("Coffee", "pack"),
-    ("Butter", "pack")
+ITEMS = [
+    ("Milk", "liter", 1.3),
+    ("Bread", "loaf", 1.2),
+    ("Eggs", "dozen", 2.0),
+    ("Rice", "kg", 3.0),
+    ("Apples", "kg", 2.5),
+    ("Sugar", "kg", 2.2),
+    ("Coffee", "pack", 4.5),
+    ("Butter", "pack", 2.8),
 ]
+CITIES = ["Helsinki", "Berlin", "Paris", "Madrid", "Warsaw", "Rome", "Lisbon"]
+CITY_CENTERS = [(60.170, 24.938), (52.520, 13.405), (48.857, 2.352), (40.417, -3.704),
+                (52.230, 21.012), (41.903, 12.496), (38.722, -9.139)]
+COLUMNS = ["item", "unit", "store", "city", "price", "currency", "quantity", "date"]
+CURRENCY = "EUR"
+CHUNK_ROWS = 1_000_000  # fixed so the output only depends on the arguments below
+
+class Model:
+    """Per-item, per-city and per-store parameters, drawn once from the seed."""
+
+    def __init__(self, n_items: int, n_cities: int, stores_per_city: int, start: date, days: int, seed: int):
+        rng = np.random.default_rng(seed)
+        self.items = [ITEMS[i] if i < len(ITEMS) else (f"Item {i + 1}", "unit", None) for i in range(n_items)]
+        self.cities = [CITIES[i] if i < len(CITIES) else f"City {i + 1}" for i in range(n_cities)]
+        self.stores_per_city = stores_per_city
+        self.days = days
+        self.dates = [(start + timedelta(days=d)).isoformat() for d in range(days)]
+        doy = np.array([(start + timedelta(days=d)).timetuple().tm_yday for d in range(days)])
+
+        base = np.array([b if b is not None else rng.uniform(0.8, 12.0) for _, _, b in self.items])
+        drift = rng.normal(0.04, 0.02, n_items)            # yearly inflation per item
+        amplitude = rng.uniform(0.01, 0.08, n_items)       # seasonal swing per item
+        phase = rng.uniform(0, 2 * np.pi, n_items)
+        t = np.arange(days) / 365.0
+        # (items x days) price curve shared by all stores
+        self.curve = base[:, None] * np.exp(drift[:, None] * t) \
+            * (1 + amplitude[:, None] * np.sin(2 * np.pi * doy / 365.25 + phase[:, None]))
+        city_level = rng.uniform(0.85, 1.2, n_cities)
+        store_offset = rng.lognormal(0.0, 0.05, n_cities * stores_per_city)
+        self.store_factor = np.repeat(city_level, stores_per_city) * store_offset  # store s is in city s // stores_per_city
+        self.seed = seed
+        # Store locations come from their own stream so adding them left the prices unchanged.
+        geo = np.random.default_rng([seed, 1])
+        centers = np.array([CITY_CENTERS[i] if i < len(CITY_CENTERS) else
+                            (geo.uniform(36, 62), geo.uniform(-9, 30)) for i in range(n_cities)])
+        self.store_coords = np.repeat(centers, stores_per_city, axis=0) \
+            + geo.normal(0, 0.04, (self.n_stores, 2))  # within ~10 km of the centre
+
+    @property
+    def n_stores(self) -> int:
+        return len(self.cities) * self.stores_per_city
+
+    def chunks(self, rows: int) -> Iterator[tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+        """Yield (item index, store index, day index, price in cents) arrays, CHUNK_ROWS at a time."""
+        seeds = np.random.SeedSequence(self.seed).spawn(-(-rows // CHUNK_ROWS))
+        for k, ss in enumerate(seeds):
+            rng = np.random.default_rng(ss)
+            n = min(CHUNK_ROWS, rows - k * CHUNK_ROWS)
+            item = rng.integers(0, len(self.items), n, dtype=np.int32)
+            store = rng.integers(0, self.n_stores, n, dtype=np.int32)
+            day = rng.integers(0, self.days, n, dtype=np.int32)
+            price = self.curve[item, day] * self.store_factor[store] * rng.lognormal(0.0, 0.04, n)
+            yield item, store, day, np.maximum(np.rint(price * 100), 1).astype(np.int64)
+
+    def store_name(self, s: int) -> str:
+        return f"Market {s % self.stores_per_city + 1}"
+
+    def store_city(self, s: int) -> str:
+        return self.cities[s // self.stores_per_city]
+
+# -------- writers --------
+def write_csv(model: Model, rows: int, out: Path) -> None:
+    # Lines are assembled from small lookup tables (one prefix per item/store pair,
+    # one string per price in cents and per day) instead of formatting every field.
+    n_stores = model.n_stores
+    prefix = np.array([f"{name},{unit},{model.store_name(s)},{model.store_city(s)},"
+                       for name, unit, _ in model.items for s in range(n_stores)], dtype=object)
+    dates = np.array([f",{CURRENCY},1,{d}\n" for d in model.dates], dtype=object)
+    cents: np.ndarray = np.array([], dtype=object)
+    with out.open("w", newline="", encoding="utf-8") as f:
+        f.write(",".join(COLUMNS) + "\n")
+        for item, store, day, price in model.chunks(rows):
+            if price.max() >= len(cents):
+                cents = np.array([f"{c // 100}.{c % 100:02d}" for c in range(int(price.max()) * 2)], dtype=object)
+            f.write("".join(prefix[item * n_stores + store] + cents[price] + dates[day]))
+
+def write_parquet(model: Model, rows: int, out: Path) -> None:
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SystemExit("Parquet output needs pyarrow: pip install pyarrow")
+
+    def dictionary(codes: np.ndarray, values: list[str]) -> pa.DictionaryArray:
+        return pa.DictionaryArray.from_arrays(pa.array(codes, pa.int32()), pa.array(values, pa.string()))
+
+    names = [name for name, _, _ in model.items]
+    units = [unit for _, unit, _ in model.items]
+    store_names = [f"Market {j + 1}" for j in range(model.stores_per_city)]
+    writer = None
+    try:
+        for item, store, day, price in model.chunks(rows):
+            table = pa.table({
+                "item": dictionary(item, names),
+                "unit": dictionary(item, units),
+                "store": dictionary(store % model.stores_per_city, store_names),
+                "city": dictionary(store // model.stores_per_city, model.cities),
+                "price": pa.array(price / 100.0),
+                "currency": dictionary(np.zeros(len(item), np.int32), [CURRENCY]),
+                "quantity": pa.array(np.ones(len(item))),
+                "date": pa.array(np.datetime64(model.dates[0]) + day.astype("timedelta64[D]")),
+            })
+            if writer is None:
+                writer = pq.ParquetWriter(out, table.schema, compression="zstd")
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+# Dropped while filling an empty database and recreated by migrate() afterwards, which
+# also rebuilds latest_price and the rollups in one pass: ~3x faster than per-row upkeep.
+# The drops also reset the schema version, so a load killed before that migrate() leaves
+# a database that scripts refuse (db.require_schema) until init_db.py restores them.
+BULK_LOAD_DROPS = ("DROP TRIGGER IF EXISTS trg_latest_price_insert",
+                   "DROP TRIGGER IF EXISTS trg_price_count_insert",
+                   "DROP INDEX IF EXISTS idx_price_item_date",
+                   "DROP INDEX IF EXISTS idx_price_store_date",
+                   "DROP INDEX IF EXISTS idx_price_date",
+                   "DROP INDEX IF EXISTS ux_price_obs_hash")
+
+def write_sqlite(model: Model, rows: int, out: Path) -> None:
+    """Insert straight into a (new or existing) tracker database, one transaction per chunk."""
+    from db import item_key, migrate, open_connection
+    from fx import rate
+    from rollup import refresh as refresh_rollups
+
+    con = open_connection(out)
+    migrate(con)
+    with con:
+        con.executemany("INSERT OR IGNORE INTO item(name, name_key, category, unit) VALUES(?, ?, 'general', ?)",
+                        [(name, item_key(name), unit) for name, unit, _ in model.items])
+        item_ids = np.array([con.execute("SELECT id FROM item WHERE name_key=?", (item_key(name),)).fetchone()[0]
+                             for name, _, _ in model.items], dtype=np.int64)
+        store_ids = []
+        for s in range(model.n_stores):
+            name, city = model.store_name(s), model.store_city(s)
+            lat, lon = model.store_coords[s].round(5).tolist()
+            row = con.execute("SELECT id FROM store WHERE name=? AND city=?", (name, city)).fetchone()
+            store_ids.append(row[0] if row else con.execute(
+                "INSERT INTO store(name, city, latitude, longitude) VALUES(?, ?, ?, ?)", (name, city, lat, lon)).lastrowid)
+        store_ids = np.array(store_ids, dtype=np.int64)
+        per_base = np.array([rate(con, CURRENCY, d) or np.nan for d in model.dates])
+        bulk = con.execute("SELECT 1 FROM price LIMIT 1").fetchone() is None
+        if bulk:
+            for sql in BULK_LOAD_DROPS:
+                con.execute(sql)
+            con.execute("PRAGMA user_version = 0")
+    dates = np.array(model.dates, dtype=object)
+    try:
+        for item, store, day, price in model.chunks(rows):
+            amount = price / 100.0
+            with con:
+                con.executemany(
+                    """INSERT INTO price(item_id, store_id, price, currency, quantity, date, price_base)
+                       VALUES (?, ?, ?, ?, 1, ?, ?)""",
+                    zip(item_ids[item].tolist(), store_ids[store].tolist(), amount.tolist(),
+                        [CURRENCY] * len(item), dates[day].tolist(), (amount / per_base[day]).tolist()))
+                if not bulk:
+                    refresh_rollups(con)
+    finally:
+        if bulk:  # also after an error: never leave the trigger and the dedup index dropped
+            migrate(con)
+        con.close()
+
+WRITERS = {"csv": write_csv, "parquet": write_parquet, "sqlite": write_sqlite}
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Generate synthetic price observations.")
+    ap.add_argument("--rows", type=int, default=1000)
+    ap.add_argument("--items", type=int, default=len(ITEMS), help="Number of items (extra ones are 'Item N')")
+    ap.add_argument("--cities", type=int, default=len(CITIES), help="Number of cities (extra ones are 'City N')")
+    ap.add_argument("--stores", type=int, default=7, help="Stores per city")
+    ap.add_argument("--start", default="2025-01-01", help="First observation date")
+    ap.add_argument("--days", type=int, default=298, help="Number of days covered")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--format", choices=sorted(WRITERS), default="csv",
+                    help="csv (streamed), parquet (needs pyarrow) or sqlite (insert into the --out database)")
+    ap.add_argument("--out", default="data/generated_prices.csv")
+    args = ap.parse_args()
+
+    out = Path(args.out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    model = Model(args.items, args.cities, args.stores, date.fromisoformat(args.start), args.days, args.seed)
+    t0 = time.perf_counter()
+    WRITERS[args.format](model, args.rows, out)
+    elapsed = time.perf_counter() - t0
+    print(f"✅ Generated {args.rows:,} price rows -> {out} in {elapsed:.1f}s "
+          f"({args.rows / max(elapsed, 1e-9):,.0f} rows/s)")
 
-cities = ["Helsinki", "Berlin", "Paris", "Madrid", "Warsaw", "Rome", "Lisbon"]
-stores = [f"Market {i}" for i in range(1, 8)]
-
-start_date = date(2025, 1, 1)
-end_date = date(2025, 10, 25)
-days = (end_date - start_date).days
-
-out = Path("data/generated_prices.csv")
-out.parent.mkdir(exist_ok=True)
-
-rows = []
-for _ in range(1000):
-    item, unit = random.choice(items)
-    city = random.choice(cities)
-    store = random.choice(stores)
-    d = start_date + timedelta(days=random.randint(0, days))
-    base = {"Milk": 1.3, "Bread": 1.2, "Eggs": 2.0, "Rice": 3.0,
-            "Apples": 2.5, "Sugar": 2.2, "Coffee": 4.5, "Butter": 2.8}[item]
-    price = round(base * random.uniform(0.9, 1.3), 2)
-    rows.append([item, unit, store, city, price, "EUR", 1, d.isoformat()])
-
-with out.open("w", newline="", encoding="utf-8") as f:
-    w = csv.writer(f)
-    w.writerow(["item","unit","store","city","price","currency","quantity","date"])
-    w.writerows(rows)
-
-print(f"✅ Generated {len(rows)} price rows -> {out}")
+if __name__ == "__main__":
+    main()
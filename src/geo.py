@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Store location queries backed by an SQLite R*Tree.
+
+`store_geo` indexes every store with coordinates (triggers keep it in sync with
+`store`). A radius query asks the R*Tree for the bounding box of the circle, then
+keeps the candidates whose haversine distance is within the radius, so its cost
+depends on the stores nearby rather than on the total number of stores.
+
+    python src/analytics.py --near 60.17 24.94 --radius 5
+    python src/analytics.py --near 60.17 24.94 --k 3
+    python src/analytics.py --near 60.17 24.94 --radius 10 --basket Milk Bread Eggs
+"""
+from __future__ import annotations
+import math
+import sqlite3
+from db import item_key, q
+from fx import BASE_CURRENCY, base_price_sql, from_base
+
+EARTH_RADIUS_KM = 6371.0088
+MAX_KM = math.pi * EARTH_RADIUS_KM  # half the circumference: every point on Earth
+
+GEO_DDL = """
+CREATE VIRTUAL TABLE store_geo USING rtree(id, min_lat, max_lat, min_lon, max_lon);
+
+CREATE TRIGGER IF NOT EXISTS trg_store_geo_insert AFTER INSERT ON store
+WHEN NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL
+BEGIN
+  INSERT INTO store_geo VALUES (NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_store_geo_update AFTER UPDATE OF id, latitude, longitude ON store
+BEGIN
+  DELETE FROM store_geo WHERE id = OLD.id;
+  INSERT INTO store_geo SELECT NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude
+  WHERE NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_store_geo_delete AFTER DELETE ON store
+BEGIN
+  DELETE FROM store_geo WHERE id = OLD.id;
+END;
+"""
+
+def ensure_index(con: sqlite3.Connection) -> bool:
+    """
+    Create `store_geo` and its triggers (filled from `store`) if missing. Returns False when
+    this SQLite build has no R*Tree module; everything else works without it.
+    """
+    if con.execute("SELECT 1 FROM sqlite_master WHERE name = 'store_geo'").fetchone():
+        return True
+    try:
+        for stmt in GEO_DDL.split(";\n\n"):
+            con.execute(stmt)
+    except sqlite3.OperationalError as e:
+        if "rtree" in str(e):
+            return False
+        raise
+    con.execute("""INSERT INTO store_geo SELECT id, latitude, latitude, longitude, longitude
+                   FROM store WHERE latitude IS NOT NULL AND longitude IS NOT NULL""")
+    return True
+
+def haversine_km(lat1: float | None, lon1: float | None, lat2: float | None, lon2: float | None) -> float | None:
+    """Great-circle distance; None (SQL NULL) when a coordinate is missing."""
+    if lat1 is None or lon1 is None or lat2 is None or lon2 is None:
+        return None
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((p2 - p1) / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+def bounding_boxes(lat: float, lon: float, km: float) -> list[tuple[float, float, float, float]]:
+    """(min_lat, max_lat, min_lon, max_lon) boxes covering the circle; two when it crosses ±180°."""
+    r = km / EARTH_RADIUS_KM
+    lat_lo, lat_hi = lat - math.degrees(r), lat + math.degrees(r)
+    if lat_lo <= -90 or lat_hi >= 90 or math.sin(r) >= math.cos(math.radians(lat)):
+        return [(max(lat_lo, -90.0), min(lat_hi, 90.0), -180.0, 180.0)]  # circle reaches a pole
+    dlon = math.degrees(math.asin(math.sin(r) / math.cos(math.radians(lat))))
+    lo, hi = lon - dlon, lon + dlon
+    if lo < -180:
+        return [(lat_lo, lat_hi, lo + 360, 180.0), (lat_lo, lat_hi, -180.0, hi)]
+    if hi > 180:
+        return [(lat_lo, lat_hi, lo, 180.0), (lat_lo, lat_hi, -180.0, hi - 360)]
+    return [(lat_lo, lat_hi, lo, hi)]
+
+def _require_index(con: sqlite3.Connection) -> None:
+    if not ensure_index(con):
+        raise SystemExit("This SQLite build has no R*Tree module, which location queries need.")
+    con.create_function("haversine_km", 4, haversine_km, deterministic=True)
+
+def _near_sql(n_boxes: int) -> str:
+    """
+    Stores within ? km of (?, ?): R*Tree box lookups, then the exact distance. The planner may
+    visit `store` before the boxes, so stores without coordinates are filtered out here too.
+    """
+    boxes = " UNION ".join(["SELECT id FROM store_geo WHERE max_lat >= ? AND min_lat <= ? "
+                            "AND max_lon >= ? AND min_lon <= ?"] * n_boxes)
+    return f"""
+        SELECT * FROM (
+          SELECT s.id, s.name, s.city, s.latitude, s.longitude,
+                 haversine_km(?, ?, s.latitude, s.longitude) AS km
+          FROM ({boxes}) g
+          JOIN store s ON s.id = g.id
+          WHERE s.latitude IS NOT NULL AND s.longitude IS NOT NULL
+        )
+        WHERE km <= ?
+    """
+
+def _near_params(lat: float, lon: float, km: float) -> tuple:
+    return (lat, lon, *(v for box in bounding_boxes(lat, lon, km) for v in box), km)
+
+def within(con: sqlite3.Connection, lat: float, lon: float, km: float) -> list[sqlite3.Row]:
+    """Stores within `km` of (lat, lon), nearest first (id, name, city, latitude, longitude, km)."""
+    _require_index(con)
+    return q(con, _near_sql(len(bounding_boxes(lat, lon, km))) + " ORDER BY km", _near_params(lat, lon, km))
+
+def nearest(con: sqlite3.Connection, lat: float, lon: float, k: int = 5, max_km: float = MAX_KM) -> list[sqlite3.Row]:
+    """
+    The k stores nearest to (lat, lon), up to max_km away. The search radius doubles from
+    1 km until it holds k stores: the k nearest are then all inside it.
+    """
+    km = min(1.0, max_km)
+    while True:
+        rows = within(con, lat, lon, km)
+        if len(rows) >= k or km >= max_km:
+            return rows[:k]
+        km = min(km * 2, max_km)
+
+def basket_nearby(con: sqlite3.Connection, lat: float, lon: float, km: float, items: list[str],
+                  currency: str = BASE_CURRENCY, limit: int = 10) -> list[sqlite3.Row]:
+    """
+    Stores within `km` that have a latest price for every item, by basket total (in
+    `currency`), then distance: store_id, store, city, km, total.
+    """
+    if not items:
+        return []
+    _require_index(con)
+    keys = tuple(dict.fromkeys(map(item_key, items)))
+    qmarks = ",".join("?" * len(keys))
+    sql = f"""
+        SELECT n.id AS store_id, n.name AS store, n.city, n.km,
+               SUM({base_price_sql()} / NULLIF(p.quantity, 0)) * ? AS total
+        FROM ({_near_sql(len(bounding_boxes(lat, lon, km)))}) n
+        JOIN latest_price lp ON lp.store_id = n.id
+          AND lp.item_id IN (SELECT id FROM item WHERE name_key IN ({qmarks}))
+        JOIN price p ON p.id = lp.price_id
+        GROUP BY n.id
+        HAVING COUNT({base_price_sql()}) = ?  -- prices without an FX rate don't count
+        ORDER BY total, n.km
+        LIMIT ?
+    """
+    return q(con, sql, (from_base(con, 1.0, currency), *_near_params(lat, lon, km), *keys, len(keys), limit))
@@ -1,89 +1,306 @@
 #!/usr/bin/env python3
 import argparse
-import sqlite3
+import hashlib
+import io
+import time
+from itertools import islice
 import pandas as pd
 from pathlib import Path
+from db import SCHEMA_VERSION, execute, executemany, item_key, migrate, open_connection
+from fx import to_base, to_base_array
+from rollup import refresh as refresh_rollups
 
 REQ_COLS = {"item", "unit", "store", "city", "price", "currency", "quantity", "date"}
+DEFAULT_CHUNKSIZE = 100_000
+FINGERPRINT_WINDOW = 64 * 1024  # bytes hashed at the head and just before the checkpoint
 
 def get_or_create_item(con, name: str, unit: str) -> int:
-    cur = con.execute("SELECT id FROM item WHERE name=?", (name.strip(),))
+    cur = execute(con, "SELECT id FROM item WHERE name_key=?", (item_key(name),))
     row = cur.fetchone()
     if row:
         # Optional: update unit if empty in DB and provided in CSV
-        con.execute("UPDATE item SET unit=COALESCE(NULLIF(unit,''), ?) WHERE id=?", (unit.strip(), row[0]))
+        execute(con, "UPDATE item SET unit=COALESCE(NULLIF(unit,''), ?) WHERE id=?", (unit.strip(), row[0]))
         return row[0]
-    cur = con.execute(
-        "INSERT INTO item(name, category, unit) VALUES(?, 'general', ?)",
-        (name.strip(), unit.strip() or "unit")
+    cur = execute(
+        con,
+        "INSERT INTO item(name, name_key, category, unit) VALUES(?, ?, 'general', ?)",
+        (name.strip(), item_key(name), unit.strip() or "unit")
     )
-    con.commit()
     return cur.lastrowid
 
 def get_or_create_store(con, name: str | None, city: str | None) -> int | None:
     if not name or not name.strip():
         return None  # store is optional in schema
-    cur = con.execute("SELECT id FROM store WHERE name=? AND COALESCE(city,'')=COALESCE(?, '')",
-                      (name.strip(), (city or "").strip()))
+    cur = execute(con, "SELECT id FROM store WHERE name=? AND COALESCE(city,'')=COALESCE(?, '')",
+                  (name.strip(), (city or "").strip()))
     row = cur.fetchone()
     if row:
         return row[0]
-    cur = con.execute(
+    cur = execute(
+        con,
         "INSERT INTO store(name, city) VALUES(?, ?)",
         (name.strip(), (city or "").strip() or None)
     )
-    con.commit()
     return cur.lastrowid
 
-def main():
-    ap = argparse.ArgumentParser(description="Import denormalized CSV into normalized SQLite schema.")
-    ap.add_argument("--db", default="data/prices.db", help="Path to SQLite DB")
-    ap.add_argument("--file", required=True, help="CSV with columns: item,unit,store,city,price,currency,quantity,date")
-    ap.add_argument("--limit", type=int, default=None, help="Import only first N rows (optional)")
-    args = ap.parse_args()
-
-    db_path = Path(args.db)
-    csv_path = Path(args.file)
-    if not db_path.exists():
-        raise SystemExit(f"DB not found: {db_path}. Run: python src/init_db.py")
-    if not csv_path.exists():
-        raise SystemExit(f"CSV not found: {csv_path}")
-
-    df = pd.read_csv(csv_path)
+def check_columns(df: pd.DataFrame) -> None:
     missing = REQ_COLS - set(map(str, df.columns))
     if missing:
         raise SystemExit(f"CSV missing required columns: {sorted(missing)}\nGot: {list(df.columns)}")
 
-    if args.limit:
-        df = df.head(args.limit)
-
-    # Normalize basic types
+def normalize(df: pd.DataFrame) -> pd.DataFrame:
+    """Coerce numeric/date columns the same way for every import path."""
     df["price"] = pd.to_numeric(df["price"], errors="coerce")
     df["quantity"] = pd.to_numeric(df["quantity"], errors="coerce").fillna(1)
     df["date"] = pd.to_datetime(df["date"], errors="coerce").dt.date.astype(str)
+    return df
 
+def import_rows(con, df: pd.DataFrame) -> int:
+    """Original per-row path: one lookup per item/store and one INSERT per price, in one transaction."""
     inserted = 0
-    with sqlite3.connect(db_path) as con:
-        con.execute("PRAGMA foreign_keys = ON;")
+    with con:
         for _, r in df.iterrows():
             item_id = get_or_create_item(con, r["item"], r.get("unit", "unit"))
             store_id = get_or_create_store(con, r.get("store"), r.get("city"))
             if pd.isna(r["price"]):
                 continue
-            con.execute(
-                """INSERT INTO price(item_id, store_id, price, currency, quantity, date)
-                   VALUES (?, ?, ?, ?, ?, ?)""",
+            currency = str(r.get("currency") or "USD")
+            execute(
+                con,
+                """INSERT INTO price(item_id, store_id, price, currency, quantity, date, price_base)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
                 (item_id,
                  store_id,
                  float(r["price"]),
-                 str(r.get("currency") or "USD"),
+                 currency,
                  float(r.get("quantity") or 1),
-                 str(r["date"]))
+                 str(r["date"]),
+                 to_base(con, float(r["price"]), currency, str(r["date"])))
             )
             inserted += 1
-        con.commit()
+        refresh_rollups(con)
+    return inserted
+
+# -------- bulk (set-based) path --------
+class IdCache:
+    """
+    In-memory item-key / (store, city) -> id maps, loaded once per import.
+    Memory is bounded by the number of distinct items/stores, not by file size.
+    """
+    def __init__(self, con):
+        self.items = {key: id_ for id_, key in execute(con, "SELECT id, name_key FROM item")}
+        self.stores = {(name, city or ""): id_ for id_, name, city in execute(con, "SELECT id, name, city FROM store")}
+
+    def resolve_items(self, con, names: pd.Series, units: pd.Series) -> pd.Series:
+        keys = names.map({n: item_key(n) for n in names.unique()})  # normalize each distinct spelling once
+        new = (pd.DataFrame({"name": names, "key": keys, "unit": units})
+                 .drop_duplicates("key")
+                 .loc[lambda d: d["key"].map(self.items).isna()])
+        if not new.empty:
+            last_id = execute(con, "SELECT COALESCE(MAX(id), 0) FROM item").fetchone()[0]
+            executemany(con, "INSERT INTO item(name, name_key, category, unit) VALUES(?, ?, 'general', ?)",
+                        new.itertuples(index=False, name=None))
+            self.items.update((key, id_) for id_, key in
+                              execute(con, "SELECT id, name_key FROM item WHERE id > ?", (last_id,)))
+        return keys.map(self.items)
+
+    def resolve_stores(self, con, names: pd.Series, cities: pd.Series) -> pd.Series:
+        keys = pd.Series(list(zip(names, cities)), index=names.index)
+        has_store = names != ""
+        new = {k for k in keys[has_store].unique() if k not in self.stores}
+        if new:
+            last_id = execute(con, "SELECT COALESCE(MAX(id), 0) FROM store").fetchone()[0]
+            executemany(con, "INSERT INTO store(name, city) VALUES(?, ?)",
+                        ((name, city or None) for name, city in new))
+            self.stores.update(((name, city or ""), id_) for id_, name, city in
+                               execute(con, "SELECT id, name, city FROM store WHERE id > ?", (last_id,)))
+        return keys.map(self.stores).where(has_store)
+
+def _clean_text(s: pd.Series) -> pd.Series:
+    return s.fillna("").astype(str).str.strip()
+
+def obs_hash(item_id, store_id, price, currency, quantity, date) -> str:
+    """Stable hash of an observation's natural key (price column order), used to skip duplicates."""
+    key = f"{item_id}|{'' if store_id is None else store_id}|{float(price)!r}|{currency}|{float(quantity)!r}|{date}"
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
+
+def backfill_hashes(con) -> int:
+    """Hash rows written by other paths so they take part in dedup; later duplicates stay NULL."""
+    con.create_function("obs_hash", 6, obs_hash, deterministic=True)
+    cur = execute(con, """UPDATE OR IGNORE price
+                          SET obs_hash = obs_hash(item_id, store_id, price, currency, quantity, date)
+                          WHERE obs_hash IS NULL""")
+    return cur.rowcount
+
+def import_chunk(con, cache: IdCache, df: pd.DataFrame, dedup: bool = False) -> int:
+    """
+    Resolve ids for a whole chunk at once and write its prices with executemany.
+    With dedup=True rows whose natural key already exists are skipped.
+    """
+    names = _clean_text(df["item"])
+    units = _clean_text(df["unit"]).replace("", "unit")
+    item_ids = cache.resolve_items(con, names, units)
+    store_ids = cache.resolve_stores(con, _clean_text(df["store"]), _clean_text(df["city"]))
+
+    ok = df["price"].notna()
+    rows = pd.DataFrame({
+        "item_id": item_ids[ok].astype("int64"),
+        "store_id": store_ids[ok].astype("Int64").astype(object).where(store_ids[ok].notna(), None),
+        "price": df.loc[ok, "price"].astype(float),
+        "currency": df.loc[ok, "currency"].fillna("USD").astype(str).replace("", "USD"),
+        "quantity": df.loc[ok, "quantity"].astype(float).replace(0, 1),
+        "date": df.loc[ok, "date"],
+    })
+    cols = [rows[c].tolist() for c in rows.columns]
+    base = to_base_array(con, cols[2], cols[3], cols[5]).tolist()  # NaN (no FX rate) is stored as NULL
+    if not dedup:
+        executemany(
+            con,
+            """INSERT INTO price(item_id, store_id, price, currency, quantity, date, price_base)
+               VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            zip(*cols, base)
+        )
+        return len(rows)
+    hashes = [obs_hash(*r) for r in zip(*cols)]
+    cur = executemany(
+        con,
+        """INSERT OR IGNORE INTO price(item_id, store_id, price, currency, quantity, date, price_base, obs_hash)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+        zip(*cols, base, hashes)
+    )
+    return cur.rowcount
+
+def import_bulk(con, csv_path: Path, chunksize: int = DEFAULT_CHUNKSIZE,
+                limit: int | None = None, verbose: bool = True) -> int:
+    """Stream the CSV in chunks; one transaction per chunk."""
+    cache = IdCache(con)
+    inserted = 0
+    t0 = time.perf_counter()
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize, nrows=limit):
+        check_columns(chunk)
+        chunk = normalize(chunk)
+        with con:
+            inserted += import_chunk(con, cache, chunk)
+            refresh_rollups(con)
+        if verbose:
+            elapsed = time.perf_counter() - t0
+            print(f"  … {inserted:,} rows ({inserted / elapsed:,.0f} rows/s)")
+    return inserted
+
+# -------- incremental (resumable) path --------
+def file_fingerprint(f, offset: int) -> str:
+    """Hash of the file head and of the bytes just before `offset`: cheap, and changes if the file was rewritten."""
+    h = hashlib.blake2b(digest_size=16)
+    f.seek(0)
+    h.update(f.read(min(offset, FINGERPRINT_WINDOW)))
+    f.seek(max(0, offset - FINGERPRINT_WINDOW))
+    h.update(f.read(min(offset, FINGERPRINT_WINDOW)))
+    h.update(str(offset).encode())
+    return h.hexdigest()
+
+def iter_chunks_from(f, offset: int, chunksize: int):
+    """
+    Yield (DataFrame, end_offset) for the lines after `offset`.
+    Lines are read as raw bytes so every chunk ends at an exact byte offset we can checkpoint.
+    (Quoted fields with embedded newlines are not supported here.)
+    """
+    f.seek(0)
+    header = f.readline()
+    offset = max(offset, len(header))
+    f.seek(offset)
+    while True:
+        lines = list(islice(f, chunksize))
+        if not lines:
+            return
+        offset += sum(map(len, lines))
+        yield pd.read_csv(io.BytesIO(header + b"".join(lines))), offset
+
+def import_incremental(con, csv_path: Path, chunksize: int = DEFAULT_CHUNKSIZE, verbose: bool = True) -> tuple[int, int]:
+    """
+    Resume from the file's checkpoint and insert only unseen observations.
+    Each chunk and its checkpoint commit together, so an interrupted run restarts at the last chunk boundary.
+    Returns (rows read, rows inserted).
+    """
+    key = str(csv_path.resolve())
+    with con:
+        backfill_hashes(con)
+    cache = IdCache(con)
+    read = inserted = 0
+    t0 = time.perf_counter()
+    with csv_path.open("rb") as f:
+        row = execute(con, "SELECT byte_offset, rows_done, fingerprint FROM import_checkpoint WHERE path=?",
+                      (key,)).fetchone()
+        offset, rows_done = 0, 0
+        if row:
+            size = f.seek(0, io.SEEK_END)
+            if row[0] <= size and file_fingerprint(f, row[0]) == row[2]:
+                offset, rows_done = row[0], row[1]
+                if verbose:
+                    print(f"  resuming after row {rows_done:,} (byte {offset:,})")
+            elif verbose:
+                print("  file changed since last import; rescanning (duplicates are skipped)")
+
+        for chunk, end in iter_chunks_from(f, offset, chunksize):
+            check_columns(chunk)
+            chunk = normalize(chunk)
+            read += len(chunk)
+            fp = file_fingerprint(f, end)
+            with con:
+                inserted += import_chunk(con, cache, chunk, dedup=True)
+                refresh_rollups(con)
+                execute(
+                    con,
+                    """INSERT INTO import_checkpoint(path, byte_offset, rows_done, fingerprint, updated_at)
+                       VALUES (?, ?, ?, ?, datetime('now'))
+                       ON CONFLICT(path) DO UPDATE SET byte_offset=excluded.byte_offset,
+                         rows_done=excluded.rows_done, fingerprint=excluded.fingerprint,
+                         updated_at=excluded.updated_at""",
+                    (key, end, rows_done + read, fp)
+                )
+            f.seek(end)
+            if verbose:
+                elapsed = time.perf_counter() - t0
+                print(f"  … {read:,} rows read, {inserted:,} new ({read / elapsed:,.0f} rows/s)")
+    return read, inserted
+
+def main():
+    ap = argparse.ArgumentParser(description="Import denormalized CSV into normalized SQLite schema.")
+    ap.add_argument("--db", default="data/prices.db", help="Path to SQLite DB")
+    ap.add_argument("--file", required=True, help="CSV with columns: item,unit,store,city,price,currency,quantity,date")
+    ap.add_argument("--limit", type=int, default=None, help="Import only first N rows (optional)")
+    ap.add_argument("--bulk", action="store_true", help="Set-based import: stream chunks, batch inserts")
+    ap.add_argument("--incremental", action="store_true",
+                    help="Resume from the last checkpoint for this file and skip duplicate observations")
+    ap.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE,
+                    help="Rows per chunk in --bulk/--incremental mode")
+    args = ap.parse_args()
+    if args.incremental and args.limit:
+        raise SystemExit("--limit cannot be combined with --incremental")
+
+    db_path = Path(args.db)
+    csv_path = Path(args.file)
+    if not db_path.exists():
+        raise SystemExit(f"DB not found: {db_path}. Run: python src/init_db.py")
+    if not csv_path.exists():
+        raise SystemExit(f"CSV not found: {csv_path}")
+
+    t0 = time.perf_counter()
+    with open_connection(db_path) as con:
+        if con.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:  # only on a new or older database
+            migrate(con)
+        if args.incremental:
+            read, inserted = import_incremental(con, csv_path, args.chunksize)
+            print(f"  {read - inserted:,} rows skipped (already imported or missing price)")
+        elif args.bulk:
+            inserted = import_bulk(con, csv_path, args.chunksize, args.limit)
+        else:
+            df = pd.read_csv(csv_path, nrows=args.limit)
+            check_columns(df)
+            inserted = import_rows(con, normalize(df))
+    elapsed = time.perf_counter() - t0
 
-    print(f"✅ Imported {inserted} rows into {db_path} (item/store upsert + price insert)")
+    print(f"✅ Imported {inserted} rows into {db_path} (item/store upsert + price insert) "
+          f"in {elapsed:.1f}s ({inserted / max(elapsed, 1e-9):,.0f} rows/s)")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Local ingestion service: many submitters, one SQLite writer.
+
+Submissions are POSTed as JSON to /prices and put on a bounded queue. A single
+writer thread drains the queue in groups (up to --flush-rows observations, or
+whatever arrived within --flush-ms of the first one), writes each group in one
+transaction with synchronous=FULL, and only then answers the waiting requests.
+An acknowledged price has been fsynced; submitters never contend for the write lock.
+
+    python src/ingest_service.py --port 8765
+    curl -s localhost:8765/prices -d '{"item": "Milk", "price": 1.29, "store": "Market 1", "city": "Helsinki"}'
+
+Set PRICE_TRACKER_INGEST_URL=http://127.0.0.1:8765 to make add_price.py and the
+app's "Save price" submit through the service.
+"""
+from __future__ import annotations
+import argparse
+import json
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib import error as urlerror, request as urlrequest
+import pandas as pd
+from add_price import parse_observation
+from db import DB_PATH, item_key, migrate, open_connection
+from fx import rate
+from import_csv import IdCache
+from rollup import refresh as refresh_rollups
+
+DEFAULT_PORT = 8765
+QUEUE_SIZE = 10_000     # pending submissions before clients get 503
+FLUSH_ROWS = 500        # max observations per commit
+FLUSH_MS = 2.0          # how long the writer waits for more after the first arrival
+SUBMIT_TIMEOUT_S = 30.0
+
+# -------- writer --------
+@dataclass
+class Submission:
+    rows: list[tuple]
+    done: threading.Event = field(default_factory=threading.Event)
+    ids: list[int] | None = None
+    error: str | None = None
+
+class GroupCommitWriter:
+    """Owns the only write connection; turns queued submissions into few, durable transactions."""
+
+    def __init__(self, db_path: Path, queue_size: int = QUEUE_SIZE, flush_rows: int = FLUSH_ROWS,
+                 flush_ms: float = FLUSH_MS):
+        self.queue: queue.Queue[Submission | None] = queue.Queue(queue_size)
+        self.flush_rows, self.flush_s = flush_rows, flush_ms / 1000
+        self.db_path = db_path
+        with open_connection(db_path) as con:
+            migrate(con)
+        con.close()
+        self.stats = {"commits": 0, "rows": 0, "errors": 0}
+        self.thread = threading.Thread(target=self._run, name="ingest-writer", daemon=True)
+
+    def start(self) -> GroupCommitWriter:
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.queue.put(None)
+        self.thread.join()
+
+    def submit(self, rows: list[tuple], timeout: float = SUBMIT_TIMEOUT_S) -> Submission:
+        """Enqueue and wait for the commit (sub.done stays unset on timeout). Raises queue.Full when saturated."""
+        sub = Submission(rows)
+        self.queue.put(sub, timeout=timeout)
+        sub.done.wait(timeout)
+        return sub
+
+    def _next_batch(self) -> list[Submission] | None:
+        first = self.queue.get()
+        if first is None:
+            return None
+        batch, n = [first], len(first.rows)
+        deadline = time.perf_counter() + self.flush_s
+        while n < self.flush_rows:
+            try:
+                wait = deadline - time.perf_counter()
+                sub = self.queue.get_nowait() if wait <= 0 else self.queue.get(timeout=wait)
+            except queue.Empty:
+                break
+            if sub is None:
+                self.queue.put(None)  # stop after this batch
+                break
+            batch.append(sub)
+            n += len(sub.rows)
+        return batch
+
+    def _run(self) -> None:
+        # The connection belongs to this thread, like every other connection in the tracker.
+        self.con = open_connection(self.db_path)
+        self.con.execute("PRAGMA synchronous = FULL")  # commit = fsync of the WAL: safe to acknowledge
+        self.cache = IdCache(self.con)
+        while (batch := self._next_batch()) is not None:
+            try:
+                self._write(batch)
+            except Exception:
+                # One bad submission (e.g. unknown store_id) must not fail the group: retry one by one.
+                # Any error is caught, not just sqlite3's: if this thread died, every later
+                # submission would wait out its timeout while the server kept accepting them.
+                self.con.rollback()
+                self.cache = IdCache(self.con)
+                for sub in batch:
+                    try:
+                        self._write([sub])
+                    except Exception as e:
+                        self.con.rollback()
+                        self.cache = IdCache(self.con)
+                        sub.error = str(e)
+                        self.stats["errors"] += 1
+            for sub in batch:
+                sub.done.set()
+        self.con.close()
+
+    def _write(self, batch: list[Submission]) -> None:
+        rows = [r for sub in batch for r in sub.rows]
+        con = self.con
+        con.execute("BEGIN IMMEDIATE")
+        # Groups are small and mostly known items/stores: plain dict lookups, with IdCache's
+        # set-based resolvers only when a group brings something new.
+        cache = self.cache
+        keys = [item_key(r[0]) for r in rows]
+        if not all(k in cache.items for k in keys):
+            cache.resolve_items(con, pd.Series([r[0] for r in rows]), pd.Series([r[1] for r in rows]))
+        named = [(r[3], r[4]) for r in rows if r[2] is None and r[3]]
+        if not all(k in cache.stores for k in named):
+            cache.resolve_stores(con, pd.Series([n for n, _ in named], dtype=object),
+                                 pd.Series([c for _, c in named], dtype=object))
+        per_base = {(cur, day): rate(con, cur, day) for cur, day in {(r[6], r[8]) for r in rows}}
+        con.executemany(
+            """INSERT INTO price(item_id, store_id, price, currency, quantity, date, price_base)
+               VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            [(cache.items[k], r[2] if r[2] is not None else cache.stores.get((r[3], r[4])),
+              r[5], r[6], r[7], r[8], None if per_base[r[6], r[8]] is None else r[5] / per_base[r[6], r[8]])
+             for r, k in zip(rows, keys)])
+        # Single writer inside BEGIN IMMEDIATE: the new AUTOINCREMENT ids are consecutive.
+        last = con.execute("SELECT seq FROM sqlite_sequence WHERE name = 'price'").fetchone()[0]
+        refresh_rollups(con)
+        con.commit()
+        first = last - len(rows) + 1
+        for sub in batch:
+            sub.ids, first = list(range(first, first + len(sub.rows))), first + len(sub.rows)
+        self.stats["commits"] += 1
+        self.stats["rows"] += len(rows)
+
+# -------- HTTP front end --------
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so load generators can reuse connections
+    disable_nagle_algorithm = True  # headers and body go out as two writes: don't wait ~40 ms for an ACK
+    writer: GroupCommitWriter
+
+    def _reply(self, status: int, body: dict) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self) -> None:
+        if self.path != "/health":
+            return self._reply(404, {"error": "not found"})
+        self._reply(200, {"queued": self.writer.queue.qsize(), **self.writer.stats})
+
+    def do_POST(self) -> None:
+        if self.path != "/prices":
+            return self._reply(404, {"error": "not found"})
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)))
+            rows = [parse_observation(o) for o in (body if isinstance(body, list) else [body])]
+        except (ValueError, TypeError, AttributeError) as e:  # bad JSON, or values of the wrong type
+            return self._reply(400, {"error": str(e)})
+        try:
+            sub = self.writer.submit(rows)
+        except queue.Full:
+            return self._reply(503, {"error": "ingest queue full, retry later"})
+        if not sub.done.is_set():
+            return self._reply(504, {"error": "timed out waiting for commit"})
+        if sub.error:
+            return self._reply(422, {"error": sub.error})
+        self._reply(200, {"ids": sub.ids})
+
+    def log_message(self, format, *args) -> None:  # noqa: A002 - one line per request is too chatty
+        pass
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # the default listen backlog (5) resets bursts of new submitters
+
+def serve(db_path: Path, host: str = "127.0.0.1", port: int = DEFAULT_PORT, **writer_opts) -> ThreadingHTTPServer:
+    """Start the writer and return a (not yet serving) HTTP server bound to host:port."""
+    writer = GroupCommitWriter(db_path, **writer_opts).start()
+    handler = type("BoundHandler", (Handler,), {"writer": writer})
+    server = Server((host, port), handler)
+    server.writer = writer
+    return server
+
+class IngestError(RuntimeError):
+    """The service rejected a submission or could not be reached."""
+
+def submit(url: str, observations: list[dict] | dict, timeout: float = SUBMIT_TIMEOUT_S) -> list[int]:
+    """Client helper: POST observations to a running service and return their price ids."""
+    req = urlrequest.Request(url.rstrip("/") + "/prices", data=json.dumps(observations).encode(),
+                             headers={"Content-Type": "application/json"}, method="POST")
+    try:
+        with urlrequest.urlopen(req, timeout=timeout) as resp:
+            return json.loads(resp.read())["ids"]
+    except urlerror.HTTPError as e:
+        raise IngestError(f"ingest service refused the price ({e.code}): {json.loads(e.read()).get('error')}")
+    except urlerror.URLError as e:
+        raise IngestError(f"ingest service at {url} is not reachable: {e.reason}")
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Serve a local price ingestion endpoint with group commit.")
+    ap.add_argument("--db", default=str(DB_PATH))
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=DEFAULT_PORT)
+    ap.add_argument("--queue-size", type=int, default=QUEUE_SIZE)
+    ap.add_argument("--flush-rows", type=int, default=FLUSH_ROWS, help="Max observations per commit")
+    ap.add_argument("--flush-ms", type=float, default=FLUSH_MS, help="Wait for more submissions after the first")
+    args = ap.parse_args()
+
+    server = serve(Path(args.db), args.host, args.port, queue_size=args.queue_size,
+                   flush_rows=args.flush_rows, flush_ms=args.flush_ms)
+    print(f"Ingest service on http://{args.host}:{args.port} -> {args.db} ✅")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.writer.stop()
+        print(f"Stopped: {server.writer.stats['rows']} prices in {server.writer.stats['commits']} commits")
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,10 @@
 #!/usr/bin/env python3
 from __future__ import annotations
-from pathlib import Path
-from db import connect, exec_script
+from db import connect, migrate
 
 def main() -> None:
-    schema = Path(__file__).resolve().parent / "schema.sql"
-    with connect() as con:
-        exec_script(con, schema)
+    with connect(check_schema=False) as con:
+        migrate(con)
     print("Database initialized ✅")
 
 if __name__ == "__main__":
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Latest price per (item, store), materialized in the `latest_price` table.
+Triggers in schema.sql keep it current on every insert/update/delete of `price`,
+so basket queries cost O(items x stores) instead of O(history).
+"""
+from __future__ import annotations
+import argparse
+import sqlite3
+from db import connect, item_key, q, transaction
+from fx import BASE_CURRENCY, base_price_sql, from_base
+
+REBUILD_SQL = """
+    INSERT INTO latest_price(item_id, store_id, price_id, date, price, quantity, currency, unit_price)
+    SELECT item_id, store_id, id, date, price, quantity, currency, price / NULLIF(quantity, 0)
+    FROM (
+      SELECT p.*, ROW_NUMBER() OVER (PARTITION BY item_id, store_id ORDER BY date DESC, id DESC) AS rn
+      FROM price p
+      WHERE store_id IS NOT NULL
+    )
+    WHERE rn = 1
+"""
+
+def rebuild(con: sqlite3.Connection) -> int:
+    """Recompute the whole table from `price` (after bulk repairs or if triggers were bypassed)."""
+    con.execute("DELETE FROM latest_price")
+    return con.execute(REBUILD_SQL).rowcount
+
+def _latest_by_city_sql(n_items: int) -> str:
+    qmarks = ",".join("?" * n_items)
+    return f"""
+        SELECT city, item, unit_price, currency, date FROM (
+          SELECT s.city AS city, i.name AS item, {base_price_sql()} / NULLIF(p.quantity, 0) AS unit_price,
+                 lp.currency, lp.date,
+                 ROW_NUMBER() OVER (PARTITION BY s.city, lp.item_id
+                                    ORDER BY lp.date DESC, lp.price_id DESC) AS rn
+          FROM item i
+          JOIN latest_price lp ON lp.item_id = i.id
+          JOIN store s ON s.id = lp.store_id
+          JOIN price p ON p.id = lp.price_id
+          WHERE i.name_key IN ({qmarks}) AND s.city IS NOT NULL AND {base_price_sql()} IS NOT NULL
+        )
+        WHERE rn = 1
+    """
+
+def latest_by_city(con: sqlite3.Connection, items: list[str]) -> list[sqlite3.Row]:
+    """
+    Most recent observation of each item in each city (city, item, unit_price, currency, date).
+    unit_price is in fx.BASE_CURRENCY; currency is the one the price was observed in.
+    """
+    if not items:
+        return []
+    return q(con, _latest_by_city_sql(len(items)) + " ORDER BY city, item", tuple(map(item_key, items)))
+
+def basket_by_city(con: sqlite3.Connection, items: list[str], currency: str = BASE_CURRENCY) -> list[sqlite3.Row]:
+    """
+    Basket cost per city as the sum of latest unit prices (city, total), most expensive first.
+    Totals are in `currency`, converted from the base at its most recent FX rate.
+    """
+    if not items:
+        return []
+    sql = f"""SELECT city, SUM(unit_price) * ? AS total FROM ({_latest_by_city_sql(len(items))})
+              GROUP BY city ORDER BY total DESC"""
+    return q(con, sql, (from_base(con, 1.0, currency), *map(item_key, items)))
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Maintain / query the latest-price table.")
+    ap.add_argument("--rebuild", action="store_true", help="Recompute latest_price from the full history")
+    ap.add_argument("--basket", nargs="+", help="Show basket cost by city for these items")
+    ap.add_argument("--currency", default=BASE_CURRENCY, help="Currency of basket totals")
+    args = ap.parse_args()
+
+    con = connect()
+    if args.rebuild:
+        with transaction(con):
+            n = rebuild(con)
+        print(f"latest_price rebuilt: {n} (item, store) rows ✅")
+    if args.basket:
+        from tabulate import tabulate
+        print(tabulate([dict(r) for r in basket_by_city(con, args.basket, args.currency)], headers="keys", tablefmt="github"))
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,118 @@
 #!/usr/bin/env python3
+"""
+List items, stores and prices. Rows stream from the cursor a page at a time, paginated
+by key rather than OFFSET: a full page ends with the --after value that continues it,
+so the 100th page costs what the first does.
+
+    python src/list_data.py                                   # first page of items, stores and prices
+    python src/list_data.py prices --item Milk --limit 100
+    python src/list_data.py prices --after '["2025-03-01", 1042]'
+    python src/list_data.py prices --limit 0 --format ndjson   # everything, streamed
+"""
 from __future__ import annotations
-from tabulate import tabulate
-from db import connect, q
+import argparse
+import csv
+import json
+import sqlite3
+import sys
+from typing import Iterable, Iterator
+from db import connect, execute, item_key
+from partitions import newest
+
+PAGE_ROWS = 50
+STREAM_ROWS = 10_000  # prices read per pass with --limit 0
+# What to list -> (key columns in list order, comparison that moves past a key)
+ORDER = {"items": (("name", "id"), ">"), "stores": (("name", "id"), ">"), "prices": (("date", "id"), "<")}
+
+def rows(con: sqlite3.Connection, what: str, after: list | None = None, limit: int = PAGE_ROWS,
+         item: str | None = None) -> Iterator[sqlite3.Row]:
+    """Rows of `what` in list order, from just past the key `after`; limit 0 = to the end."""
+    keys, op = ORDER[what]
+    where, params = [], []
+    if what == "prices":
+        # Newest first, through partitions.newest(): each file is read only as deep as the page.
+        sql = """SELECT p.id, i.name AS item, i.unit, s.name AS store, s.city,
+                        p.price, p.currency, p.quantity, p.date
+                 FROM {price} p
+                 LEFT JOIN item i ON i.id=p.item_id LEFT JOIN store s ON s.id=p.store_id"""
+        cols = [f"p.{k}" for k in keys]
+        if item:
+            where.append("p.item_id = (SELECT id FROM item WHERE name_key = ?)")
+            params.append(item_key(item))
+    else:
+        sql, cols = f"SELECT * FROM {what[:-1]}", list(keys)
+    direction = " DESC" if op == "<" else ""
+    order = " ORDER BY " + ", ".join(c + direction for c in cols)
+    after_key = f"({', '.join(cols)}) {op} ({', '.join('?' * len(cols))})"
+    if what == "prices":  # --limit 0 streams the history one STREAM_ROWS page after another
+        key = list(after or [])
+        while True:
+            cond = where + ([after_key] if key else [])
+            page = newest(con, sql + (" WHERE " + " AND ".join(cond) if cond else "") + order,
+                          (*params, *key), limit or STREAM_ROWS)
+            yield from page
+            if limit or len(page) < STREAM_ROWS:
+                return
+            key = [page[-1][k] for k in keys]
+    if after:
+        where.append(after_key)
+        params.extend(after)
+    sql += (" WHERE " + " AND ".join(where) if where else "") + order
+    if limit:
+        sql += f" LIMIT {int(limit)}"
+    yield from execute(con, sql, params)
+
+def table(page: list[sqlite3.Row]) -> str:
+    """GitHub-style table like tabulate's (numbers right-aligned), without its ~40 ms import."""
+    cells = [[("" if v is None else str(v)) for v in r] for r in page]
+    numeric = [all(isinstance(r[j], (int, float)) or r[j] is None for r in page) for j in range(len(cells[0]))]
+    widths = [max(len(k), *(len(c[j]) for c in cells)) for j, k in enumerate(page[0].keys())]
+
+    def line(values: list[str]) -> str:
+        return "| " + " | ".join(v.rjust(w) if num else v.ljust(w)
+                                 for v, w, num in zip(values, widths, numeric)) + " |"
+    return "\n".join([line(list(page[0].keys())), "|" + "|".join("-" * (w + 2) for w in widths) + "|",
+                      *map(line, cells)])
+
+def emit(page: Iterable[sqlite3.Row], fmt: str, out=sys.stdout) -> tuple[int, sqlite3.Row | None]:
+    """Write rows as they come (a table needs the whole page first); returns (rows written, last row)."""
+    n, last = 0, None
+    if fmt == "table":
+        page = list(page)
+        if page:
+            out.write(table(page) + "\n")
+        return len(page), page[-1] if page else None
+    writer = csv.writer(out) if fmt == "csv" else None
+    for last in page:
+        if writer is None:
+            out.write(json.dumps(dict(last)) + "\n")
+        else:
+            if n == 0:
+                writer.writerow(last.keys())
+            writer.writerow(tuple(last))
+        n += 1
+    return n, last
 
 def main() -> None:
-    with connect() as con:
-        items = q(con, "SELECT * FROM item ORDER BY name")
-        stores = q(con, "SELECT * FROM store ORDER BY name")
-        prices = q(con, "SELECT p.id, i.name AS item, i.unit, s.name AS store, s.city, p.price, p.currency, p.quantity, p.date FROM price p LEFT JOIN item i ON i.id=p.item_id LEFT JOIN store s ON s.id=p.store_id ORDER BY p.date DESC, i.name")
-    print("\nItems")
-    print(tabulate(items, headers="keys", tablefmt="github"))
-    print("\nStores")
-    print(tabulate(stores, headers="keys", tablefmt="github"))
-    print("\nPrices")
-    print(tabulate(prices, headers="keys", tablefmt="github"))
+    ap = argparse.ArgumentParser(description="List items, stores and prices, one page at a time.")
+    ap.add_argument("what", nargs="?", choices=list(ORDER), help="What to list (default: the first page of each)")
+    ap.add_argument("--limit", type=int, default=PAGE_ROWS, help=f"Rows per page (default {PAGE_ROWS}, 0 = all)")
+    ap.add_argument("--after", type=json.loads, help="Key to continue after, as printed at the end of a page")
+    ap.add_argument("--item", help="With prices: only this item")
+    ap.add_argument("--format", choices=["table", "csv", "ndjson"], default="table")
+    args = ap.parse_args()
+    if args.after is not None and not (args.what and isinstance(args.after, list)
+                                       and len(args.after) == len(ORDER[args.what][0])):
+        ap.error("--after needs what to list and its key as printed, e.g. prices --after '[\"2025-03-01\", 1042]'")
+
+    con = connect()
+    for what in [args.what] if args.what else list(ORDER):
+        if not args.what and args.format == "table":
+            print(f"\n{what.title()}")
+        n, last = emit(rows(con, what, args.after, args.limit, args.item), args.format)
+        if args.limit and n == args.limit:  # a full page: there may be more
+            key = json.dumps([last[k] for k in ORDER[what][0]])
+            print(f"Next page: {what} --after '{key}'", file=sys.stderr)
 
 if __name__ == "__main__":
     main()
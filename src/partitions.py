@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+Optional time partitioning of price history into per-year (or per-quarter) archive files.
+
+    python src/partitions.py --archive-before 2025-01-01            # one file per year
+    python src/partitions.py --archive-before 2025-07-01 --by quarter --vacuum
+    python src/partitions.py --backup /mnt/backup/prices           # copies only changed archives
+    python src/partitions.py                                        # list the catalog
+
+Archiving moves old rows out of `price` into partitions/price_<period>.db next to the
+database, then compacts each file with VACUUM INTO and makes it read-only. The
+`price_partition` catalog records every file's date range. New writes, triggers,
+latest_price and the rollups stay in the main file, so recent queries and charts keep
+their cost however large the archives grow. Rows that are some (item, store)'s
+latest price are never archived (baskets join them by id).
+
+Readers that need history ask price_source(con, start, end) for a table to select from:
+plain `price` when no archive overlaps the range, otherwise a temp view over main.price
+UNION ALL the overlapping archives, which are ATTACHed on first use. SQLite attaches at
+most SQLITE_LIMIT_ATTACHED (10) files per connection, so full-history passes (rollup and
+anomaly rebuilds, FX backfills, snapshots) use archived_rows() instead: it runs a query
+on each archive through a separate read-only connection that attaches them in batches,
+and works inside a write transaction. Incremental-import dedup (obs_hash) only sees rows
+still in the main file.
+"""
+from __future__ import annotations
+import argparse
+import hashlib
+import json
+import shutil
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+from db import Connection, connect, q, transaction
+from rollup import refresh as refresh_rollups
+
+PARTITION_DIR = "partitions"
+COLUMNS = "id, item_id, store_id, price, currency, quantity, date, obs_hash, price_base"
+PERIODS = {
+    "year": "substr(date, 1, 4)",
+    "quarter": "substr(date, 1, 4) || 'q' || ((CAST(substr(date, 6, 2) AS INTEGER) + 2) / 3)",
+}
+# An archive holds plain rows: no foreign keys (item/store live in the main file) and no triggers.
+PARTITION_DDL = """
+CREATE TABLE IF NOT EXISTS _archive.price (
+  id INTEGER PRIMARY KEY,
+  item_id INTEGER NOT NULL,
+  store_id INTEGER,
+  price REAL NOT NULL,
+  currency TEXT NOT NULL,
+  quantity REAL NOT NULL,
+  date TEXT NOT NULL,
+  obs_hash TEXT,
+  price_base REAL
+);
+CREATE INDEX IF NOT EXISTS _archive.idx_price_item_date ON price(item_id, date);
+CREATE INDEX IF NOT EXISTS _archive.idx_price_store_date ON price(store_id, date);
+CREATE INDEX IF NOT EXISTS _archive.idx_price_date ON price(date);
+"""
+_MOVABLE = "date < ? AND id NOT IN (SELECT price_id FROM latest_price)"
+
+def _main_path(con: sqlite3.Connection) -> Path:
+    return Path(next(r[2] for r in con.execute("PRAGMA database_list") if r[1] == "main"))
+
+def _base_dir(con: sqlite3.Connection) -> Path:
+    """Directory of the main database file; catalog paths are relative to it."""
+    return _main_path(con).parent
+
+def _schema(name: str) -> str:
+    return f"p_{name}"
+
+def _sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def catalog(con: sqlite3.Connection, start: str | None = None, end: str | None = None) -> list[sqlite3.Row]:
+    """Partitions whose date range overlaps [start, end], newest first."""
+    return q(con, """SELECT name, path, lo, hi, rows, bytes, checksum, archived_at FROM price_partition
+                     WHERE hi >= COALESCE(?, hi) AND lo <= COALESCE(?, lo)
+                     ORDER BY hi DESC""", (start, end))
+
+# -------- reading --------
+def _attach(con: sqlite3.Connection, parts: list[sqlite3.Row]) -> None:
+    """ATTACH the given partitions unless this connection already has the same file version."""
+    attached: dict[str, str] | None = getattr(con, "partitions", None)
+    if attached is None:
+        attached = con.partitions = {}  # schema -> checksum, per connection
+    todo = [p for p in parts if attached.get(_schema(p["name"])) != p["checksum"]]
+    if not todo:
+        return
+    if con.in_transaction:
+        raise RuntimeError("partitions must be attached outside a transaction: call price_source(con) first")
+    limit = _attach_limit(con)
+    if len(parts) > limit:
+        raise SystemExit(f"{len(parts)} archived partitions overlap the requested dates; SQLite attaches at "
+                         f"most {limit}. Narrow the date range.")
+    # Re-archived files have a new checksum and are re-attached; make room by dropping unneeded ones.
+    drop = {_schema(p["name"]) for p in todo} & attached.keys()
+    if len(attached) - len(drop) + len(todo) > limit:
+        drop |= attached.keys() - {_schema(p["name"]) for p in parts}
+    for schema in drop:
+        con.execute(f"DETACH DATABASE {schema}")
+        del attached[schema]
+    base = _base_dir(con)
+    for p in todo:
+        con.execute(f"ATTACH DATABASE ? AS {_schema(p['name'])}", (str(base / p["path"]),))
+        attached[_schema(p["name"])] = p["checksum"]
+
+def detach_all(con: sqlite3.Connection) -> None:
+    for schema in list(getattr(con, "partitions", None) or {}):
+        con.execute(f"DETACH DATABASE {schema}")
+    con.partitions = {}
+    if getattr(con, "archive_reader", None) is not None:
+        con.archive_reader.close()
+        con.archive_reader = None
+
+def _attach_limit(con: sqlite3.Connection) -> int:
+    return con.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED) if hasattr(con, "getlimit") else 10
+
+def reader(con: sqlite3.Connection) -> Connection:
+    """
+    This connection's read-only companion on the same file, for archived_rows(). It never
+    holds a transaction open, so it can detach one batch of archives and attach the next
+    while `con` is inside a write transaction. Main-file tables read through it (item,
+    store) show their last committed state.
+    """
+    rcon = getattr(con, "archive_reader", None)
+    if rcon is None:
+        rcon = sqlite3.connect(_main_path(con), factory=Connection, isolation_level=None)
+        rcon.execute("PRAGMA query_only = ON")
+        con.archive_reader = rcon
+    return rcon
+
+def archived_rows(con: sqlite3.Connection, sql: str, params: tuple = (), start: str | None = None,
+                  end: str | None = None) -> list[tuple]:
+    """
+    Rows of `sql` run on every archive overlapping [start, end], concatenated as plain
+    tuples; `sql` reads the archive as `{price}`. The archives are attached to reader(con)
+    at most SQLITE_LIMIT_ATTACHED - 1 at a time, so any number of them can be read.
+    """
+    parts = catalog(con, start, end)
+    if not parts:
+        return []
+    rcon = reader(con)
+    step = max(1, _attach_limit(rcon) - 1)
+    rows = []
+    for i in range(0, len(parts), step):
+        batch = parts[i:i + step]
+        _attach(rcon, batch)
+        for p in batch:
+            cur = rcon.cursor()
+            cur.row_factory = None
+            rows += cur.execute(sql.format(price=f"{_schema(p['name'])}.price"), params).fetchall()
+    return rows
+
+def max_id(con: sqlite3.Connection, archives: bool = False) -> int:
+    """Largest price id in the main file, or in the main file and every archive."""
+    hi = con.execute("SELECT COALESCE(MAX(id), 0) FROM price").fetchone()[0]
+    if archives:
+        hi = max([hi] + [r[0] or 0 for r in archived_rows(con, "SELECT MAX(id) FROM {price}")])
+    return hi
+
+def price_source(con: sqlite3.Connection, start: str | None = None, end: str | None = None) -> str:
+    """
+    Table to select price rows dated in [start, end] from (ISO dates, inclusive, None = open):
+    `price` if no archive overlaps, else a temp view over main.price UNION ALL those archives.
+    Date filters on the view are pushed into every part. Call it outside a transaction.
+    """
+    parts = catalog(con, start, end)
+    if not parts:
+        return "price"
+    _attach(con, parts)
+    key = "|".join(f"{p['name']}:{p['checksum']}" for p in parts)
+    view = "price_parts_" + hashlib.blake2b(key.encode(), digest_size=6).hexdigest()
+    selects = [f"SELECT {COLUMNS} FROM {schema}.price" for schema in ["main", *(_schema(p["name"]) for p in parts)]]
+    con.execute(f"CREATE TEMP VIEW IF NOT EXISTS {view} AS " + " UNION ALL ".join(selects))
+    return view
+
+def newest(con: sqlite3.Connection, select: str, params: tuple = (), limit: int = 50,
+           offset: int = 0) -> list[sqlite3.Row]:
+    """
+    One page of `select` across main and the archives. `select` reads `{price} p`, orders by
+    p.date DESC, p.id DESC and returns `date` and `id` columns. Each file is read newest-first
+    only as deep as the page, and archives older than a full page are never opened.
+    """
+    need = limit + offset
+    sql = select + " LIMIT ?"
+    rows = q(con, sql.format(price="main.price"), (*params, need))
+    for part in catalog(con):
+        rows.sort(key=lambda r: (r["date"], r["id"]), reverse=True)
+        if len(rows) >= need and rows[need - 1]["date"] > part["hi"]:
+            break
+        _attach(con, [part])
+        rows += q(con, sql.format(price=f"{_schema(part['name'])}.price"), (*params, need))
+    rows.sort(key=lambda r: (r["date"], r["id"]), reverse=True)
+    return rows[offset:need]
+
+# -------- archiving --------
+def compact(path: Path) -> None:
+    """Rewrite a partition with VACUUM INTO (rollback journal, no free pages) and make it read-only."""
+    tmp = path.with_suffix(".vacuum")
+    tmp.unlink(missing_ok=True)
+    with closing(sqlite3.connect(path)) as src:
+        src.execute("VACUUM INTO ?", (str(tmp),))
+    with closing(sqlite3.connect(tmp)) as dst:
+        dst.execute("PRAGMA journal_mode = DELETE")  # read-only files can't host a WAL
+    tmp.chmod(0o444)
+    tmp.replace(path)
+
+def archive(con: sqlite3.Connection, before: str, by: str = "year") -> list[tuple[str, int]]:
+    """
+    Move price rows dated before `before` into one partition per year/quarter and compact
+    each file. Re-running adds later-arriving old rows to existing partitions.
+    Returns (partition, rows moved) pairs.
+    """
+    detach_all(con)
+    with transaction(con):
+        refresh_rollups(con)  # refresh() only reads the main file: fold everything in before it leaves
+    period = PERIODS[by]
+    names = [r[0] for r in con.execute(f"SELECT DISTINCT {period} FROM price WHERE {_MOVABLE} ORDER BY 1", (before,))]
+    base = _base_dir(con)
+    moved = []
+    for name in names:
+        rel = f"{PARTITION_DIR}/price_{name}.db"
+        path = base / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.exists():
+            path.chmod(0o644)
+        where = f"{period} = ? AND {_MOVABLE}"
+        con.execute("ATTACH DATABASE ? AS _archive", (str(path),))
+        try:
+            con.executescript(PARTITION_DDL)
+            # Copy first, then delete + catalog in one main-file transaction: readers see each
+            # row in exactly one place, and an interrupted run is finished by running it again.
+            with transaction(con):
+                n = con.execute(f"""INSERT OR IGNORE INTO _archive.price({COLUMNS})
+                                    SELECT {COLUMNS} FROM main.price WHERE {where}""", (name, before)).rowcount
+            with transaction(con):
+                trigger = con.execute("SELECT sql FROM sqlite_master WHERE name = 'trg_latest_price_delete'").fetchone()
+                if trigger:  # only non-latest rows leave, so there is nothing for it to recompute
+                    con.execute("DROP TRIGGER trg_latest_price_delete")
+                con.execute(f"DELETE FROM main.price WHERE {where} AND id IN (SELECT id FROM _archive.price)",
+                            (name, before))
+                if trigger:
+                    con.execute(trigger[0])
+                con.execute("""INSERT INTO price_partition(name, path, lo, hi, rows)
+                               SELECT ?, ?, MIN(date), MAX(date), COUNT(*) FROM _archive.price WHERE true
+                               ON CONFLICT(name) DO UPDATE SET lo = excluded.lo, hi = excluded.hi,
+                                 rows = excluded.rows, archived_at = datetime('now')""", (name, rel))
+        finally:
+            con.execute("DETACH DATABASE _archive")
+        compact(path)
+        with transaction(con):
+            con.execute("UPDATE price_partition SET bytes = ?, checksum = ? WHERE name = ?",
+                        (path.stat().st_size, _sha256(path), name))
+        moved.append((name, n))
+    return moved
+
+def update_archives(con: sqlite3.Connection, sql: str, params: tuple = ()) -> int:
+    """
+    Run an UPDATE (`sql` writes `{price}`) on every archive, then compact each file again
+    and record its new checksum; returns rows changed. For corrections that must reach
+    archived rows too (fx.py recomputing price_base). Call it outside a transaction.
+    """
+    detach_all(con)
+    base = _base_dir(con)
+    changed = 0
+    for p in catalog(con):
+        path = base / p["path"]
+        path.chmod(0o644)
+        con.execute("ATTACH DATABASE ? AS _archive", (str(path),))
+        try:
+            with transaction(con):
+                changed += con.execute(sql.format(price="_archive.price"), params).rowcount
+        finally:
+            con.execute("DETACH DATABASE _archive")
+        compact(path)
+        with transaction(con):
+            con.execute("UPDATE price_partition SET bytes = ?, checksum = ? WHERE name = ?",
+                        (path.stat().st_size, _sha256(path), p["name"]))
+    return changed
+
+# -------- backup --------
+def backup(con: sqlite3.Connection, dest: Path) -> tuple[int, int]:
+    """
+    Back up into directory `dest`: the main file with SQLite's online backup, archives by
+    file copy, skipping those whose checksum matches dest/manifest.json.
+    Returns (partitions copied, partitions skipped).
+    """
+    main = _main_path(con)
+    base = main.parent
+    dest.mkdir(parents=True, exist_ok=True)
+    with closing(sqlite3.connect(dest / main.name)) as out:
+        con.backup(out)
+    manifest_path = dest / "manifest.json"
+    manifest = json.loads(manifest_path.read_text(encoding="utf-8")) if manifest_path.exists() else {}
+    copied = skipped = 0
+    for p in catalog(con):
+        target = dest / p["path"]
+        if manifest.get(p["name"]) == p["checksum"] and target.exists():
+            skipped += 1
+            continue
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.unlink(missing_ok=True)  # the previous copy is read-only
+        shutil.copy2(base / p["path"], target)
+        manifest[p["name"]] = p["checksum"]
+        copied += 1
+    manifest_path.write_text(json.dumps(manifest, indent=2) + "\n", encoding="utf-8")
+    return copied, skipped
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Archive old prices into per-period partition files.")
+    ap.add_argument("--archive-before", metavar="DATE", help="Move prices dated before this ISO date")
+    ap.add_argument("--by", choices=sorted(PERIODS), default="year", help="Partition size")
+    ap.add_argument("--vacuum", action="store_true", help="VACUUM the main database after archiving")
+    ap.add_argument("--backup", metavar="DIR", help="Back up the database, copying only changed partitions")
+    args = ap.parse_args()
+
+    con = connect()
+    if args.archive_before:
+        moved = archive(con, args.archive_before, args.by)
+        for name, n in moved:
+            print(f"  {name}: {n:,} prices archived")
+        print(f"Archived {sum(n for _, n in moved):,} prices into {len(moved)} partitions ✅")
+        if args.vacuum:
+            con.execute("VACUUM")
+            print(f"Main database compacted to {_main_path(con).stat().st_size / 2**20:,.1f} MiB ✅")
+    if args.backup:
+        copied, skipped = backup(con, Path(args.backup))
+        print(f"Backed up to {args.backup}: {copied} partitions copied, {skipped} unchanged ✅")
+
+    from tabulate import tabulate
+    parts = [dict(r) for r in catalog(con)]
+    main_rows = con.execute("SELECT COUNT(*) FROM price").fetchone()[0]
+    print(f"\nMain database: {main_rows:,} prices")
+    if parts:
+        for p in parts:
+            p["checksum"] = p["checksum"][:12]
+        print(tabulate(parts, headers="keys", tablefmt="github"))
+
+if __name__ == "__main__":
+    main()
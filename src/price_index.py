@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Chained price index per city for a weighted basket of items.
+
+A basket is a set of items with fixed weights (`index_basket`). For every city and
+period (month or week) the index moves by the link: the weighted geometric mean of
+the basket items' price relatives to the city's previous period, over the items priced
+in both (Jevons aggregation with Laspeyres-style fixed weights). Levels chain the
+links from 100 in the city's first period, so items missing in some periods don't
+break the series; `coverage` reports the share of basket weight each link is based on.
+
+Prices are the mean unit prices of the rollups, minus flagged anomalies, so the cost
+depends on items x cities x periods, never on the number of price rows. Results are
+stored in `price_index` with a fingerprint of each period's cells: update() recomputes
+only from the first period whose cells changed (a new period, or late observations in
+an old one), chaining on from the stored level before it.
+
+    python src/price_index.py --define groceries Milk=2 Bread Eggs=0.5
+    python src/price_index.py --basket groceries
+    python src/analytics.py --index groceries
+"""
+from __future__ import annotations
+import argparse
+import sqlite3
+import numpy as np
+import pandas as pd
+from db import connect, execute, executemany, item_key, q, transaction
+from rollup import cell_frame
+
+BASE = 100.0
+GRAIN_CHOICES = ("month", "week")
+
+def parse_weights(specs: list[str]) -> dict[str, float]:
+    """["Milk=2", "Bread"] -> {"Milk": 2.0, "Bread": 1.0}"""
+    weights = {}
+    for spec in specs:
+        name, _, w = spec.rpartition("=") if "=" in spec else (spec, "", "1")
+        weights[name.strip()] = float(w)
+    return weights
+
+def define(con: sqlite3.Connection, basket: str, weights: dict[str, float]) -> int:
+    """Create or replace a basket (item name -> weight); its stored index is recomputed on the next update."""
+    ids = {}
+    for name, w in weights.items():
+        row = con.execute("SELECT id FROM item WHERE name_key = ?", (item_key(name),)).fetchone()
+        if row is None:
+            raise ValueError(f"Unknown item '{name}'")
+        if not w > 0:
+            raise ValueError(f"Weight of '{name}' must be positive")
+        ids[row[0]] = w
+    if not ids:
+        raise ValueError("A basket needs at least one item")
+    execute(con, "DELETE FROM index_basket WHERE name = ?", (basket,))
+    execute(con, "DELETE FROM price_index WHERE basket = ?", (basket,))
+    executemany(con, "INSERT INTO index_basket(name, item_id, weight) VALUES (?, ?, ?)",
+                [(basket, i, w) for i, w in ids.items()])
+    return len(ids)
+
+def baskets(con: sqlite3.Connection) -> list[sqlite3.Row]:
+    return q(con, """SELECT b.name, group_concat(i.name || '=' || b.weight, ', ') AS items
+                     FROM index_basket b JOIN item i ON i.id = b.item_id
+                     GROUP BY b.name ORDER BY b.name""")
+
+def _fingerprints(cells: pd.DataFrame) -> pd.Series:
+    """Order-independent hash of each (city, period)'s cells, as hex strings."""
+    h = pd.util.hash_pandas_object(cells[["item_id", "n", "sum"]], index=False).to_numpy()
+    keys = pd.MultiIndex.from_frame(cells[["city", "period"]])
+    order = np.lexsort((cells["period"].to_numpy(), cells["city"].to_numpy()))
+    keys, h = keys[order], h[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    return pd.Series([f"{x:016x}" for x in np.bitwise_xor.reduceat(h, starts).tolist()], index=keys[starts])
+
+def _changes(con: sqlite3.Connection, basket: str, grain: str) -> tuple[dict, pd.DataFrame, pd.Series, dict, dict]:
+    """
+    Compare the basket's cells with the stored index, reading only: (weights, cells,
+    fingerprints, stored (fingerprint, level) per (city, period), first changed period per city).
+    """
+    weights = {r[0]: r[1] for r in execute(con, "SELECT item_id, weight FROM index_basket WHERE name = ?", (basket,))}
+    if not weights:
+        raise ValueError(f"No basket named '{basket}'")
+    cells = cell_frame(con, grain, sorted(weights))
+    fps = _fingerprints(cells) if not cells.empty else pd.Series(dtype=str)
+    stored = {(r[0], r[1]): (r[2], r[3]) for r in execute(con, """
+        SELECT city, period, fingerprint, level FROM price_index WHERE basket = ? AND grain = ?""", (basket, grain))}
+    start: dict[str, str] = {}  # per city: first period to recompute
+    for key in [k for k, fp in fps.items() if stored.get(k, (None,))[0] != fp] + [k for k in stored if k not in fps]:
+        start[key[0]] = min(start.get(key[0], key[1]), key[1])
+    return weights, cells, fps, stored, start
+
+def update(con: sqlite3.Connection, basket: str, grain: str = "month") -> int:
+    """
+    Bring the basket's index at `grain` up to date; returns the number of (city, period)
+    rows recomputed. Run it inside a write transaction.
+    """
+    weights, cells, fps, stored, start = _changes(con, basket, grain)
+    if not start:
+        return 0
+    executemany(con, "DELETE FROM price_index WHERE basket = ? AND grain = ? AND city = ? AND period >= ?",
+                [(basket, grain, city, p) for city, p in start.items()])
+    # The last kept period of each city anchors the chain: its prices are the base of the first new link.
+    anchor = {}
+    for (city, period), (_, level) in stored.items():
+        if city in start and period < start[city] and period > anchor.get(city, ("",))[0]:
+            anchor[city] = (period, level)
+    lo = {city: anchor.get(city, (p,))[0] for city, p in start.items()}
+    c = cells[cells["city"].isin(lo.keys())]
+    c = c[c["period"] >= c["city"].map(lo)].sort_values(["city", "period", "item_id"])
+    if c.empty:
+        return 0
+    periods = c[["city", "period"]].drop_duplicates()
+    periods["prev"] = periods.groupby("city")["period"].shift()
+    c = c.merge(periods, on=["city", "period"]).merge(
+        c[["city", "period", "item_id", "mean"]].rename(columns={"period": "prev", "mean": "prev_mean"}),
+        on=["city", "prev", "item_id"], how="left")
+    w = c["item_id"].map(weights).to_numpy()
+    matched = c["prev_mean"].notna().to_numpy()
+    c["wlr"] = np.where(matched, w * np.log(c["mean"] / c["prev_mean"]), 0.0)
+    c["wm"] = np.where(matched, w, 0.0)
+    g = c.groupby(["city", "period"], sort=True).agg(wlr=("wlr", "sum"), wm=("wm", "sum"), items=("item_id", "size"))
+    g = g.reset_index()
+    g["link"] = np.exp(g["wlr"] / g["wm"].where(g["wm"] > 0))
+    g["coverage"] = g["wm"] / sum(weights.values())
+    first = ~g["city"].duplicated()
+    log_link = np.log(g["link"].fillna(1.0)).where(~first, 0.0)  # a city's first row is the anchor (or the base)
+    base = g["city"].map(lambda city: anchor.get(city, (None, BASE))[1])
+    g["level"] = base * np.exp(log_link.groupby(g["city"]).cumsum())
+    g = g[g["period"] >= g["city"].map(start)]
+    rows = [(basket, grain, city, period, None if np.isnan(link) else float(link), float(level), float(cov),
+             int(items), fps[(city, period)])
+            for city, period, link, level, cov, items in
+            zip(g["city"], g["period"], g["link"], g["level"], g["coverage"], g["items"])]
+    executemany(con, """
+        INSERT INTO price_index(basket, grain, city, period, link, level, coverage, items, fingerprint)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, rows)
+    return len(rows)
+
+def index_frame(con: sqlite3.Connection, basket: str, grain: str = "month", min_coverage: float = 0.0) -> pd.DataFrame:
+    """
+    The basket's index as a DataFrame: index period start, columns city. Periods whose
+    link covers less than min_coverage of the basket weight are left blank. The stored
+    chain is read without a transaction; only an out-of-date basket is updated first.
+    """
+    if _changes(con, basket, grain)[-1]:
+        with transaction(con):
+            update(con, basket, grain)
+    rows = q(con, """SELECT period, city, level FROM price_index
+                     WHERE basket = ? AND grain = ? AND (coverage >= ? OR link IS NULL)
+                     ORDER BY period, city""", (basket, grain, min_coverage))
+    if not rows:
+        return pd.DataFrame()
+    pivot = pd.DataFrame([dict(r) for r in rows]).pivot(index="period", columns="city", values="level")
+    pivot.index = pd.to_datetime(pivot.index)
+    pivot.index.name = grain
+    return pivot
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Chained price index per city for a weighted basket.")
+    ap.add_argument("--define", nargs="+", metavar=("BASKET", "ITEM[=WEIGHT]"),
+                    help="Create or replace a basket, e.g. --define groceries Milk=2 Bread Eggs=0.5")
+    ap.add_argument("--basket", help="Update this basket's index and print its latest levels")
+    ap.add_argument("--grain", choices=GRAIN_CHOICES, default="month")
+    args = ap.parse_args()
+
+    con = connect()
+    if args.define:
+        if len(args.define) < 2:
+            ap.error("--define needs a basket name and at least one item")
+        try:
+            with transaction(con):
+                n = define(con, args.define[0], parse_weights(args.define[1:]))
+        except ValueError as e:
+            raise SystemExit(f"❌ {e}")
+        print(f"Basket '{args.define[0]}' defined with {n} items ✅")
+    from tabulate import tabulate
+    if args.basket:
+        try:
+            with transaction(con):
+                n = update(con, args.basket, args.grain)
+        except ValueError as e:
+            raise SystemExit(f"❌ {e}")
+        print(f"Index '{args.basket}' updated: {n} (city, {args.grain}) rows recomputed ✅")
+        rows = q(con, """SELECT city, period, level, link, coverage, items FROM price_index p
+                         WHERE basket = ? AND grain = ?
+                           AND period = (SELECT MAX(period) FROM price_index
+                                         WHERE basket = p.basket AND grain = p.grain AND city = p.city)
+                         ORDER BY level DESC""", (args.basket, args.grain))
+        if rows:
+            print(tabulate([dict(r) for r in rows], headers="keys", tablefmt="github", floatfmt=".3f"))
+    elif not args.define:
+        rows = baskets(con)
+        print(tabulate([dict(r) for r in rows], headers="keys", tablefmt="github") if rows else
+              "No baskets yet: python src/price_index.py --define NAME ITEM[=WEIGHT] ...")
+
+if __name__ == "__main__":
+    main()
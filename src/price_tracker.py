@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+One command line for the tools in src/: each subcommand runs the script of the same
+name with the rest of the arguments (`price_tracker.py add-price --help` shows its options).
+
+    python src/price_tracker.py add-price --item Milk --price 1.29 --store-id 1
+    collector | python src/price_tracker.py add-price --stdin     # NDJSON or CSV, one transaction
+    python src/price_tracker.py list prices --item Milk
+    python src/price_tracker.py analytics --item Milk
+
+A subcommand's module is imported only once it is chosen. add-item, add-store and list
+never load NumPy, pandas or Matplotlib; add-price and init load NumPy only for the anomaly
+check. `python benchmarks/bench_cli.py` holds their cold start to a budget.
+"""
+from __future__ import annotations
+import argparse
+import importlib
+import sys
+
+# subcommand -> (module, summary)
+COMMANDS = {
+    "init": ("init_db", "Create or migrate the database"),
+    "add-item": ("add_item", "Add an item"),
+    "add-store": ("add_store", "Add a store"),
+    "add-price": ("add_price", "Add a price, or a batch of them from stdin (--stdin)"),
+    "list": ("list_data", "List items, stores or prices a page at a time"),
+    "import": ("import_csv", "Import a CSV of price observations"),
+    "analytics": ("analytics", "Trend, basket, forecast and index charts"),
+}
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Community Price Tracker command line.")
+    sub = ap.add_subparsers(dest="command", required=True, metavar="COMMAND")
+    for name, (_, summary) in COMMANDS.items():
+        sub.add_parser(name, help=summary, add_help=False)  # --help goes to the subcommand's own parser
+    args, rest = ap.parse_known_args()
+
+    module = importlib.import_module(COMMANDS[args.command][0])
+    sys.argv = [f"{ap.prog} {args.command}", *rest]
+    module.main()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Day/week/month rollups of unit prices per (item, city) for trend charts.
+
+refresh() folds every price row above the stored watermark into `price_rollup`
+(count, sum, min, max of unit price in fx.BASE_CURRENCY) and `price_rollup_hist` (log-bucket histogram for medians),
+so its cost depends on the number of new rows only. Charts read a few hundred
+aggregate rows instead of the raw history.
+"""
+from __future__ import annotations
+import argparse
+import math
+import sqlite3
+from datetime import date
+from db import connect, execute, executemany, item_key, q, transaction
+from fx import base_price_sql, from_base
+
+GRAINS = {
+    "day": "day",
+    "week": "date(day, 'weekday 0', '-6 days')",  # Monday of the ISO week
+    "month": "strftime('%Y-%m-01', day)",
+}
+HIST_ALPHA = 0.02  # bucket width: medians are within ~1% of the exact value
+UNKNOWN_CITY = "Unknown"
+
+def _ensure_math(con: sqlite3.Connection) -> None:
+    """SQLite builds without the math functions get Python versions of the ones used here."""
+    try:
+        con.execute("SELECT ln(1), floor(1.5), pow(2, 2)")
+    except sqlite3.OperationalError:
+        con.create_function("ln", 1, lambda x: math.log(x) if x and x > 0 else None, deterministic=True)
+        con.create_function("floor", 1, lambda x: None if x is None else math.floor(x), deterministic=True)
+        con.create_function("pow", 2, lambda x, y: None if x is None or y is None else x ** y, deterministic=True)
+
+def _bucket(u: str) -> str:
+    """SQL for the histogram bucket of unit price expression `u`."""
+    return (f"CASE WHEN {u} > 0 THEN CAST(floor(ln({u}) / {math.log1p(HIST_ALPHA)!r}) AS INTEGER) "
+            "ELSE -1000000 END")
+
+def watermark(con: sqlite3.Connection, name: str) -> int:
+    row = con.execute("SELECT last_price_id FROM derived_state WHERE name=?", (name,)).fetchone()
+    return row[0] if row else 0
+
+def set_watermark(con: sqlite3.Connection, name: str, last_id: int) -> None:
+    con.execute("""INSERT INTO derived_state(name, last_price_id) VALUES(?, ?)
+                   ON CONFLICT(name) DO UPDATE SET last_price_id=excluded.last_price_id""", (name, last_id))
+
+# Per-(item, day, city, bucket) cells of the rows lo < id <= hi of `{price}`.
+_CELLS_SQL = f"""
+    SELECT item_id, day, city, bucket, COUNT(*) AS n, SUM(u) AS s, MIN(u) AS lo, MAX(u) AS hi
+    FROM (
+      SELECT p.item_id, date(p.date) AS day, COALESCE(s.city, '{UNKNOWN_CITY}') AS city, u,
+             {_bucket("u")} AS bucket
+      FROM (SELECT item_id, store_id, date, {base_price_sql("")} / NULLIF(quantity, 0) AS u
+            FROM {{price}} WHERE id > ? AND id <= ?) p
+      LEFT JOIN store s ON s.id = p.store_id
+    )
+    WHERE u IS NOT NULL AND day IS NOT NULL
+    GROUP BY item_id, day, city, bucket
+"""
+
+def refresh(con: sqlite3.Connection, archives: bool = False) -> int:
+    """
+    Fold price rows added since the last refresh into the rollups; returns rows processed.
+    Run it inside the write transaction that inserted them (or any write transaction).
+    archives=True also reads the archived partitions (rebuild() passes it after a reset).
+    The anomaly detector (its own watermark) is brought up to date first.
+
+    The new rows are grouped once into per-(item, day, city, bucket) cells; week and month
+    aggregates are then summed from those cells rather than from the raw rows.
+    """
+    from anomaly import update as update_anomalies
+    from partitions import archived_rows, max_id, reader
+
+    update_anomalies(con, archives)
+    lo = watermark(con, "rollup")
+    hi = max_id(con, archives)
+    if hi <= lo:
+        return 0
+    _ensure_math(con)
+    execute(con, "DROP TABLE IF EXISTS temp._rollup_cells")
+    execute(con, "CREATE TEMP TABLE _rollup_cells AS " + _CELLS_SQL.format(price="main.price"), (lo, hi))
+    if archives:
+        _ensure_math(reader(con))
+        executemany(con, "INSERT INTO _rollup_cells VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    archived_rows(con, _CELLS_SQL, (lo, hi)))
+    for grain, period in GRAINS.items():
+        execute(con, f"""
+            INSERT INTO price_rollup(item_id, grain, period, city, n, sum_unit, min_unit, max_unit)
+            SELECT item_id, '{grain}', {period} AS period, city, SUM(n), SUM(s), MIN(lo), MAX(hi)
+            FROM _rollup_cells
+            GROUP BY item_id, period, city
+            ON CONFLICT(item_id, grain, period, city) DO UPDATE SET
+              n = n + excluded.n, sum_unit = sum_unit + excluded.sum_unit,
+              min_unit = MIN(min_unit, excluded.min_unit), max_unit = MAX(max_unit, excluded.max_unit)
+        """)
+        execute(con, f"""
+            INSERT INTO price_rollup_hist(item_id, grain, period, city, bucket, n)
+            SELECT item_id, '{grain}', {period} AS period, city, bucket, SUM(n)
+            FROM _rollup_cells
+            GROUP BY item_id, period, city, bucket
+            ON CONFLICT(item_id, grain, period, city, bucket) DO UPDATE SET n = n + excluded.n
+        """)
+    n = execute(con, "SELECT COALESCE(SUM(n), 0) FROM _rollup_cells").fetchone()[0]
+    execute(con, "DROP TABLE temp._rollup_cells")
+    set_watermark(con, "rollup", hi)
+    return n
+
+def rebuild(con: sqlite3.Connection) -> int:
+    """
+    Drop all aggregates and recompute from the full history (after deletes/edits), archives included.
+    Anomaly flags are recomputed too: they are subtracted from these aggregates.
+    """
+    from anomaly import reset as reset_anomalies
+
+    reset_anomalies(con)
+    con.execute("DELETE FROM price_rollup")
+    con.execute("DELETE FROM price_rollup_hist")
+    set_watermark(con, "rollup", 0)
+    return refresh(con, archives=True)
+
+def choose_grain(start: date, end: date) -> str:
+    """Keep charts to a few hundred points: daily up to ~4 months, weekly up to ~2 years, else monthly."""
+    span = (end - start).days
+    if span <= 120:
+        return "day"
+    if span <= 730:
+        return "week"
+    return "month"
+
+_ITEM_ID = "SELECT id FROM item WHERE name_key = ?"
+
+def _flagged(grain: str, by_bucket: bool = False) -> str:
+    """
+    CTE body: the item's anomaly.py flags per (period, city[, bucket]) with their count n
+    and unit-price sum s, or no rows when its first parameter is false. Rollup queries
+    subtract them to leave flagged observations out without touching the aggregates.
+    """
+    bucket = f", {_bucket('unit_price')} AS bucket" if by_bucket else ""
+    return f"""
+        SELECT {GRAINS[grain]} AS period, city{bucket}, COUNT(*) AS n, SUM(unit_price) AS s
+        FROM anomaly WHERE ? AND item_id = ({_ITEM_ID})
+        GROUP BY period, city{", bucket" if by_bucket else ""}
+    """
+
+def trend_rows(con: sqlite3.Connection, item: str, start: str | None = None, end: str | None = None,
+               grain: str | None = None, exclude_anomalies: bool = False) -> tuple[str, list[sqlite3.Row]]:
+    """
+    Aggregates for one item per (period, city) between start and end (ISO dates, inclusive).
+    grain=None picks one from the span. Returns (grain, rows of period, city, n, mean, min, max).
+    exclude_anomalies leaves flagged observations out of n and mean (min and max keep them).
+    """
+    if grain is None:
+        lo, hi = con.execute(f"""SELECT MIN(period), MAX(period) FROM price_rollup
+                                 WHERE item_id = ({_ITEM_ID}) AND grain = 'month'""", (item_key(item),)).fetchone()
+        if lo is None:
+            return "day", []
+        grain = choose_grain(date.fromisoformat(start or lo), date.fromisoformat(end or hi))
+    rows = q(con, f"""
+        WITH a AS ({_flagged(grain)})
+        SELECT r.period, r.city, r.n - COALESCE(a.n, 0) AS n,
+               (r.sum_unit - COALESCE(a.s, 0)) / (r.n - COALESCE(a.n, 0)) AS mean,
+               r.min_unit AS min, r.max_unit AS max
+        FROM price_rollup r
+        LEFT JOIN a ON a.period = r.period AND a.city = r.city
+        WHERE r.item_id = ({_ITEM_ID}) AND r.grain = ? AND r.period BETWEEN ? AND ?
+          AND r.n > COALESCE(a.n, 0)
+        ORDER BY r.period, r.city
+    """, (exclude_anomalies, item_key(item), item_key(item), grain, start or "0000-00-00", end or "9999-12-31"))
+    return grain, rows
+
+def median_rows(con: sqlite3.Connection, item: str, grain: str, start: str | None = None,
+                end: str | None = None, exclude_anomalies: bool = False) -> list[sqlite3.Row]:
+    """Approximate median per (period, city) from the histogram sketch."""
+    return q(con, f"""
+        WITH a AS ({_flagged(grain, by_bucket=True)}), h AS (
+          SELECT r.period, r.city, r.bucket, r.n - COALESCE(a.n, 0) AS n
+          FROM price_rollup_hist r
+          LEFT JOIN a ON a.period = r.period AND a.city = r.city AND a.bucket = r.bucket
+          WHERE r.item_id = ({_ITEM_ID}) AND r.grain = ? AND r.period BETWEEN ? AND ?
+            AND r.n > COALESCE(a.n, 0)
+        ), c AS (
+          SELECT period, city, bucket,
+                 SUM(n) OVER (PARTITION BY period, city ORDER BY bucket) AS cum,
+                 SUM(n) OVER (PARTITION BY period, city) AS total
+          FROM h
+        ), m AS (  -- buckets holding the lower and upper middle observations
+          SELECT period, city, MIN(bucket) AS lo, MIN(CASE WHEN cum >= total / 2 + 1 THEN bucket END) AS hi
+          FROM c WHERE cum >= (total + 1) / 2
+          GROUP BY period, city
+        )
+        SELECT period, city,
+               (CASE WHEN lo = -1000000 THEN 0.0 ELSE pow(1 + {HIST_ALPHA}, lo + 0.5) END +
+                CASE WHEN hi = -1000000 THEN 0.0 ELSE pow(1 + {HIST_ALPHA}, hi + 0.5) END) / 2
+                 AS median
+        FROM m
+        ORDER BY period, city
+    """, (exclude_anomalies, item_key(item), item_key(item), grain, start or "0000-00-00", end or "9999-12-31"))
+
+def trend_frame(con: sqlite3.Connection, item: str, start: str | None = None, end: str | None = None,
+                grain: str | None = None, stat: str = "mean", currency: str | None = None,
+                exclude_anomalies: bool = False):
+    """
+    Trend as a DataFrame (index: period start, columns: city) of mean or median unit price,
+    in fx.BASE_CURRENCY or converted to `currency` at each period's rate, optionally
+    without the observations anomaly.py flagged.
+    """
+    import pandas as pd  # only chart callers need pandas
+
+    grain, rows = trend_rows(con, item, start, end, grain, exclude_anomalies)
+    if stat == "median" and rows:
+        _ensure_math(con)
+        rows = median_rows(con, item, grain, start, end, exclude_anomalies)
+    if not rows:
+        return pd.DataFrame()
+    df = pd.DataFrame([dict(r) for r in rows])
+    pivot = df.pivot(index="period", columns="city", values=stat)
+    pivot.index = pd.to_datetime(pivot.index)
+    pivot.index.name = grain
+    return from_base(con, pivot, currency) if currency else pivot
+
+def cell_frame(con: sqlite3.Connection, grain: str, item_ids: list[int] | None = None):
+    """
+    Rollup cells of item_ids (None: every item) at `grain` as a DataFrame of item_id, city,
+    period, n, sum, mean, ordered by item_id, city and period, with the observations
+    anomaly.py flagged subtracted. Models over many series at once read this.
+    """
+    import numpy as np
+    import pandas as pd
+
+    ids = f"AND item_id IN ({','.join(map(str, item_ids))})" if item_ids else ""
+    cols = ["item_id", "city", "period", "n", "sum"]
+
+    def read(sql: str, params: tuple = ()) -> pd.DataFrame:
+        cur = con.cursor()
+        cur.row_factory = None
+        return pd.DataFrame(cur.execute(sql, params).fetchall(), columns=cols)
+
+    df = read(f"""SELECT item_id, city, period, n, sum_unit FROM price_rollup
+                  WHERE grain = ? {ids} ORDER BY item_id, city, period""", (grain,))
+    # The flags are few: subtracting them here is cheaper than joining them in SQL.
+    flagged = read(f"""SELECT item_id, city, {GRAINS[grain]} AS period, COUNT(*), SUM(unit_price) FROM anomaly
+                       WHERE 1 {ids} GROUP BY item_id, city, period""")
+    if not flagged.empty:
+        df = df.merge(flagged, on=cols[:3], how="left", suffixes=("", "_flagged"))
+        df["n"] -= df.pop("n_flagged").fillna(0).astype(np.int64)
+        df["sum"] -= df.pop("sum_flagged").fillna(0.0)
+        df = df[df["n"] > 0]
+    df["mean"] = df["sum"] / df["n"]
+    return df[df["mean"] > 0]
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Maintain the day/week/month price rollups.")
+    ap.add_argument("--rebuild", action="store_true", help="Recompute from the full history")
+    args = ap.parse_args()
+
+    con = connect()
+    with transaction(con):
+        n = rebuild(con) if args.rebuild else refresh(con)
+    print(f"Rollups {'rebuilt' if args.rebuild else 'refreshed'}: {n} price rows folded in ✅")
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,7 @@ PRAGMA foreign_keys = ON;
 CREATE TABLE IF NOT EXISTS item (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
   name TEXT NOT NULL UNIQUE,
+  name_key TEXT,  -- db.item_key(name): case/space/Unicode-normalized lookup key, unique
   category TEXT,
   unit TEXT NOT NULL DEFAULT 'unit'
 );
@@ -23,8 +24,233 @@ CREATE TABLE IF NOT EXISTS price (
   price REAL NOT NULL CHECK(price >= 0),
   currency TEXT NOT NULL DEFAULT 'USD',
   quantity REAL NOT NULL DEFAULT 1,
-  date TEXT NOT NULL
+  date TEXT NOT NULL,
+  obs_hash TEXT,  -- natural-key hash (item, store, date, price, quantity, currency), set by incremental imports
+  price_base REAL  -- price in fx.BASE_CURRENCY at the row's date; NULL if the currency has no FX rates
 );
 
 CREATE INDEX IF NOT EXISTS idx_price_item_date ON price(item_id, date);
 CREATE INDEX IF NOT EXISTS idx_price_store_date ON price(store_id, date);
+CREATE INDEX IF NOT EXISTS idx_price_date ON price(date);
+
+-- Daily FX rates: units of `currency` per 1 fx.BASE_CURRENCY (load with: python src/fx.py --load rates.csv)
+CREATE TABLE IF NOT EXISTS fx_rate (
+  currency TEXT NOT NULL,
+  date TEXT NOT NULL,
+  per_base REAL NOT NULL CHECK(per_base > 0),
+  PRIMARY KEY (currency, date)
+) WITHOUT ROWID;
+
+-- Archived price partitions (see partitions.py): one read-only SQLite file per year or quarter
+-- holding `price` rows dated lo..hi that were moved out of this database.
+CREATE TABLE IF NOT EXISTS price_partition (
+  name TEXT PRIMARY KEY,        -- period, e.g. 2023 or 2023q1; attached as schema p_<name>
+  path TEXT NOT NULL,           -- relative to this database's directory
+  lo TEXT NOT NULL,             -- first and last price date in the file
+  hi TEXT NOT NULL,
+  rows INTEGER NOT NULL,
+  bytes INTEGER NOT NULL DEFAULT 0,
+  checksum TEXT NOT NULL DEFAULT '',  -- sha256 of the file; backups skip unchanged partitions
+  archived_at TEXT NOT NULL DEFAULT (datetime('now'))
+);
+
+-- Per-file progress of incremental CSV imports (see import_csv.py --incremental)
+CREATE TABLE IF NOT EXISTS import_checkpoint (
+  path TEXT PRIMARY KEY,
+  byte_offset INTEGER NOT NULL,
+  rows_done INTEGER NOT NULL,
+  fingerprint TEXT NOT NULL,
+  updated_at TEXT NOT NULL DEFAULT (datetime('now'))
+);
+
+-- Latest observation per (item, store), kept current by the triggers below.
+-- Basket queries read this instead of the full history; rebuild with: python src/latest_price.py --rebuild
+CREATE TABLE IF NOT EXISTS latest_price (
+  item_id INTEGER NOT NULL,
+  store_id INTEGER NOT NULL,
+  price_id INTEGER NOT NULL,
+  date TEXT NOT NULL,
+  price REAL NOT NULL,
+  quantity REAL NOT NULL,
+  currency TEXT NOT NULL,
+  unit_price REAL,
+  PRIMARY KEY (item_id, store_id)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS trg_latest_price_insert AFTER INSERT ON price
+WHEN NEW.store_id IS NOT NULL
+BEGIN
+  INSERT INTO latest_price(item_id, store_id, price_id, date, price, quantity, currency, unit_price)
+  VALUES (NEW.item_id, NEW.store_id, NEW.id, NEW.date, NEW.price, NEW.quantity, NEW.currency,
+          NEW.price / NULLIF(NEW.quantity, 0))
+  ON CONFLICT(item_id, store_id) DO UPDATE SET
+    price_id = excluded.price_id, date = excluded.date, price = excluded.price,
+    quantity = excluded.quantity, currency = excluded.currency, unit_price = excluded.unit_price
+  WHERE excluded.date > latest_price.date
+     OR (excluded.date = latest_price.date AND excluded.price_id > latest_price.price_id);
+END;
+
+-- Deletes/updates recompute the affected (item, store) keys from price.
+CREATE TRIGGER IF NOT EXISTS trg_latest_price_delete AFTER DELETE ON price
+WHEN OLD.store_id IS NOT NULL
+BEGIN
+  DELETE FROM latest_price WHERE item_id = OLD.item_id AND store_id = OLD.store_id AND price_id = OLD.id;
+  INSERT OR IGNORE INTO latest_price(item_id, store_id, price_id, date, price, quantity, currency, unit_price)
+    SELECT item_id, store_id, id, date, price, quantity, currency, price / NULLIF(quantity, 0)
+    FROM price WHERE item_id = OLD.item_id AND store_id = OLD.store_id
+    ORDER BY date DESC, id DESC LIMIT 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_latest_price_update
+AFTER UPDATE OF item_id, store_id, price, quantity, currency, date ON price
+BEGIN
+  DELETE FROM latest_price WHERE price_id = OLD.id;
+  INSERT OR REPLACE INTO latest_price(item_id, store_id, price_id, date, price, quantity, currency, unit_price)
+    SELECT item_id, store_id, id, date, price, quantity, currency, price / NULLIF(quantity, 0)
+    FROM price WHERE item_id = OLD.item_id AND store_id = OLD.store_id
+    ORDER BY date DESC, id DESC LIMIT 1;
+  INSERT OR REPLACE INTO latest_price(item_id, store_id, price_id, date, price, quantity, currency, unit_price)
+    SELECT item_id, store_id, id, date, price, quantity, currency, price / NULLIF(quantity, 0)
+    FROM price WHERE item_id = NEW.item_id AND store_id = NEW.store_id
+    ORDER BY date DESC, id DESC LIMIT 1;
+END;
+
+-- Per-(item, city, period) aggregates of unit price at day/week/month grain, maintained
+-- incrementally by rollup.refresh() (everything with price.id above the stored watermark).
+CREATE TABLE IF NOT EXISTS price_rollup (
+  item_id INTEGER NOT NULL,
+  grain TEXT NOT NULL CHECK(grain IN ('day', 'week', 'month')),
+  period TEXT NOT NULL,  -- first day of the period, YYYY-MM-DD
+  city TEXT NOT NULL,
+  n INTEGER NOT NULL,
+  sum_unit REAL NOT NULL,
+  min_unit REAL NOT NULL,
+  max_unit REAL NOT NULL,
+  PRIMARY KEY (item_id, grain, period, city)
+) WITHOUT ROWID;
+
+-- Log-bucketed histogram per rollup cell: a mergeable sketch for approximate medians.
+CREATE TABLE IF NOT EXISTS price_rollup_hist (
+  item_id INTEGER NOT NULL,
+  grain TEXT NOT NULL,
+  period TEXT NOT NULL,
+  city TEXT NOT NULL,
+  bucket INTEGER NOT NULL,
+  n INTEGER NOT NULL,
+  PRIMARY KEY (item_id, grain, period, city, bucket)
+) WITHOUT ROWID;
+
+-- Streaming anomaly detection (see anomaly.py): rolling statistics of ln(unit price) per
+-- (item, city), updated from the price rows above the 'anomaly' watermark.
+CREATE TABLE IF NOT EXISTS anomaly_state (
+  item_id INTEGER NOT NULL,
+  city TEXT NOT NULL,
+  n INTEGER NOT NULL,   -- observations seen
+  mean REAL NOT NULL,   -- exponentially weighted mean of ln(unit price)
+  var REAL NOT NULL,    -- exponentially weighted variance of ln(unit price)
+  PRIMARY KEY (item_id, city)
+) WITHOUT ROWID;
+
+-- Observations that were far from their series' rolling mean when they arrived.
+CREATE TABLE IF NOT EXISTS anomaly (
+  price_id INTEGER PRIMARY KEY,
+  item_id INTEGER NOT NULL,
+  city TEXT NOT NULL,
+  day TEXT NOT NULL,
+  unit_price REAL NOT NULL,  -- in fx.BASE_CURRENCY, as folded into the rollups
+  expected REAL NOT NULL,    -- the series' rolling (geometric) mean just before it
+  z REAL NOT NULL            -- distance from it in rolling standard deviations of ln(unit price)
+);
+
+CREATE INDEX IF NOT EXISTS idx_anomaly_item_day ON anomaly(item_id, day);
+
+-- Fitted forecast models per (item, city) series (see forecast.py). `fingerprint` hashes the
+-- rollup cells the model was fitted on; only series whose cells changed are refitted.
+CREATE TABLE IF NOT EXISTS forecast_model (
+  item_id INTEGER NOT NULL,
+  city TEXT NOT NULL,
+  grain TEXT NOT NULL,
+  fingerprint TEXT NOT NULL,
+  center REAL NOT NULL,       -- trend origin, years since 2000-01-01
+  coef BLOB NOT NULL,         -- float64 coefficients of ln(unit price): intercept, trend, Fourier terms
+  inv BLOB NOT NULL,          -- float64 inverse normal matrix, for prediction bands
+  sigma REAL NOT NULL,        -- residual standard deviation of ln(unit price)
+  last_period TEXT NOT NULL,  -- last period with data
+  fitted_at TEXT NOT NULL DEFAULT (datetime('now')),
+  PRIMARY KEY (item_id, city, grain)
+) WITHOUT ROWID;
+
+-- Weighted item baskets for the chained price index (see price_index.py).
+CREATE TABLE IF NOT EXISTS index_basket (
+  name TEXT NOT NULL,
+  item_id INTEGER NOT NULL REFERENCES item(id) ON DELETE CASCADE,
+  weight REAL NOT NULL CHECK(weight > 0),
+  PRIMARY KEY (name, item_id)
+) WITHOUT ROWID;
+
+-- Chained index per (basket, city, period). `fingerprint` hashes the basket's rollup cells in
+-- the period; only periods whose cells changed, and the levels chained after them, are recomputed.
+CREATE TABLE IF NOT EXISTS price_index (
+  basket TEXT NOT NULL,
+  grain TEXT NOT NULL,
+  city TEXT NOT NULL,
+  period TEXT NOT NULL,
+  link REAL,                -- weighted geometric mean of item price relatives to the city's previous period
+  level REAL NOT NULL,      -- chained index, 100 in the city's first period
+  coverage REAL NOT NULL,   -- share of basket weight priced in both periods (0 in the first period)
+  items INTEGER NOT NULL,   -- basket items priced in the period
+  fingerprint TEXT NOT NULL,
+  PRIMARY KEY (basket, grain, city, period)
+) WITHOUT ROWID;
+
+-- High-water marks (last processed price.id) for incrementally maintained tables.
+CREATE TABLE IF NOT EXISTS derived_state (
+  name TEXT PRIMARY KEY,
+  last_price_id INTEGER NOT NULL
+);
+
+-- Row count of price (main file; archives are counted in price_partition) and a counter of
+-- updates and deletes per table, kept by the triggers below. The app pages and caches on them
+-- without a COUNT(*) over price; migrate() recounts when trg_price_count_insert was missing.
+CREATE TABLE IF NOT EXISTS table_stats (
+  name TEXT PRIMARY KEY,
+  n INTEGER NOT NULL DEFAULT 0,
+  changes INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+INSERT OR IGNORE INTO table_stats(name) VALUES ('price'), ('item'), ('store');
+
+CREATE TRIGGER IF NOT EXISTS trg_price_count_insert AFTER INSERT ON price
+BEGIN
+  UPDATE table_stats SET n = n + 1 WHERE name = 'price';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_price_count_delete AFTER DELETE ON price
+BEGIN
+  UPDATE table_stats SET n = n - 1, changes = changes + 1 WHERE name = 'price';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_price_changes_update
+AFTER UPDATE OF item_id, store_id, price, quantity, currency, date, price_base ON price
+BEGIN
+  UPDATE table_stats SET changes = changes + 1 WHERE name = 'price';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_item_changes_update AFTER UPDATE ON item
+BEGIN
+  UPDATE table_stats SET changes = changes + 1 WHERE name = 'item';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_item_changes_delete AFTER DELETE ON item
+BEGIN
+  UPDATE table_stats SET changes = changes + 1 WHERE name = 'item';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_store_changes_update AFTER UPDATE ON store
+BEGIN
+  UPDATE table_stats SET changes = changes + 1 WHERE name = 'store';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_store_changes_delete AFTER DELETE ON store
+BEGIN
+  UPDATE table_stats SET changes = changes + 1 WHERE name = 'store';
+END;
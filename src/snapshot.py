@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Columnar snapshot of the price history for batch analytics (needs pyarrow).
+
+export() writes the join of price, item and store (names and city inlined, unit price
+in fx.BASE_CURRENCY as the rollups compute it) to Parquet files under `snapshot/` next
+to the database (data/prices_snapshot/ for data/prices.db), one directory per month:
+
+    prices_snapshot/month=2024-03/part-000000001-000250000.parquet   # price ids 1..250000
+    prices_snapshot/manifest.json                                    # id watermark
+
+Every file is sorted by item_id and date and cut into row groups with min/max
+statistics, so a scan for a few items or a date range skips the other months and row
+groups and decodes only the columns it asks for. Files are memory-mapped: processes
+reading the same snapshot share the OS page cache instead of each running the join.
+
+Exports are incremental: rows above the watermark are appended as new files in the
+months they fall in, and a month holding more than MAX_FILES files is merged back into
+one sorted file. Like the rollups, the snapshot does not see deletes, edits or renames
+of existing rows; --rebuild rewrites it from the full history, archives included.
+
+    python src/snapshot.py                                  # export new rows
+    python src/snapshot.py --rebuild
+    python src/analytics.py --all-items --snapshot          # read observations from it
+"""
+from __future__ import annotations
+import argparse
+import json
+import re
+import shutil
+import sqlite3
+import time
+from datetime import date
+from pathlib import Path
+import numpy as np
+from db import DB_PATH, connect, item_key
+from fx import base_price_sql
+from partitions import archived_rows, max_id
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+    from pyarrow import fs
+except ImportError:
+    raise SystemExit("Snapshots need pyarrow: pip install pyarrow")
+
+SNAPSHOT_DIR = DB_PATH.parent / f"{DB_PATH.stem}_snapshot"
+FORMAT_VERSION = 1     # bump when the columns below change; older snapshots must be rebuilt
+CHUNK_IDS = 1_000_000  # price ids read from SQLite per pass
+ROW_GROUP_ROWS = 64_000
+MAX_FILES = 8          # per month, before they are merged
+UNIX_EPOCH_JULIAN_DAY = 2440587.5
+SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("item_id", pa.int64()),
+    ("item", pa.dictionary(pa.int32(), pa.string())),
+    ("category", pa.dictionary(pa.int32(), pa.string())),
+    ("unit", pa.dictionary(pa.int32(), pa.string())),
+    ("store_id", pa.int64()),
+    ("store", pa.dictionary(pa.int32(), pa.string())),
+    ("city", pa.dictionary(pa.int32(), pa.string())),
+    ("date", pa.date32()),
+    ("price", pa.float64()),
+    ("currency", pa.dictionary(pa.int32(), pa.string())),
+    ("quantity", pa.float64()),
+    ("price_base", pa.float64()),
+    ("unit_price", pa.float64()),  # in fx.BASE_CURRENCY; NULL without FX rates or quantity
+])
+_PART = re.compile(r"part-(\d+)-(\d+)\.parquet$")
+
+def read_manifest(directory: Path = SNAPSHOT_DIR) -> dict:
+    path = directory / "manifest.json"
+    return json.loads(path.read_text(encoding="utf-8")) if path.exists() else {}
+
+def _write_manifest(directory: Path, manifest: dict) -> None:
+    tmp = directory / "manifest.json.tmp"
+    tmp.write_text(json.dumps(manifest, indent=2) + "\n", encoding="utf-8")
+    tmp.replace(directory / "manifest.json")
+
+def _files(month_dir: Path, upto: int) -> list[Path]:
+    """
+    Live part files of one month, by id range. Files above the watermark `upto` (an
+    export that died before its manifest) and files whose id range another covers (a
+    merge that died before deleting its inputs) are left out.
+    """
+    parts = sorted(((int(m[1]), int(m[2]), p) for p in month_dir.glob("part-*.parquet")
+                    if (m := _PART.search(p.name))), key=lambda x: (x[0], -x[1]))
+    live, reach = [], 0
+    for lo, hi, p in parts:
+        if hi <= upto and hi > reach:
+            live.append(p)
+            reach = hi
+    return live
+
+def watermark(directory: Path = SNAPSHOT_DIR) -> int:
+    """Last price id in the snapshot; exits with a hint if there is none in the current format."""
+    manifest = read_manifest(directory)
+    if manifest.get("version") != FORMAT_VERSION:
+        raise SystemExit(f"No up-to-date snapshot in {directory}: run python src/snapshot.py")
+    return manifest["watermark"]
+
+def _months(directory: Path) -> list[str]:
+    return sorted(p.name.split("=", 1)[1] for p in directory.glob("month=*") if p.is_dir())
+
+_ROWS_SQL = f"""
+    SELECT p.id, p.item_id, i.name, i.category, i.unit, p.store_id, s.name, s.city,
+           CAST(julianday(p.date) - {UNIX_EPOCH_JULIAN_DAY} AS INTEGER) AS day,
+           p.price, p.currency, p.quantity, p.price_base,
+           {base_price_sql()} / NULLIF(p.quantity, 0)
+    FROM {{price}} p
+    LEFT JOIN item i ON i.id = p.item_id
+    LEFT JOIN store s ON s.id = p.store_id
+    WHERE p.id > ? AND p.id <= ? AND day IS NOT NULL
+"""
+
+def _read_rows(con: sqlite3.Connection, lo: int, hi: int) -> pa.Table | None:
+    """Joined rows with lo < price.id <= hi from the main file and the archives, sorted by item_id, date and id."""
+    cur = con.cursor()
+    cur.row_factory = None
+    rows = cur.execute(_ROWS_SQL.format(price="main.price"), (lo, hi)).fetchall()
+    rows += archived_rows(con, _ROWS_SQL, (lo, hi))
+    if not rows:
+        return None
+    cols = list(zip(*rows))
+    table = pa.table([
+        pa.array(col, type=f.type.value_type).dictionary_encode() if pa.types.is_dictionary(f.type)
+        else pa.array(np.array(col, dtype="int32"), pa.int32()).cast(pa.date32()) if f.name == "date"
+        else pa.array(col, type=f.type)
+        for col, f in zip(cols, SCHEMA)
+    ], schema=SCHEMA)
+    return table.sort_by([("item_id", "ascending"), ("date", "ascending"), ("id", "ascending")])
+
+def _month_keys(table: pa.Table) -> np.ndarray:
+    return np.datetime_as_string(table["date"].to_numpy().astype("datetime64[M]"))
+
+def _write(path: Path, table: pa.Table) -> None:
+    tmp = path.with_suffix(".tmp")
+    pq.write_table(table, tmp, row_group_size=ROW_GROUP_ROWS, compression="zstd", write_statistics=True)
+    tmp.replace(path)
+
+def _merge(month_dir: Path, files: list[Path]) -> None:
+    """Replace a month's files with one file sorted across all of them."""
+    ids = [tuple(map(int, _PART.search(p.name).groups())) for p in files]
+    table = pa.concat_tables([pq.read_table(p, schema=SCHEMA) for p in files]).unify_dictionaries()
+    table = table.sort_by([("item_id", "ascending"), ("date", "ascending"), ("id", "ascending")])
+    _write(month_dir / f"part-{min(i[0] for i in ids):09d}-{max(i[1] for i in ids):09d}.parquet", table)
+    for p in files:
+        p.unlink()
+
+def export(con: sqlite3.Connection, directory: Path = SNAPSHOT_DIR, rebuild: bool = False) -> int:
+    """
+    Append price rows added since the last export to the snapshot (or rewrite it from the
+    full history with rebuild); returns rows written. Call it outside a transaction.
+    """
+    manifest = read_manifest(directory)
+    database = str(Path(next(r[2] for r in con.execute("PRAGMA database_list") if r[1] == "main")).resolve())
+    hi = max_id(con, archives=True)
+    if manifest.get("version") != FORMAT_VERSION or manifest.get("database") != database \
+            or manifest.get("watermark", 0) > hi:  # another or a restored database
+        rebuild = True
+    if rebuild and directory.exists():
+        shutil.rmtree(directory)
+        manifest = {}
+    directory.mkdir(parents=True, exist_ok=True)
+    lo = manifest.get("watermark", 0)
+    written, touched = 0, set()
+    for a in range(lo, hi, CHUNK_IDS):
+        b = min(a + CHUNK_IDS, hi)
+        table = _read_rows(con, a, b)
+        if table is None:
+            continue
+        month = _month_keys(table)
+        order = np.argsort(month, kind="stable")  # by month, keeping the item/date order inside each
+        table, month = table.take(order), month[order]
+        bounds = np.flatnonzero(np.r_[True, month[1:] != month[:-1], True])
+        for s, e in zip(bounds[:-1], bounds[1:]):
+            month_dir = directory / f"month={month[s]}"
+            month_dir.mkdir(exist_ok=True)
+            _write(month_dir / f"part-{a + 1:09d}-{b:09d}.parquet", table.slice(s, e - s))
+            touched.add(month_dir)
+        written += len(table)
+    for month_dir in sorted(touched):
+        files = _files(month_dir, hi)
+        if len(files) > (1 if rebuild else MAX_FILES):
+            _merge(month_dir, files)
+    for month_dir in sorted(directory.glob("month=*")):  # leftovers of an interrupted export
+        live = set(_files(month_dir, hi))
+        for p in month_dir.glob("part-*"):
+            if p not in live:
+                p.unlink()
+    _write_manifest(directory, {"version": FORMAT_VERSION, "database": database, "watermark": hi,
+                                "rows": manifest.get("rows", 0) + written,
+                                "exported_at": time.strftime("%Y-%m-%dT%H:%M:%S")})
+    return written
+
+def scan(columns: list[str], item_ids: list[int] | None = None, start: str | None = None,
+         end: str | None = None, exclude_ids: list[int] | None = None,
+         directory: Path = SNAPSHOT_DIR) -> tuple[pa.Table, int]:
+    """
+    Read `columns` of the snapshot rows for item_ids dated in [start, end] (ISO dates,
+    inclusive), leaving out the price ids in exclude_ids. Months outside the range are not
+    opened, row groups whose statistics can't match are skipped, and pages are
+    memory-mapped. Returns (table, watermark): rows above the watermark are not in it.
+    """
+    upto = watermark(directory)
+    files = [str(p) for m in _months(directory)
+             if (start is None or m >= start[:7]) and (end is None or m <= end[:7])
+             for p in _files(directory / f"month={m}", upto)]
+    expr = []
+    if item_ids is not None:
+        expr.append(ds.field("item_id").isin(pa.array(item_ids, pa.int64())))
+    if start:
+        expr.append(ds.field("date") >= pa.scalar(date.fromisoformat(start[:10]), pa.date32()))
+    if end:
+        expr.append(ds.field("date") <= pa.scalar(date.fromisoformat(end[:10]), pa.date32()))
+    if exclude_ids:
+        expr.append(~ds.field("id").isin(pa.array(exclude_ids, pa.int64())))
+    dataset = ds.dataset(files, schema=SCHEMA, format="parquet", filesystem=fs.LocalFileSystem(use_mmap=True))
+    filt = None
+    for e in expr:
+        filt = e if filt is None else filt & e
+    return dataset.to_table(columns=columns, filter=filt), upto
+
+def load_prices(items: list[str] | None = None, start: str | None = None, end: str | None = None,
+                with_currency: bool = False, exclude_anomalies: bool = False,
+                directory: Path = SNAPSHOT_DIR):
+    """
+    The snapshot's part of analytics.load_prices_df(): same columns and types, read from
+    Parquet. Returns (frame, watermark); SQLite only resolves item names and flagged ids.
+    """
+    import pandas as pd
+
+    watermark(directory)
+    con = connect()
+    item_ids = None
+    if items:
+        item_ids = [r[0] for r in con.execute(
+            f"SELECT id FROM item WHERE name_key IN ({','.join('?' * len(items))})", [item_key(x) for x in items])]
+    exclude = [r[0] for r in con.execute("SELECT price_id FROM anomaly")] if exclude_anomalies else None
+    columns = ["item", "city", "date", "unit_price"] + (["currency"] if with_currency else [])
+    table, upto = scan(columns, item_ids, start, end, exclude, directory)
+    table = table.filter(pc.is_valid(table["unit_price"]))  # no FX rate: left out, as load_prices_df() does
+    table = table.unify_dictionaries().combine_chunks()
+
+    def categorical(name: str) -> pd.Series:  # sorted categories, as analytics builds them
+        col = table[name].to_pandas()
+        return col.cat.reorder_categories(sorted(col.cat.categories))
+
+    df = pd.DataFrame({
+        "item": categorical("item"),
+        "city": categorical("city"),
+        "date": table["date"].cast(pa.int32()).to_numpy().astype(np.int64),
+        "unit_price": table["unit_price"].to_numpy(zero_copy_only=False),
+    })
+    if with_currency:
+        df["currency"] = categorical("currency")
+    return df, upto
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Export prices to a columnar Parquet snapshot for batch analytics.")
+    ap.add_argument("--rebuild", action="store_true", help="Rewrite the snapshot from the full history")
+    ap.add_argument("--dir", default=str(SNAPSHOT_DIR), help="Snapshot directory")
+    args = ap.parse_args()
+
+    directory = Path(args.dir)
+    t0 = time.perf_counter()
+    n = export(connect(), directory, args.rebuild)
+    manifest = read_manifest(directory)
+    size = sum(p.stat().st_size for p in directory.rglob("*.parquet"))
+    print(f"Snapshot {'rebuilt' if args.rebuild else 'updated'} in {directory}: {n:,} rows written in "
+          f"{time.perf_counter() - t0:.1f}s; {manifest['rows']:,} rows in {len(_months(directory))} months, "
+          f"{size / 2**20:,.1f} MiB ✅")
+
+if __name__ == "__main__":
+    main()
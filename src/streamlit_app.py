@@ -1,24 +1,20 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 from datetime import date
-import sys
+import json
+import os
 import pandas as pd
 import streamlit as st
-from db import connect, q, qi
+import app_data
+import db
+from db import connect, item_key, q, qi, transaction
+from fx import to_base
+from rollup import refresh as refresh_rollups
 
 st.set_page_config(page_title="Community Price Tracker", page_icon="🧾", layout="centered")
 st.title("🧾 Community Price Tracker")
 
 # -------- helpers --------
-def rows_to_df(rows) -> pd.DataFrame:
-    """Always return a DataFrame with named columns."""
-    if not rows:
-        return pd.DataFrame()
-    try:
-        return pd.DataFrame([dict(r) for r in rows])  # sqlite3.Row -> dict
-    except Exception:
-        return pd.DataFrame(rows)  # fallback (no names)
-
 def assert_columns(df: pd.DataFrame, required: set[str], context: str) -> None:
     missing = required - set(map(str, df.columns))
     if missing:
@@ -30,16 +26,32 @@ def assert_columns(df: pd.DataFrame, required: set[str], context: str) -> None:
         )
         st.stop()
 
-tab1, tab2, tab3, tab4 = st.tabs(["Log Price", "Items & Stores", "Trends", "Basket"])
+def pager(label: str, total: int, key: str) -> int:
+    """Page selector for server-side pagination; returns the 0-based page."""
+    pages = max(1, -(-total // app_data.PAGE_SIZE))
+    page = st.number_input(f"{label} page (of {pages}, {total:,} rows)", min_value=1, max_value=pages,
+                           value=1, step=1, key=key)
+    return int(page) - 1
+
+# Hidden diagnostics panel: open the app with ?diag=1 to time every query from then on.
+diag = st.query_params.get("diag") == "1"
+if diag and not db.STATS.enabled:
+    db.enable_stats()
 
-with tab1:
+# Only the selected view runs on a rerun (st.tabs would execute every tab's queries).
+view = st.radio("View", ["Log Price", "Items & Stores", "Trends", "Basket", "Price Index", "Nearby"],
+                horizontal=True, label_visibility="collapsed")
+app_data.ensure_schema()
+version = app_data.data_version()
+
+if view == "Log Price":
     st.subheader("Log a Price Observation")
-    with connect() as con:
-        items = q(con, "SELECT id, name, unit FROM item ORDER BY name")
-        stores = q(con, "SELECT id, name, city FROM store ORDER BY name")
+    items = app_data.item_choices(version)
+    stores = app_data.store_choices(version)
     col1, col2 = st.columns(2)
     new_item = col1.text_input("New item name (optional)")
-    item_options = {f"{x['name']} ({x['unit']})": x["id"] for x in items}
+    item_options = {f"{name} ({unit})": id_ for id_, name, unit in items}
+    item_names = {f"{name} ({unit})": name for id_, name, unit in items}
     item_select = col2.selectbox("Existing item", ["-- Select --"] + list(item_options.keys()))
     price = st.number_input("Price", min_value=0.0, step=0.1)
     currency = st.text_input("Currency", value="USD")
@@ -51,123 +63,199 @@ with tab1:
     new_store = col3.text_input("New store name (optional)")
     new_city = col4.text_input("City (optional)")
     store_options = {"-- None --": None}
-    store_options.update({f"{x['name']} ({x['city'] or 'unknown'})": x["id"] for x in stores})
+    store_options.update({f"{name} ({city or 'unknown'})": id_ for id_, name, city in stores})
     store_select = st.selectbox("Existing store", list(store_options.keys()))
 
     if st.button("Save price"):
-        with connect() as con:
-            if new_item.strip():
-                qi(con, "INSERT OR IGNORE INTO item(name, category, unit) VALUES(?, 'general', 'unit')", (new_item.strip(),))
-                item_id = q(con, "SELECT id FROM item WHERE name=? ORDER BY id DESC", (new_item.strip(),))[0]["id"]
-            else:
-                if item_select == "-- Select --":
-                    st.error("Choose an existing item or enter a new one.")
-                    st.stop()
-                item_id = item_options[item_select]
-
+        ingest_url = os.environ.get("PRICE_TRACKER_INGEST_URL")
+        if not new_item.strip() and item_select == "-- Select --":
+            st.error("Choose an existing item or enter a new one.")
+            st.stop()
+        if ingest_url:
+            # Queue the observation with the ingestion service; it acknowledges once committed.
+            from ingest_service import IngestError, submit
+            obs = {"item": new_item.strip() or item_names[item_select], "price": float(price),
+                   "currency": currency.strip(), "quantity": float(quantity), "date": d.isoformat()}
             if new_store.strip():
-                qi(con, "INSERT INTO store(name, city) VALUES(?,?)", (new_store.strip(), new_city.strip() or None))
-                store_id = q(con, "SELECT id FROM store WHERE name=? ORDER BY id DESC", (new_store.strip(),))[0]["id"]
+                obs.update(store=new_store.strip(), city=new_city.strip())
             else:
-                store_id = store_options[store_select]
+                obs["store_id"] = store_options[store_select]
+            try:
+                price_id = submit(ingest_url, obs)[0]
+            except IngestError as e:
+                st.error(f"Could not log the price: {e}")
+                st.stop()
+        else:
+            with transaction(connect()) as con:
+                if new_item.strip():
+                    key = item_key(new_item)
+                    qi(con, "INSERT OR IGNORE INTO item(name, name_key, category, unit) VALUES(?, ?, 'general', 'unit')",
+                       (new_item.strip(), key))
+                    item_id = q(con, "SELECT id FROM item WHERE name_key=?", (key,))[0]["id"]
+                else:
+                    item_id = item_options[item_select]
 
-            qi(con, "INSERT INTO price(item_id, store_id, price, currency, quantity, date) VALUES(?,?,?,?,?,?)",
-               (item_id, store_id, float(price), currency.strip(), float(quantity), d.isoformat()))
+                if new_store.strip():
+                    qi(con, "INSERT INTO store(name, city) VALUES(?,?)", (new_store.strip(), new_city.strip() or None))
+                    store_id = q(con, "SELECT id FROM store WHERE name=? ORDER BY id DESC", (new_store.strip(),))[0]["id"]
+                else:
+                    store_id = store_options[store_select]
+
+                price_id = qi(con, """INSERT INTO price(item_id, store_id, price, currency, quantity, date, price_base)
+                                      VALUES(?,?,?,?,?,?,?)""",
+                              (item_id, store_id, float(price), currency.strip(), float(quantity), d.isoformat(),
+                               to_base(con, float(price), currency, d.isoformat()))).lastrowid
+                refresh_rollups(con)
         st.success("Price logged ✅")
+        flag = q(connect(), "SELECT unit_price, expected FROM anomaly WHERE price_id=?", (price_id,))
+        if flag:
+            ratio = flag[0]["unit_price"] / flag[0]["expected"]
+            st.warning(f"This is {f'{ratio:,.1f}x' if ratio >= 1 else f'1/{1 / ratio:,.0f} of'} the usual unit price "
+                       "for this item here, so charts that exclude anomalies leave it out. "
+                       "Check the decimal point, currency and quantity.")
 
-with tab2:
+elif view == "Items & Stores":
     st.subheader("Items, Stores & Recent Prices")
-    with connect() as con:
-        items = rows_to_df(q(con, "SELECT * FROM item ORDER BY name"))
-        stores = rows_to_df(q(con, "SELECT * FROM store ORDER BY name"))
-        prices = rows_to_df(q(con, """
-            SELECT
-              p.id,
-              i.name  AS item,
-              i.unit  AS unit,
-              s.name  AS store,
-              s.city  AS city,
-              p.price AS price,
-              p.currency AS currency,
-              p.quantity AS quantity,
-              p.date AS date
-            FROM price p
-            LEFT JOIN item  i ON i.id = p.item_id
-            LEFT JOIN store s ON s.id = p.store_id
-            ORDER BY p.date DESC
-            LIMIT 500
-        """))
     st.write("**Items**")
-    st.dataframe(items)
+    st.dataframe(app_data.items_page(version, pager("Items", app_data.table_count(version, "item"), "items_page")))
     st.write("**Stores**")
-    st.dataframe(stores)
+    st.dataframe(app_data.stores_page(version, pager("Stores", app_data.table_count(version, "store"), "stores_page")))
     st.write("**Recent Prices**")
+    prices = app_data.recent_prices_page(version, pager("Prices", app_data.table_count(version, "price"), "prices_page"))
     if not prices.empty:
         assert_columns(prices, {"item","unit","store","city","price","currency","quantity","date"}, "Recent Prices")
     st.dataframe(prices)
 
-with tab3:
+elif view == "Trends":
     st.subheader("Trends")
     item_name = st.text_input("Item name to visualize (exact)", value="Milk")
+    col5, col6, col7, col8, col9 = st.columns(5)
+    start = col5.date_input("From", value=None)
+    end = col6.date_input("To", value=None)
+    grain = col7.selectbox("Grain", ["auto", "day", "week", "month"])
+    stat = col8.selectbox("Statistic", ["mean", "median"])
+    currency = col9.selectbox("Currency", app_data.currency_choices(version))
+    col10, col11 = st.columns(2)
+    exclude = col10.checkbox("Exclude flagged anomalies", value=True,
+                             help="Leave out prices far from their item's usual level in that city "
+                                  "(likely entry errors)")
+    show_forecast = col11.checkbox("Show forecast", help="Trend + yearly seasonality per city, with a 95% band")
     if st.button("Show trend"):
-        with connect() as con:
-            rows = q(con, """
-                SELECT
-                  i.name AS item,
-                  i.unit AS unit,
-                  s.city AS city,
-                  p.price AS price,
-                  p.quantity AS quantity,
-                  p.date AS date
-                FROM price p
-                LEFT JOIN item  i ON i.id = p.item_id
-                LEFT JOIN store s ON s.id = p.store_id
-                WHERE lower(i.name) = lower(?)
-            """, (item_name.strip(),))
-        df = rows_to_df(rows)
-        if df.empty:
+        if show_forecast and grain not in ("week", "month"):
+            grain = "week"  # forecasts are fitted on weekly or monthly means
+        pivot = app_data.trend(version, item_name,
+                               start.isoformat() if start else None,
+                               end.isoformat() if end else None,
+                               None if grain == "auto" else grain, stat, currency, exclude)
+        fc = app_data.forecast(version, item_name, grain, currency) if show_forecast else pd.DataFrame()
+        # Long format without the gaps: downsampled cities keep different periods, and each line stays joined.
+        hist = pivot.rename_axis("period").reset_index().melt("period", var_name="city", value_name="price").dropna()
+        if pivot.empty:
             st.warning("No data for that item yet.")
+        elif show_forecast and not fc.empty:
+            import altair as alt
+            st.caption(f"{stat.title()} unit price per {pivot.index.name} ({currency}), "
+                       f"forecast of the mean with its 95% band")
+            color = alt.Color("city:N", title="City")
+            x = alt.X("period:T", title=None)
+            y = alt.Y("price:Q", title=f"Unit price ({currency})", scale=alt.Scale(zero=False))
+            band = alt.Chart(fc).mark_area(opacity=0.2).encode(x=x, y="lo:Q", y2="hi:Q", color=color)
+            ahead = alt.Chart(fc).mark_line(strokeDash=[4, 3]).encode(x=x, y="yhat:Q", color=color)
+            st.altair_chart(band + ahead + alt.Chart(hist).mark_line().encode(x=x, y=y, color=color))
         else:
-            assert_columns(df, {"item","unit","city","price","quantity","date"}, "Trends query")
-            df["date"] = pd.to_datetime(df["date"], errors="coerce")
-            df["unit_price"] = df["price"] / df["quantity"].replace(0, pd.NA)
-            pivot = (df.pivot_table(index="date", columns="city", values="unit_price", aggfunc="mean")
-                       .sort_index())
-            st.line_chart(pivot)
+            if show_forecast:
+                st.info("Not enough weekly/monthly data to forecast this item yet.")
+            st.caption(f"{stat.title()} unit price per {pivot.index.name} ({currency})")
+            st.line_chart(hist, x="period", y="price", color="city")
 
-with tab4:
+elif view == "Basket":
     st.subheader("Basket Cost by City")
     basket = st.text_input("Items (comma-separated)", value="Milk,Bread,Eggs")
+    currency = st.selectbox("Currency", app_data.currency_choices(version))
     if st.button("Compare basket"):
         items = [x.strip() for x in basket.split(",") if x.strip()]
         if not items:
             st.warning("Enter at least one item.")
         else:
-            qmarks = ",".join("?" * len(items))
-            sql = f"""
-                SELECT
-                  i.name AS item,
-                  s.city AS city,
-                  p.price AS price,
-                  p.quantity AS quantity,
-                  p.date AS date
-                FROM price p
-                LEFT JOIN item  i ON i.id = p.item_id
-                LEFT JOIN store s ON s.id = p.store_id
-                WHERE lower(i.name) IN ({qmarks})
-            """
-            with connect() as con:
-                rows = q(con, sql, tuple(map(str.lower, items)))
-            df = rows_to_df(rows)
-            if df.empty:
+            basket_cost = app_data.basket(version, tuple(items), currency)
+            if basket_cost.empty:
                 st.warning("No data for these items yet.")
             else:
-                assert_columns(df, {"item","city","price","quantity","date"}, "Basket query")
-                latest = (df.assign(date=pd.to_datetime(df["date"], errors="coerce"))
-                            .sort_values("date")
-                            .assign(unit_price=lambda d: d["price"]/d["quantity"].replace(0, pd.NA))
-                            .groupby(["city","item"]).tail(1))
-                basket_cost = latest.groupby("city")["unit_price"].sum().sort_values(ascending=False)
                 st.bar_chart(basket_cost)
 
+elif view == "Price Index":
+    from price_index import define, parse_weights
+
+    st.subheader("Price Index by City")
+    defined = app_data.index_baskets()
+    with st.expander("Define a basket", expanded=not defined):
+        name = st.text_input("Basket name", value="groceries")
+        spec = st.text_input("Items and weights (comma-separated)", value="Milk=2, Bread, Eggs",
+                             help="Item or Item=weight; weights are relative, default 1")
+        if st.button("Save basket"):
+            try:
+                with transaction(connect()) as con:
+                    n = define(con, name.strip(), parse_weights([x for x in spec.split(",") if x.strip()]))
+            except ValueError as e:
+                st.error(f"Could not save the basket: {e}")
+            else:
+                st.success(f"Basket '{name.strip()}' saved with {n} items ✅")
+                defined = app_data.index_baskets()
+    if defined:
+        col1, col2, col3 = st.columns(3)
+        basket = col1.selectbox("Basket", list(defined))
+        grain = col2.selectbox("Grain", ["month", "week"])
+        coverage = col3.slider("Min. coverage", 0.0, 1.0, 0.0, 0.05,
+                               help="Hide periods whose change is based on less than this share of the basket weight")
+        pivot = app_data.price_index(version, basket, defined[basket], grain, coverage)
+        if pivot.empty:
+            st.warning("No prices for this basket's items yet.")
+        else:
+            st.caption(f"Chained index per {grain}, 100 in each city's first {grain} • {defined[basket]}")
+            st.line_chart(pivot)
+            latest = pivot.ffill().iloc[-1].sort_values(ascending=False).rename("index").round(1)
+            st.dataframe(latest)
+
+elif view == "Nearby":
+    st.subheader("Stores & Baskets Nearby")
+    center = app_data.store_center(version)
+    if center is None:
+        st.info("No store has coordinates yet: set `latitude`/`longitude` on stores to search by location.")
+    else:
+        col1, col2, col3 = st.columns(3)
+        lat = col1.number_input("Latitude", min_value=-90.0, max_value=90.0, value=round(center[0], 4), format="%.4f")
+        lon = col2.number_input("Longitude", min_value=-180.0, max_value=180.0, value=round(center[1], 4), format="%.4f")
+        km = col3.number_input("Radius (km)", min_value=0.1, value=5.0, step=1.0)
+        basket = st.text_input("Items (comma-separated)", value="Milk,Bread,Eggs")
+        currency = st.selectbox("Currency", app_data.currency_choices(version))
+        if st.button("Search nearby"):
+            near = app_data.stores_near(version, lat, lon, km)
+            if near.empty:
+                st.warning(f"No stores within {km:g} km.")
+            else:
+                st.map(near, latitude="latitude", longitude="longitude")
+                st.write(f"**{len(near):,} stores within {km:g} km**")
+                st.dataframe(near[["name", "city", "km"]].round({"km": 2}), hide_index=True)
+                items = [x.strip() for x in basket.split(",") if x.strip()]
+                cheapest = app_data.basket_near(version, lat, lon, km, tuple(items), currency)
+                st.write(f"**Cheapest basket nearby ({currency})**")
+                if cheapest.empty:
+                    st.warning("No store in range has a price for every item.")
+                else:
+                    st.dataframe(cheapest[["store", "city", "km", "total"]].round({"km": 2, "total": 2}), hide_index=True)
+
+if diag:
+    with st.expander("🩺 Query diagnostics", expanded=True):
+        snap = db.STATS.snapshot()
+        st.caption(f"Per-statement totals since the panel was opened (cached results issue no queries). "
+                   f"Statements slower than {snap['slow_ms']:g} ms are logged with their query plan.")
+        if snap["statements"]:
+            st.dataframe(pd.DataFrame(snap["statements"])[["sql", "calls", "total_ms", "mean_ms", "max_ms", "rows"]])
+        for slow in reversed(snap["slow"]):
+            st.code(f"-- {slow['ms']:.1f} ms at {slow['at']}\n{slow['sql']}\n\n" + "\n".join(slow["plan"]), language="sql")
+        col_a, col_b = st.columns(2)
+        col_a.download_button("Download JSON", json.dumps(snap, indent=2), "query_stats.json", "application/json")
+        if col_b.button("Reset stats"):
+            db.STATS.reset()
+
 st.caption("Built with SQLite + Streamlit • Store local, share insights global 🌍")
@@ -0,0 +1,34 @@
+"""
+Shared fixtures: a migrated database in a temp directory and a small generated CSV.
+
+    python -m pytest -q tests
+"""
+from __future__ import annotations
+import sys
+from datetime import date
+from pathlib import Path
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from db import migrate, open_connection  # noqa: E402
+from generate_data import Model, write_csv  # noqa: E402
+
+ROWS = 3_000  # rows in csv_path: three stores in each of three cities, six items, two years
+
+@pytest.fixture
+def con(tmp_path):
+    con = open_connection(tmp_path / "prices.db")
+    migrate(con)
+    yield con
+    con.close()
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / "prices.csv"
+    write_csv(Model(n_items=6, n_cities=3, stores_per_city=3, start=date(2023, 1, 1), days=730, seed=7), ROWS, path)
+    return path
+
+def rows(con, sql: str, params: tuple = ()) -> list[tuple]:
+    """Result rows as plain tuples, floats rounded so sums added in a different order compare equal."""
+    return [tuple(round(v, 6) if isinstance(v, float) else v for v in r) for r in con.execute(sql, params)]
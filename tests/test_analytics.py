@@ -0,0 +1,34 @@
+from __future__ import annotations
+from datetime import date
+import numpy as np
+import pytest
+from analytics import load_prices_df
+from conftest import ROWS, rows
+from db import connect
+from import_csv import import_bulk
+
+@pytest.fixture
+def db(con, csv_path, tmp_path, monkeypatch):
+    monkeypatch.setattr("db.DB_PATH", tmp_path / "prices.db")
+    import_bulk(con, csv_path, verbose=False)
+    return connect()
+
+def test_load_prices_df_is_typed_and_matches_sql(db):
+    df = load_prices_df(chunksize=700, with_currency=True)
+    assert len(df) == ROWS
+    assert {c: str(t) for c, t in df.dtypes.items()} == {
+        "item": "category", "city": "category", "date": "int64", "unit_price": "float64", "currency": "category"}
+    expected = rows(db, """SELECT i.name, s.city, julianday(p.date) - 2440587.5, p.price_base / p.quantity
+                           FROM price p JOIN item i ON i.id = p.item_id JOIN store s ON s.id = p.store_id""")
+    got = [(i, c, float(d), round(u, 6)) for i, c, d, u in zip(df["item"], df["city"], df["date"], df["unit_price"])]
+    assert sorted(got) == sorted(expected)
+
+def test_load_prices_df_filters_in_sql(db):
+    df = load_prices_df(["milk"], "2024-01-01", "2024-03-31")
+    assert set(df["item"]) == {"Milk"}
+    days = df["date"].to_numpy()
+    assert days.min() >= (date(2024, 1, 1) - date(1970, 1, 1)).days
+    assert days.max() <= (date(2024, 3, 31) - date(1970, 1, 1)).days
+    n = rows(db, """SELECT COUNT(*) FROM price WHERE date BETWEEN '2024-01-01' AND '2024-03-31'
+                    AND item_id = (SELECT id FROM item WHERE name = 'Milk')""")[0][0]
+    assert len(df) == n and np.isfinite(df["unit_price"]).all()
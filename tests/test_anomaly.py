@@ -0,0 +1,30 @@
+from __future__ import annotations
+import anomaly
+from add_price import add_prices, parse_observation
+from conftest import rows
+from db import transaction
+from import_csv import import_incremental
+
+FLAGS = "SELECT price_id, item_id, city, day, unit_price, expected, z FROM anomaly ORDER BY price_id"
+STATE = "SELECT item_id, city, n, mean, var FROM anomaly_state ORDER BY item_id, city"
+
+def add(con, price: float, day: str) -> int:
+    obs = {"item": "Milk", "price": price, "currency": "EUR", "store_id": 1, "date": day}
+    with transaction(con):  # one row per transaction, as add_price.py writes them
+        return add_prices(con, [parse_observation(obs)])[0]
+
+def test_streamed_flags_equal_a_backfill(con, csv_path):
+    import_incremental(con, csv_path, chunksize=400, verbose=False)  # one update per chunk
+    typical = con.execute("""SELECT exp(a.mean) FROM anomaly_state a JOIN store s ON s.city = a.city
+                             WHERE s.id = 1 AND a.item_id = (SELECT id FROM item WHERE name = 'Milk')""").fetchone()[0]
+    x100 = add(con, typical * 100, "2024-12-30")  # a misplaced decimal point either way
+    div100 = add(con, typical / 100, "2024-12-31")
+    ok = add(con, typical * 1.02, "2024-12-31")
+    flagged = {r[0]: r[-1] for r in rows(con, FLAGS)}
+    assert flagged[x100] > anomaly.Z_MAX and flagged[div100] < -anomaly.Z_MAX and ok not in flagged
+    streamed = rows(con, FLAGS), rows(con, STATE)
+
+    with transaction(con):
+        anomaly.backfill(con)
+    assert (rows(con, FLAGS), rows(con, STATE)) == streamed
+    assert [r["price_id"] for r in anomaly.recent(con, 2, "milk")] == [div100, x100]
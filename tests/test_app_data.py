@@ -0,0 +1,37 @@
+from __future__ import annotations
+import pytest
+from conftest import rows
+from db import connect, transaction
+from import_csv import import_incremental
+
+app_data = pytest.importorskip("app_data")  # needs streamlit
+
+@pytest.fixture
+def app_con(con, tmp_path, monkeypatch):
+    """The pooled connection app_data uses, pointed at the test database."""
+    monkeypatch.setattr("db.DB_PATH", tmp_path / "prices.db")
+    return connect()
+
+def price_total(version) -> int:
+    return app_data.table_count.__wrapped__(version, "price")
+
+def test_price_count_ignores_skipped_duplicates(app_con, csv_path):
+    import_incremental(app_con, csv_path, chunksize=1000, verbose=False)
+    app_con.execute("DELETE FROM import_checkpoint")
+    app_con.commit()
+    import_incremental(app_con, csv_path, chunksize=1000, verbose=False)  # every row a duplicate: ids are burnt
+    n = rows(app_con, "SELECT COUNT(*) FROM price")[0][0]
+    assert rows(app_con, "SELECT MAX(id) FROM price")[0][0] > n
+    assert price_total(None) == n
+
+def test_data_version_moves_on_updates_and_deletes(app_con, csv_path):
+    import_incremental(app_con, csv_path, chunksize=1000, verbose=False)
+    before = app_data.data_version()
+    with transaction(app_con):
+        app_con.execute("UPDATE price SET price = price + 1 WHERE id = 5")
+    edited = app_data.data_version()
+    assert edited != before
+    with transaction(app_con):
+        app_con.execute("DELETE FROM price WHERE id = 6")
+    assert app_data.data_version() != edited
+    assert price_total(app_data.data_version()) == rows(app_con, "SELECT COUNT(*) FROM price")[0][0]
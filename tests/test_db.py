@@ -0,0 +1,63 @@
+from __future__ import annotations
+import sqlite3
+import threading
+import pytest
+import db
+from conftest import rows
+from db import connect, item_key, migrate, normalize_item_keys, open_connection, transaction
+
+def test_connect_reuses_one_connection_per_thread(con, tmp_path):
+    path = tmp_path / "prices.db"
+    assert connect(path) is connect(path)
+    other = []
+    t = threading.Thread(target=lambda: other.append(connect(path)))
+    t.start()
+    t.join()
+    assert other[0] is not connect(path)
+
+def test_transaction_nests_and_rolls_back(con):
+    with transaction(con):
+        con.execute("INSERT INTO item(name, name_key, category, unit) VALUES ('Milk', 'milk', 'general', 'liter')")
+        with transaction(con), con:  # an inner block (or `with con:`) joins the outer one instead of committing
+            con.execute("INSERT INTO item(name, name_key, category, unit) VALUES ('Tea', 'tea', 'general', 'pack')")
+    assert con.execute("SELECT COUNT(*) FROM item").fetchone()[0] == 2
+
+    with pytest.raises(sqlite3.IntegrityError):
+        with transaction(con):
+            con.execute("INSERT INTO item(name, name_key, category, unit) VALUES ('Rice', 'rice', 'general', 'kg')")
+            con.execute("INSERT INTO item(name, name_key, category, unit) VALUES ('Milk', 'milk', 'general', 'l')")
+    assert con.execute("SELECT COUNT(*) FROM item").fetchone()[0] == 2
+
+def test_connect_stops_on_an_old_schema(tmp_path):
+    path = tmp_path / "old.db"
+    open_connection(path).close()
+    with pytest.raises(SystemExit, match="init_db.py"):
+        connect(path)
+    fresh = connect(path, check_schema=False)
+    migrate(fresh)
+    assert connect(tmp_path / "old.db") is fresh
+
+def test_item_keys_fold_case_width_and_spaces():
+    assert item_key("  MILK ") == item_key("milk") == item_key("ｍｉｌｋ") == "milk"
+    assert item_key("Whole \t Milk") == "whole milk"
+
+def test_normalize_item_keys_merges_duplicate_spellings(con):
+    con.executemany("INSERT INTO item(name, category, unit) VALUES (?, 'general', 'liter')", [("Milk",), (" milk",)])
+    con.executemany("INSERT INTO price(item_id, price, currency, quantity, date) VALUES (?, 1.0, 'EUR', 1, ?)",
+                    [(1, "2025-01-01"), (2, "2025-01-02")])
+    assert normalize_item_keys(con) == 1
+    assert rows(con, "SELECT id, name_key FROM item") == [(1, "milk")]
+    assert rows(con, "SELECT DISTINCT item_id FROM price") == [(1,)]
+
+def test_query_stats_group_statement_shapes_and_log_slow_plans(con, monkeypatch):
+    stats = db.QueryStats(slow_ms=0.0)  # every statement counts as slow
+    monkeypatch.setattr(db, "STATS", stats)
+    stats.enabled = True
+    for name in ("Milk", "Bread"):
+        db.qi(con, f"INSERT INTO item(name, name_key) VALUES ('{name}', '{item_key(name)}')")
+    assert len(db.q(con, "SELECT * FROM item WHERE id IN (1, 2)")) == 2
+    snap = stats.snapshot()
+    by_sql = {s["sql"]: s for s in snap["statements"]}
+    assert by_sql["INSERT INTO item(name, name_key) VALUES (?...)"]["calls"] == 2
+    assert by_sql["SELECT * FROM item WHERE id IN (?...)"]["rows"] == 2
+    assert any("item" in line for s in snap["slow"] if s["sql"].startswith("SELECT") for line in s["plan"])
@@ -0,0 +1,44 @@
+from __future__ import annotations
+import numpy as np
+import pandas as pd
+import pytest
+from downsample import downsample, lttb_mask, minmax_mask
+
+@pytest.fixture
+def frame():
+    """Ten years of daily prices in five cities, 30% of days missing, one entry error per city."""
+    rng = np.random.default_rng(1)
+    values = np.exp(np.cumsum(rng.normal(0, 0.01, (3650, 5)), axis=0))
+    values[rng.random(values.shape) < 0.3] = np.nan
+    values[[100, 900, 2000, 3000, 3500], np.arange(5)] = 50.0
+    return pd.DataFrame(values, index=pd.date_range("2015-01-01", periods=3650, freq="D"),
+                        columns=["Berlin", "Lisbon", "Oslo", "Paris", "Rome"])
+
+@pytest.mark.parametrize("method", ["lttb", "minmax"])
+def test_budget_ends_and_spikes_are_kept(frame, method):
+    out = downsample(frame, 200, method)
+    assert list(out.columns) == list(frame.columns) and out.index.is_monotonic_increasing
+    for city in frame:
+        kept, full = out[city].dropna(), frame[city].dropna()
+        assert len(kept) <= 202
+        assert kept.index[0] == full.index[0] and kept.index[-1] == full.index[-1]
+        assert kept.max() == 50.0  # the spike survives
+        assert (kept == full.loc[kept.index]).all()  # kept points are real observations, unchanged
+
+def test_minmax_keeps_every_bucket_extreme():
+    y = np.array([[1.0, 5.0, 2.0, 0.5, 3.0, 4.0, np.nan, 2.5]]).T
+    keep = minmax_mask(y, 4)  # two buckets of four rows
+    assert np.flatnonzero(keep[:, 0]).tolist() == [0, 1, 3, 5, 7]  # min and max of each, plus both ends
+
+def test_lttb_skips_missing_points_and_empty_series():
+    x = np.arange(6, dtype=float)
+    y = np.array([[0, 0, 9, 0, 0, 0], [np.nan] * 6, [1, np.nan, np.nan, np.nan, np.nan, 2]], dtype=float).T
+    keep = lttb_mask(x, y, 3)
+    assert np.flatnonzero(keep[:, 0]).tolist() == [0, 2, 5]  # the one bucket keeps the peak
+    assert not keep[:, 1].any()
+    assert np.flatnonzero(keep[:, 2]).tolist() == [0, 5]
+
+def test_small_frames_come_back_unchanged(frame):
+    small = frame.iloc[:100]
+    assert downsample(small, 200) is small
+    assert downsample(frame.iloc[:0], 10).empty
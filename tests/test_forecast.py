@@ -0,0 +1,60 @@
+from __future__ import annotations
+import math
+from datetime import date, timedelta
+import numpy as np
+from db import open_connection
+from forecast import _years, fit, fit_batch, forecast
+from import_csv import import_bulk
+
+START = date(2022, 1, 3)  # a Monday
+
+def price(day: date, city_factor: float) -> float:
+    """5% a year of inflation and a +-10% yearly cycle."""
+    t = _years([day.isoformat()])[0]
+    return city_factor * math.exp(0.05 * t + 0.1 * math.sin(2 * math.pi * t))
+
+def write_prices(path, weeks: int) -> None:
+    lines = ["item,unit,store,city,price,currency,quantity,date"]
+    for k in range(weeks):
+        day = START + timedelta(weeks=k)
+        for store, city, factor in (("A", "Oslo", 1.0), ("B", "Rome", 0.8)):
+            lines.append(f"Milk,liter,{store},{city},{price(day, factor):.4f},EUR,1,{day}")
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+def test_fit_batch_recovers_trend_and_season():
+    t = _years(np.datetime64("2020-01-06") + np.arange(0, 3 * 364, 7).astype("timedelta64[D]"))
+    y = np.stack([0.03 * t + 0.2 * np.sin(2 * np.pi * t), 0.5 - 0.01 * t])
+    m = fit_batch(t, y, np.ones_like(y))
+    assert np.allclose(m["coef"][:, 1], [0.03, -0.01], atol=1e-3)  # trend
+    assert abs(m["coef"][0, 2] - 0.2) < 0.01 and abs(m["coef"][1, 2]) < 0.01  # first sine term
+    assert (m["sigma"] < 0.01).all()  # only the ridge on the seasonal terms leaves a residual
+
+def test_forecast_follows_the_series_and_caches_fits(con, tmp_path):
+    path = tmp_path / "weekly.csv"
+    write_prices(path, 104)
+    import_bulk(con, path, verbose=False)
+
+    df = forecast(con, "milk", "week", horizon=4)
+    assert sorted(set(df["city"])) == ["Oslo", "Rome"] and len(df) == 8
+    for city, factor in (("Oslo", 1.0), ("Rome", 0.8)):
+        got = df[df["city"] == city]
+        expected = [price(d.date(), factor) for d in got["period"]]
+        assert np.allclose(got["yhat"], expected, rtol=0.02)
+        assert (got["lo"] < got["yhat"]).all() and (got["yhat"] < got["hi"]).all()
+
+    writer = open_connection(tmp_path / "prices.db")
+    writer.execute("BEGIN IMMEDIATE")  # another writer holds the lock: a read must not need it
+    con.execute("PRAGMA busy_timeout = 0")
+    changes = con.total_changes
+    assert forecast(con, "milk", "week", horizon=4).equals(df)
+    assert con.total_changes == changes  # unchanged series: nothing refitted or written
+    writer.rollback()
+    writer.close()
+    assert fit(con, "week") == {"fitted": 0, "unchanged": 2, "too_short": 0}
+
+    more = tmp_path / "more.csv"
+    more.write_text("item,unit,store,city,price,currency,quantity,date\n"
+                    f"Milk,liter,A,Oslo,{price(date(2024, 1, 8), 1.0):.4f},EUR,1,2024-01-08\n", encoding="utf-8")
+    import_bulk(con, more, verbose=False)
+    assert fit(con, "week") == {"fitted": 1, "unchanged": 1, "too_short": 0}
+    assert forecast(con, "Coffee", "week").empty
@@ -0,0 +1,77 @@
+from __future__ import annotations
+import numpy as np
+import pytest
+import fx
+import partitions
+from conftest import rows
+from db import transaction
+from import_csv import import_incremental
+from latest_price import basket_by_city
+from rollup import trend_rows
+
+RATES = "date,currency,rate\n2025-01-01,USD,1.10\n2025-02-01,USD,1.20\n2025-01-01,SEK,11.5\n"
+PRICES = ("item,unit,store,city,price,currency,quantity,date\n"
+          "Milk,liter,A,Oslo,1.00,EUR,1,2025-01-10\n"
+          "Milk,liter,B,Oslo,2.40,usd,2,2025-02-10\n"      # 1.20 USD per liter = 1.00 EUR
+          "Milk,liter,C,Oslo,9.99,NOK,1,2025-02-11\n"      # no NOK rates
+          "Bread,loaf,A,Oslo,2.20,USD,1,2024-12-01\n")     # before the first rate: the earliest one applies
+
+@pytest.fixture
+def rates(con, tmp_path):
+    path = tmp_path / "rates.csv"
+    path.write_text(RATES, encoding="utf-8")
+    with transaction(con):
+        assert fx.load_rates(con, path) == 3
+    return path
+
+@pytest.fixture
+def prices(tmp_path):
+    path = tmp_path / "prices.csv"
+    path.write_text(PRICES, encoding="utf-8")
+    return path
+
+def test_rates_use_the_latest_rate_on_or_before_the_day(con, rates):
+    assert fx.rate(con, "usd ", "2025-01-31") == 1.10
+    assert fx.rate(con, "USD", "2025-03-01T10:00") == 1.20
+    assert fx.rate(con, "USD", "2020-01-01") == 1.10
+    assert fx.rate(con, "EUR", "2025-01-01") == 1.0
+    assert fx.rate(con, "NOK", "2025-01-01") is None
+    base = fx.to_base_array(con, [11.0, 12.0, 5.0], ["USD", "usd", "NOK"], ["2025-01-05", "2025-02-05", "2025-01-05"])
+    assert base[:2].tolist() == pytest.approx([10.0, 10.0]) and np.isnan(base[2])
+    assert fx.from_base(con, np.array([1.0, 1.0]), "USD", ["2025-01-15", "2025-02-15"]).tolist() == \
+        pytest.approx([1.10, 1.20])
+    assert fx.currencies(con) == ["EUR", "SEK", "USD"]
+
+def test_reloaded_rates_move_the_version(con, rates, tmp_path):
+    before = fx.rates_version(con)
+    path = tmp_path / "more.csv"
+    path.write_text("date,currency,rate\n2025-03-01,USD,1.30\n", encoding="utf-8")
+    with transaction(con):
+        fx.load_rates(con, path)
+    assert fx.rates_version(con) != before
+    assert fx.rate(con, "USD", "2025-03-02") == 1.30
+
+def test_prices_without_a_rate_stay_out_of_aggregates(con, rates, prices):
+    import_incremental(con, prices, verbose=False)
+    _, trend = trend_rows(con, "Milk", grain="month")
+    assert [(r["period"], r["n"], r["mean"]) for r in trend] == [("2025-01-01", 1, 1.0), ("2025-02-01", 1, 1.0)]
+    assert [tuple(r) for r in basket_by_city(con, ["Milk"])] == [("Oslo", 1.0)]  # not the NOK price
+    assert [tuple(r) for r in fx.unconverted(con)] == [("NOK", 1)]
+
+def test_backfill_reaches_archived_rows(con, prices, tmp_path):
+    with prices.open("a", encoding="utf-8") as f:
+        f.write("Bread,loaf,A,Oslo,2.40,USD,1,2025-02-02\n")  # so the 2024 price is not the latest one
+    import_incremental(con, prices, verbose=False)  # no rates yet: only EUR is converted
+    partitions.archive(con, "2025-01-01")
+    assert rows(con, "SELECT name FROM price_partition") == [("2024",)]
+
+    path = tmp_path / "rates.csv"
+    path.write_text(RATES, encoding="utf-8")
+    with transaction(con):
+        fx.load_rates(con, path)
+    fx.backfill(con)
+    source = partitions.price_source(con, "2024-01-01", "2024-12-31")
+    assert rows(con, f"SELECT price_base FROM {source} WHERE date < '2025-01-01'") == [(2.0,)]
+    _, trend = trend_rows(con, "Bread", grain="month")
+    assert [(r["period"], r["mean"]) for r in trend] == [("2024-12-01", 2.0), ("2025-02-01", 2.0)]
+    partitions.detach_all(con)
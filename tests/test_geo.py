@@ -0,0 +1,46 @@
+from __future__ import annotations
+import pytest
+from conftest import rows
+from db import transaction
+from geo import basket_nearby, haversine_km, nearest, within
+from import_csv import import_bulk
+
+HELSINKI = (60.1699, 24.9384)
+
+@pytest.fixture
+def stores(con, tmp_path):
+    """Four stores: two in Helsinki, one in Espoo (~7 km), one without coordinates."""
+    path = tmp_path / "geo.csv"
+    path.write_text("item,unit,store,city,price,currency,quantity,date\n"
+                    "Milk,liter,Centre,Helsinki,1.40,EUR,1,2025-01-01\n"
+                    "Bread,loaf,Centre,Helsinki,2.60,EUR,1,2025-01-01\n"
+                    "Milk,liter,Kallio,Helsinki,1.20,EUR,1,2025-01-01\n"
+                    "Bread,loaf,Kallio,Helsinki,2.50,EUR,1,2025-01-01\n"
+                    "Milk,liter,Tapiola,Espoo,1.00,EUR,1,2025-01-01\n"
+                    "Bread,loaf,Tapiola,Espoo,2.00,EUR,1,2025-01-01\n"
+                    "Milk,liter,Unknown,Helsinki,0.50,EUR,1,2025-01-01\n"
+                    "Bread,loaf,Unknown,Helsinki,0.50,EUR,1,2025-01-01\n", encoding="utf-8")
+    import_bulk(con, path, verbose=False)
+    with transaction(con):
+        con.executemany("UPDATE store SET latitude = ?, longitude = ? WHERE name = ?",
+                        [(60.1699, 24.9384, "Centre"), (60.1841, 24.9497, "Kallio"), (60.1756, 24.8050, "Tapiola")])
+    return con
+
+def test_haversine_is_null_safe():
+    assert haversine_km(*HELSINKI, *HELSINKI) == 0
+    assert 7.3 < haversine_km(*HELSINKI, 60.1756, 24.8050) < 7.5
+    assert haversine_km(*HELSINKI, None, 24.8) is None
+
+def test_within_and_nearest_skip_stores_without_coordinates(stores):
+    assert [r["name"] for r in within(stores, *HELSINKI, 5)] == ["Centre", "Kallio"]
+    assert [r["name"] for r in within(stores, *HELSINKI, 50)] == ["Centre", "Kallio", "Tapiola"]
+    assert [r["name"] for r in nearest(stores, *HELSINKI, k=10)] == ["Centre", "Kallio", "Tapiola"]
+    assert [r["name"] for r in nearest(stores, 60.1756, 24.8050, k=1)] == ["Tapiola"]
+
+def test_basket_nearby_ranks_by_total_within_the_radius(stores):
+    near = basket_nearby(stores, *HELSINKI, 5, ["Milk", "bread"])
+    assert [(r["store"], r["total"]) for r in near] == [("Kallio", 3.7), ("Centre", 4.0)]
+    wide = basket_nearby(stores, *HELSINKI, 50, ["Milk", "Bread", "Milk"])
+    assert [r["store"] for r in wide] == ["Tapiola", "Kallio", "Centre"]
+    assert basket_nearby(stores, *HELSINKI, 50, ["Milk", "Coffee"]) == []
+    assert rows(stores, "SELECT COUNT(*) FROM store WHERE latitude IS NULL") == [(1,)]
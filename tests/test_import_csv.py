@@ -0,0 +1,59 @@
+from __future__ import annotations
+import pandas as pd
+from conftest import ROWS, rows
+from db import migrate, open_connection
+from import_csv import import_bulk, import_incremental, import_rows, normalize
+
+PRICES = "SELECT i.name, s.name, s.city, p.price, p.currency, p.quantity, p.date FROM price p " \
+         "JOIN item i ON i.id = p.item_id LEFT JOIN store s ON s.id = p.store_id ORDER BY p.id"
+
+def test_bulk_import_matches_per_row_import(con, csv_path, tmp_path):
+    assert import_bulk(con, csv_path, chunksize=700, verbose=False) == ROWS
+
+    per_row = open_connection(tmp_path / "per_row.db")
+    migrate(per_row)
+    assert import_rows(per_row, normalize(pd.read_csv(csv_path))) == ROWS
+    assert rows(con, PRICES) == rows(per_row, PRICES)
+    assert rows(con, "SELECT name_key FROM item ORDER BY id") == rows(per_row, "SELECT name_key FROM item ORDER BY id")
+    per_row.close()
+
+def test_bulk_import_limit_and_missing_prices(con, tmp_path):
+    path = tmp_path / "few.csv"
+    path.write_text("item,unit,store,city,price,currency,quantity,date\n"
+                    "Milk,liter,Shop,Oslo,1.20,EUR,1,2025-01-02\n"
+                    " milk ,liter,,,,EUR,1,2025-01-03\n"           # no price: item resolved, row skipped
+                    "Bread,loaf,Shop,Oslo,2.00,EUR,0,2025-01-03\n"  # quantity 0 counts as 1
+                    "Eggs,dozen,Shop,Oslo,3.00,EUR,1,2025-01-04\n", encoding="utf-8")
+    assert import_bulk(con, path, chunksize=2, limit=3, verbose=False) == 2
+    assert rows(con, "SELECT name FROM item ORDER BY id") == [("Milk",), ("Bread",)]
+    assert rows(con, "SELECT quantity FROM price ORDER BY id") == [(1.0,), (1.0,)]
+    assert rows(con, "SELECT COUNT(*) FROM store") == [(1,)]
+
+def test_incremental_import_resumes_and_dedups(con, csv_path, tmp_path):
+    lines = csv_path.read_bytes().splitlines(keepends=True)
+    full = b"".join(lines)
+    csv_path.write_bytes(b"".join(lines[:1 + ROWS // 2]))  # the first half, as if the file was still growing
+
+    assert import_incremental(con, csv_path, chunksize=500, verbose=False)[0] == ROWS // 2
+    csv_path.write_bytes(full)
+    read, _ = import_incremental(con, csv_path, chunksize=500, verbose=False)
+    assert read == ROWS - ROWS // 2  # only the lines past the checkpoint
+    assert import_incremental(con, csv_path, chunksize=500, verbose=False) == (0, 0)
+
+    once = open_connection(tmp_path / "once.db")
+    migrate(once)
+    import_incremental(once, csv_path, chunksize=500, verbose=False)
+    assert rows(con, PRICES) == rows(once, PRICES)
+    once.close()
+
+    con.execute("DELETE FROM import_checkpoint")  # forget the checkpoint: every row is read again
+    con.commit()
+    assert import_incremental(con, csv_path, chunksize=500, verbose=False) == (ROWS, 0)
+
+def test_incremental_import_rescans_a_rewritten_file(con, csv_path):
+    import_incremental(con, csv_path, chunksize=1000, verbose=False)
+    n = rows(con, "SELECT COUNT(*) FROM price")[0][0]
+    header, *body = csv_path.read_bytes().splitlines(keepends=True)
+    csv_path.write_bytes(header + b"".join(reversed(body)))  # same rows, new byte layout: the checkpoint is stale
+    assert import_incremental(con, csv_path, chunksize=1000, verbose=False) == (ROWS, 0)
+    assert rows(con, "SELECT COUNT(*) FROM price")[0][0] == n
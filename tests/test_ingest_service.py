@@ -0,0 +1,65 @@
+from __future__ import annotations
+import json
+import threading
+from http.client import HTTPConnection
+import pytest
+from conftest import rows
+from db import open_connection
+from ingest_service import GroupCommitWriter, Submission, serve
+
+OBS = {"item": "Milk", "price": 1.29, "currency": "EUR", "store": "Market 1", "city": "Helsinki", "date": "2024-05-01"}
+
+def row(**changes) -> tuple:
+    from add_price import parse_observation
+    return parse_observation({**OBS, **changes})
+
+def test_bad_submission_in_a_group_fails_alone(tmp_path):
+    db = tmp_path / "prices.db"
+    writer = GroupCommitWriter(db, flush_ms=50)
+    subs = [Submission([row()]), Submission([row(store_id=999)]), Submission([row(item="Bread"), row(price=1.35)])]
+    for sub in subs:  # queued before the writer starts, so they land in one group
+        writer.queue.put(sub)
+    writer.start()
+    for sub in subs:
+        assert sub.done.wait(10)
+    writer.stop()
+    assert subs[1].error and subs[1].ids is None
+    assert [len(sub.ids) for sub in (subs[0], subs[2])] == [1, 2] and not subs[0].error and not subs[2].error
+    assert writer.stats["errors"] == 1
+    assert writer.stats["commits"] == 2  # the group failed, then the good submissions were retried one by one
+    con = open_connection(db)
+    ids = subs[0].ids + subs[2].ids
+    assert rows(con, f"SELECT id, price FROM price WHERE id IN ({', '.join('?' * len(ids))}) ORDER BY id", ids) == \
+        [(ids[0], 1.29), (ids[1], 1.29), (ids[2], 1.35)]
+    assert con.execute("SELECT COUNT(*) FROM price").fetchone()[0] == 3
+    con.close()
+
+@pytest.fixture
+def service(tmp_path):
+    server = serve(tmp_path / "prices.db", port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    server.writer.stop()
+
+def post(server, body: bytes) -> tuple[int, dict]:
+    http = HTTPConnection(*server.server_address, timeout=10)
+    http.request("POST", "/prices", body, {"Content-Type": "application/json"})
+    resp = http.getresponse()
+    result = resp.status, json.loads(resp.read())
+    http.close()
+    return result
+
+@pytest.mark.parametrize("body", [b"{not json", b'"Milk"', b"[1, 2]", json.dumps({**OBS, "store_id": [1]}).encode(),
+                                  json.dumps({**OBS, "price": "cheap"}).encode()])
+def test_malformed_submissions_are_400(service, body):
+    status, reply = post(service, body)
+    assert status == 400 and reply["error"]
+
+def test_submission_is_acknowledged_with_ids(service):
+    status, reply = post(service, json.dumps([OBS, {**OBS, "price": 1.31}]).encode())
+    assert status == 200 and len(reply["ids"]) == 2
+    status, reply = post(service, json.dumps({**OBS, "store_id": 999}).encode())
+    assert status == 422
@@ -0,0 +1,37 @@
+from __future__ import annotations
+from conftest import rows
+from import_csv import import_bulk
+from latest_price import basket_by_city, rebuild
+from db import transaction
+
+LATEST = "SELECT item_id, store_id, price_id, date, price, quantity, currency, unit_price FROM latest_price " \
+         "ORDER BY item_id, store_id"
+
+def rebuilt(con) -> list[tuple]:
+    """latest_price as rebuild() computes it, leaving the trigger-maintained table in place."""
+    con.execute("SAVEPOINT check_latest")
+    rebuild(con)
+    expected = rows(con, LATEST)
+    con.execute("ROLLBACK TO check_latest")
+    con.execute("RELEASE check_latest")
+    return expected
+
+def test_triggers_match_a_rebuild(con, csv_path):
+    import_bulk(con, csv_path, chunksize=1000, verbose=False)
+    assert rows(con, LATEST) == rebuilt(con)
+
+    with transaction(con):
+        con.execute("DELETE FROM price WHERE id IN (SELECT price_id FROM latest_price WHERE store_id % 2 = 0)")
+        con.execute("UPDATE price SET price = price * 2, date = '2030-01-01' WHERE id % 97 = 0")
+        con.execute("UPDATE price SET store_id = 1 WHERE id % 89 = 0")
+    assert rows(con, LATEST) == rebuilt(con)
+
+def test_basket_sums_the_latest_price_per_city(con, tmp_path):
+    path = tmp_path / "basket.csv"
+    path.write_text("item,unit,store,city,price,currency,quantity,date\n"
+                    "Milk,liter,A,Oslo,1.00,EUR,1,2025-01-01\n"
+                    "Milk,liter,A,Oslo,1.50,EUR,1,2025-02-01\n"
+                    "Bread,loaf,B,Oslo,4.00,EUR,2,2025-01-15\n"
+                    "Milk,liter,C,Rome,0.90,EUR,1,2025-01-20\n", encoding="utf-8")
+    import_bulk(con, path, verbose=False)
+    assert [tuple(r) for r in basket_by_city(con, ["milk", "BREAD"])] == [("Oslo", 3.5), ("Rome", 0.9)]
@@ -0,0 +1,56 @@
+from __future__ import annotations
+import pytest
+import anomaly
+import list_data
+import partitions
+import rollup
+from conftest import rows
+from db import transaction
+from import_csv import import_incremental
+
+ROLLUPS = "SELECT * FROM price_rollup ORDER BY item_id, grain, period, city"
+ANOMALIES = "SELECT * FROM anomaly ORDER BY price_id"
+PRICES = "SELECT id, item_id, store_id, price, currency, quantity, date FROM {price} ORDER BY id"
+
+@pytest.fixture
+def archived(con, csv_path, monkeypatch):
+    """The CSV imported and then archived by quarter, with room to attach only three files at once."""
+    monkeypatch.setattr(partitions, "_attach_limit", lambda con: 3)
+    import_incremental(con, csv_path, chunksize=1000, verbose=False)
+    before = {"prices": rows(con, PRICES.format(price="price")), "rollups": rows(con, ROLLUPS),
+              "anomalies": rows(con, ANOMALIES)}
+    moved = partitions.archive(con, "2025-01-01", by="quarter")
+    assert len(moved) == 8 and sum(n for _, n in moved) > 0
+    yield before
+    partitions.detach_all(con)
+
+def test_archived_rows_stay_visible(con, archived):
+    assert rows(con, "SELECT COUNT(*) FROM price")[0][0] < len(archived["prices"])
+    source = partitions.price_source(con, "2024-01-01", "2024-03-31")  # two files: main and 2024q1
+    dated = [r for r in archived["prices"] if "2024-01-01" <= r[6] <= "2024-03-31"]
+    assert rows(con, f"""SELECT id, item_id, store_id, price, currency, quantity, date FROM {source}
+                         WHERE date BETWEEN '2024-01-01' AND '2024-03-31' ORDER BY id""") == dated
+    with pytest.raises(SystemExit, match="Narrow the date range"):
+        partitions.price_source(con)  # eight archives in one view: more than can be attached
+
+def test_full_history_passes_read_every_batch(con, archived):
+    assert partitions.max_id(con, archives=True) == archived["prices"][-1][0]
+    with transaction(con):
+        rollup.rebuild(con)
+    assert rows(con, ROLLUPS) == archived["rollups"]
+    assert rows(con, ANOMALIES) == archived["anomalies"]
+    with transaction(con):
+        anomaly.backfill(con)
+    assert rows(con, ANOMALIES) == archived["anomalies"]
+
+def test_listing_walks_every_archive(con, archived):
+    listed = list(list_data.rows(con, "prices", limit=0))
+    assert sorted(r["id"] for r in listed) == [r[0] for r in archived["prices"]]
+    assert [(r["date"], r["id"]) for r in listed] == sorted(((r["date"], r["id"]) for r in listed), reverse=True)
+    page = list(list_data.rows(con, "prices", after=[listed[99]["date"], listed[99]["id"]], limit=50))
+    assert [r["id"] for r in page] == [r["id"] for r in listed[100:150]]
+
+def test_snapshot_exports_every_archive(con, archived, tmp_path):
+    pytest.importorskip("pyarrow")  # snapshot.py exits without it
+    import snapshot
+    assert snapshot.export(con, tmp_path / "snap") == len(archived["prices"])
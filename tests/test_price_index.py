@@ -0,0 +1,66 @@
+from __future__ import annotations
+import math
+import pytest
+from conftest import rows
+from db import open_connection, transaction
+from import_csv import import_bulk
+from price_index import define, index_frame, parse_weights, update
+
+INDEX = "SELECT city, period, link, level, coverage, items FROM price_index WHERE basket = 'b' ORDER BY city, period"
+
+def write_prices(path, lines: list[str]) -> None:
+    path.write_text("item,unit,store,city,price,currency,quantity,date\n" + "\n".join(lines) + "\n", encoding="utf-8")
+
+@pytest.fixture
+def basket(con, tmp_path):
+    """Milk up 10% a month in Oslo, Bread flat; Rome has no Bread in February."""
+    lines = []
+    for k, month in enumerate(["01", "02", "03", "04"]):
+        lines += [f"Milk,liter,A,Oslo,{1.1 ** k:.4f},EUR,1,2024-{month}-10",
+                  f"Bread,loaf,A,Oslo,2.00,EUR,1,2024-{month}-10",
+                  f"Milk,liter,B,Rome,1.00,EUR,1,2024-{month}-10"]
+        if month != "02":
+            lines.append(f"Bread,loaf,B,Rome,{2.0 * 1.2 ** k:.4f},EUR,1,2024-{month}-10")
+    write_prices(tmp_path / "index.csv", lines)
+    import_bulk(con, tmp_path / "index.csv", verbose=False)
+    with transaction(con):
+        define(con, "b", parse_weights(["Milk=3", "Bread"]))
+    return con
+
+def test_parse_weights():
+    assert parse_weights(["Milk=2", "Bread", "Eggs=0.5"]) == {"Milk": 2.0, "Bread": 1.0, "Eggs": 0.5}
+
+def test_links_chain_over_missing_items(basket):
+    pivot = index_frame(basket, "b")
+    assert list(pivot.columns) == ["Oslo", "Rome"] and len(pivot) == 4
+    milk = math.exp(3 * math.log(1.1) / 4)  # weighted geometric mean of 1.1 (weight 3) and 1.0 (weight 1)
+    assert [round(v, 4) for v in pivot["Oslo"]] == [round(100 * milk ** k, 4) for k in range(4)]
+    # Rome: February and March link on Milk only (flat); April's link takes Bread's 1.2 again
+    assert [round(v, 4) for v in pivot["Rome"]] == [100.0, 100.0, 100.0, round(100 * 1.2 ** 0.25, 4)]
+    coverage = rows(basket, "SELECT coverage FROM price_index WHERE basket = 'b' AND city = 'Rome' ORDER BY period")
+    assert coverage == [(0.0,), (0.75,), (0.75,), (1.0,)]
+    assert index_frame(basket, "b", min_coverage=0.9)["Rome"].isna().tolist() == [False, True, True, False]
+
+def test_late_prices_recompute_from_their_period(basket, tmp_path):
+    index_frame(basket, "b")
+    write_prices(tmp_path / "late.csv", ["Bread,loaf,B,Rome,2.4000,EUR,1,2024-02-20"])
+    import_bulk(basket, tmp_path / "late.csv", verbose=False)
+    with transaction(basket):
+        assert update(basket, "b") == 3  # Rome from February on; Oslo untouched
+        assert update(basket, "b") == 0
+    incremental = rows(basket, INDEX)
+    with transaction(basket):
+        basket.execute("DELETE FROM price_index")
+        update(basket, "b")
+    assert rows(basket, INDEX) == incremental
+
+def test_reading_an_up_to_date_index_takes_no_write_lock(basket, tmp_path):
+    before = index_frame(basket, "b")
+    writer = open_connection(tmp_path / "prices.db")
+    writer.execute("BEGIN IMMEDIATE")
+    basket.execute("PRAGMA busy_timeout = 0")
+    assert index_frame(basket, "b").equals(before)
+    writer.rollback()
+    writer.close()
+    with pytest.raises(ValueError, match="No basket"):
+        index_frame(basket, "nope")
@@ -0,0 +1,57 @@
+from __future__ import annotations
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+import pytest
+
+SRC = Path(__file__).resolve().parents[1] / "src"
+
+# Runs price_tracker.py's main, then prints which heavy modules it loaded.
+RUN = f"""import runpy, sys
+sys.path.insert(0, {str(SRC)!r})
+sys.argv = ["price_tracker.py", *sys.argv[1:]]
+runpy.run_path({str(SRC / "price_tracker.py")!r}, run_name="__main__")
+print("heavy:", [m for m in ("numpy", "pandas", "matplotlib") if m in sys.modules])
+"""
+
+@pytest.fixture
+def cli(tmp_path):
+    env = dict(os.environ, PRICE_TRACKER_DB=str(tmp_path / "prices.db"))
+    env.pop("PRICE_TRACKER_INGEST_URL", None)
+
+    def run(*args: str, stdin: str | None = None, ok: bool = True) -> subprocess.CompletedProcess:
+        proc = subprocess.run([sys.executable, "-c", RUN, *args], input=stdin, env=env,
+                              capture_output=True, text=True, encoding="utf-8")
+        assert (proc.returncode == 0) == ok, proc.stderr
+        return proc
+    run("init")
+    return run
+
+def output(proc: subprocess.CompletedProcess) -> list[str]:
+    return [line for line in proc.stdout.splitlines() if not line.startswith("heavy:")]
+
+def test_batch_from_stdin_is_all_or_nothing(cli):
+    ndjson = "\n".join(json.dumps({"item": "Milk", "price": p, "currency": "EUR", "store": "A", "city": "Oslo",
+                                   "date": f"2025-01-0{d}"}) for d, p in ((1, 1.2), (2, 1.25), (3, 1.3)))
+    assert "3 prices logged (ids 1..3)" in cli("add-price", "--stdin", stdin=ndjson).stdout
+    bad = "item,price,currency\nBread,2.10,EUR\nBread,cheap,EUR\n"
+    assert "Nothing written: line 3" in cli("add-price", "--stdin", stdin=bad, ok=False).stderr
+    out = output(cli("list", "prices", "--format", "ndjson", "--limit", "0"))
+    assert [json.loads(line)["price"] for line in out] == [1.3, 1.25, 1.2]  # newest first, no Bread
+
+def test_list_pages_with_a_cursor(cli):
+    for name in ("Apples", "Bread", "Coffee"):
+        cli("add-item", "--name", name)
+    page = cli("list", "items", "--format", "ndjson", "--limit", "2")
+    first = output(page)
+    after = page.stderr.split("--after ")[1].strip().strip("'")  # printed after a full page
+    assert len(first) == 2 and json.loads(after) == ["Bread", 2]
+    rest = output(cli("list", "items", "--format", "ndjson", "--limit", "2", "--after", after))
+    assert [json.loads(line)["name"] for line in first + rest] == ["Apples", "Bread", "Coffee"]
+    assert "--after needs" in cli("list", "items", "--after", "[2]", ok=False).stderr
+
+@pytest.mark.parametrize("args", [["list", "items"], ["add-item", "--name", "Tea"], ["add-store", "--name", "A"]])
+def test_light_commands_do_not_load_heavy_modules(cli, args):
+    assert cli(*args).stdout.splitlines()[-1] == "heavy: []"
@@ -0,0 +1,41 @@
+from __future__ import annotations
+import statistics
+import pandas as pd
+import pytest
+import rollup
+from add_price import add_prices, parse_observation
+from conftest import rows
+from db import transaction
+from import_csv import import_bulk, import_rows, normalize
+
+ROLLUPS = "SELECT * FROM price_rollup ORDER BY item_id, grain, period, city"
+HIST = "SELECT * FROM price_rollup_hist ORDER BY item_id, grain, period, city, bucket"
+
+def test_refreshed_rollups_equal_rebuilt(con, csv_path):
+    import_bulk(con, csv_path, chunksize=700, verbose=False)  # one refresh per chunk
+    import_rows(con, normalize(pd.read_csv(csv_path, nrows=50)))
+    with transaction(con):
+        add_prices(con, [parse_observation({"item": "Milk", "price": 1.5, "store": "Corner", "city": "Oslo",
+                                            "date": "2024-06-01"})])
+    refreshed = rows(con, ROLLUPS), rows(con, HIST)
+    assert refreshed[0]
+
+    with transaction(con):
+        rollup.rebuild(con)
+    assert (rows(con, ROLLUPS), rows(con, HIST)) == refreshed
+
+def test_trend_and_median_match_the_raw_rows(con, csv_path):
+    import_bulk(con, csv_path, chunksize=1000, verbose=False)
+    raw = pd.DataFrame(rows(con, """SELECT s.city, p.date, p.price / p.quantity FROM price p
+                                    JOIN store s ON s.id = p.store_id JOIN item i ON i.id = p.item_id
+                                    WHERE i.name = 'Milk'"""),
+                       columns=["city", "period", "u"])
+    grain, trend = rollup.trend_rows(con, "Milk", grain="day")
+    assert grain == "day"
+    expected = raw.groupby(["period", "city"])["u"]
+    assert [(r["period"], r["city"], r["n"]) for r in trend] == [(*k, v) for k, v in expected.size().items()]
+    assert [r["mean"] for r in trend] == pytest.approx(expected.mean().tolist())
+
+    for r in rollup.median_rows(con, "Milk", "month")[:12]:
+        month = raw[(raw.city == r["city"]) & (raw.period.str[:7] == r["period"][:7])]["u"]
+        assert r["median"] == pytest.approx(statistics.median(month), rel=rollup.HIST_ALPHA)
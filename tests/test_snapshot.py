@@ -0,0 +1,46 @@
+from __future__ import annotations
+import pandas as pd
+import pytest
+from db import connect, transaction
+from import_csv import import_bulk
+
+pytest.importorskip("pyarrow")  # an optional dependency, like the snapshot itself
+import snapshot  # noqa: E402
+from analytics import load_prices_df  # noqa: E402
+
+def frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Rows in a fixed order with plain string columns, so both read paths compare equal."""
+    df = df.astype({c: str for c in ("item", "city", "currency") if c in df})
+    return df.sort_values(list(df.columns), ignore_index=True)
+
+@pytest.fixture
+def db(con, csv_path, tmp_path, monkeypatch):
+    monkeypatch.setattr("db.DB_PATH", tmp_path / "prices.db")
+    import_bulk(con, csv_path, verbose=False)
+    return connect()
+
+def test_snapshot_reads_what_sqlite_reads(db, tmp_path):
+    out = tmp_path / "snap"
+    n = db.execute("SELECT COUNT(*) FROM price").fetchone()[0]
+    assert snapshot.export(db, out) == n
+    assert snapshot.export(db, out) == 0  # nothing new
+
+    df, upto = snapshot.load_prices(directory=out, with_currency=True)
+    assert upto == db.execute("SELECT MAX(id) FROM price").fetchone()[0]
+    pd.testing.assert_frame_equal(frame(df), frame(load_prices_df(with_currency=True)))
+    df, _ = snapshot.load_prices(["milk"], "2024-01-01", "2024-06-30", directory=out)
+    pd.testing.assert_frame_equal(frame(df), frame(load_prices_df(["Milk"], "2024-01-01", "2024-06-30")))
+
+def test_export_appends_new_rows_and_merges_months(db, tmp_path, monkeypatch):
+    out = tmp_path / "snap"
+    snapshot.export(db, out)
+    monkeypatch.setattr(snapshot, "MAX_FILES", 1)
+    with transaction(db):
+        db.execute("""INSERT INTO price(item_id, store_id, price, currency, quantity, date, price_base)
+                      SELECT item_id, store_id, price * 1.1, currency, quantity, date, price_base * 1.1
+                      FROM price WHERE date LIKE '2024-03-%'""")
+    added = db.execute("SELECT COUNT(*) FROM price WHERE date LIKE '2024-03-%'").fetchone()[0] // 2
+    assert snapshot.export(db, out) == added
+    assert len(list((out / "month=2024-03").glob("part-*"))) == 1  # merged back into one file
+    df, _ = snapshot.load_prices(directory=out)
+    pd.testing.assert_frame_equal(frame(df), frame(load_prices_df()))